@@ -13,13 +13,27 @@
 ```bash
 export LLM_MODEL=deepseek-r1:8b
 python3 AgenticDesignPatterns/autogen/chap01.py
+CHAIN_STREAM=1 python3 AgenticDesignPatterns/autogen/chap01.py   # 流式模式，报告每个阶段的 TTFT
 ```
 """
 
 import os
+import sys
 import asyncio
-from autogen_core.models import UserMessage
-from autogen_ext.models.ollama import OllamaChatCompletionClient
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _extract_prompt(input_text: str) -> str:
+    return "Extract the technical specifications from the following text:\n\n" + input_text
+
+
+def _transform_prompt(specifications: str) -> str:
+    return (
+        "Transform the following specifications into a JSON object with 'cpu', 'memory', and 'storage' as keys:\n\n"
+        + specifications
+    )
 
 
 async def run_chain(input_text: str, model_name: str):
@@ -27,13 +41,16 @@ async def run_chain(input_text: str, model_name: str):
 
     返回：最终的 JSON 字符串（模型输出的原始文本）。
     """
-    # 创建 Ollama 客户端（Autogen 扩展）
-    client = OllamaChatCompletionClient(model=model_name)
+    # 延迟导入：导入本模块时不加载 autogen_core / autogen_ext
+    from autogen_core.models import UserMessage
+    from autogen_ext.models.ollama import OllamaChatCompletionClient
+    from common.reasoning import ReasoningFilterClient
+
+    # 创建 Ollama 客户端（Autogen 扩展）；回复中的 <think> 推理段不会进入转换阶段的提示
+    client = ReasoningFilterClient(OllamaChatCompletionClient(model=model_name))
 
     # 第一步：提取技术规格
-    prompt_extract = (
-        "Extract the technical specifications from the following text:\n\n" + input_text
-    )
+    prompt_extract = _extract_prompt(input_text)
     resp1 = await client.create([UserMessage(content=prompt_extract, source="user")])
 
     # resp1 的返回格式因版本而异，此处使用最保守的文本化方式提取
@@ -43,6 +60,9 @@ async def run_chain(input_text: str, model_name: str):
         if hasattr(resp1, "choices"):
             # OpenAI-like shape
             extracted = resp1.choices[0].message.content
+        elif isinstance(getattr(resp1, "content", None), str):
+            # Autogen 的 CreateResult
+            extracted = resp1.content
         elif isinstance(resp1, dict) and "choices" in resp1:
             extracted = resp1["choices"][0]["message"]["content"]
         else:
@@ -54,16 +74,16 @@ async def run_chain(input_text: str, model_name: str):
     print(extracted)
 
     # 第二步：将提取到的规格转换为 JSON
-    prompt_transform = (
-        "Transform the following specifications into a JSON object with 'cpu', 'memory', and 'storage' as keys:\n\n"
-        + extracted
-    )
+    prompt_transform = _transform_prompt(extracted)
     resp2 = await client.create([UserMessage(content=prompt_transform, source="user")])
 
     final = None
     try:
         if hasattr(resp2, "choices"):
             final = resp2.choices[0].message.content
+        elif isinstance(getattr(resp2, "content", None), str):
+            # Autogen 的 CreateResult
+            final = resp2.content
         elif isinstance(resp2, dict) and "choices" in resp2:
             final = resp2["choices"][0]["message"]["content"]
         else:
@@ -78,12 +98,62 @@ async def run_chain(input_text: str, model_name: str):
     return final
 
 
+async def run_chain_streaming(input_text: str, model_name: str):
+    """流式执行两步提示链：两个阶段的增量都立即打印，并报告每个阶段的 TTFT。
+
+    client.create_stream 先产出若干 str 增量，最后产出一个 CreateResult；这里只转发文本增量。
+    提取阶段的流一结束就用其完整文本启动转换阶段。
+    返回：最终的 JSON 字符串（模型输出的原始文本）。
+    """
+    from autogen_core.models import UserMessage
+    from autogen_ext.models.ollama import OllamaChatCompletionClient
+    from common.reasoning import ReasoningFilterClient
+    from common.streaming import astream_stages, format_timings
+
+    client = ReasoningFilterClient(OllamaChatCompletionClient(model=model_name))
+
+    async def deltas(prompt: str):
+        async for item in client.create_stream([UserMessage(content=prompt, source="user")]):
+            if isinstance(item, str):
+                yield item
+
+    timings = []
+    current = None
+    final_parts = []
+    try:
+        async for stage, delta in astream_stages(
+            [
+                ("extract", lambda _: deltas(_extract_prompt(input_text))),
+                ("transform", lambda specs: deltas(_transform_prompt(specs))),
+            ],
+            timings,
+        ):
+            if stage != current:
+                current = stage
+                print(f"\n--- 阶段 {stage}（流式）---")
+            print(delta, end="", flush=True)
+            if stage == "transform":
+                final_parts.append(delta)
+    finally:
+        await client.close()
+
+    print(f"\n\n--- 各阶段耗时 ---\n{format_timings(timings)}")
+    return "".join(final_parts)
+
+
 async def main():
     # 待处理的示例文本（与 langchain 示例一致）
     input_text = "The new laptop model features a 3.5 GHz octa-core processor, 16GB of RAM, and a 1TB NVMe SSD."
     model_name = os.getenv("LLM_MODEL", "deepseek-r1:8b")
     print(f"使用模型: {model_name}")
-    await run_chain(input_text, model_name)
+    if os.getenv("CHAIN_STREAM"):
+        await run_chain_streaming(input_text, model_name)
+    else:
+        await run_chain(input_text, model_name)
+
+    from common.reasoning import reasoning_stats
+
+    print(f"\n--- 推理段过滤统计 ---\n{reasoning_stats()}")
 
 
 if __name__ == "__main__":
@@ -13,16 +13,26 @@ python3 autogen/chap02.py
 """
 
 import os
+import sys
 import asyncio
+from pathlib import Path
 from typing import Any
 
-try:
-    # AssistantAgent 位于 autogen_agentchat.agents 模块内
-    from autogen_agentchat.agents import AssistantAgent  # type: ignore
-except Exception as exc:  # 明确失败原因，直接抛出
-    raise ImportError(
-        "缺少 autogen-agentchat（或版本不含 AssistantAgent），请安装/升级：pip install autogen-agentchat"
-    ) from exc
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.router import get_router  # 分层路由：规则 -> 线性分类器 -> LLM
+from common.messages import last_text  # 从尾部取最后一条回复文本
+
+
+def _import_assistant_agent():
+    """延迟导入 AssistantAgent，导入本模块时不加载 autogen_agentchat。"""
+    try:
+        # AssistantAgent 位于 autogen_agentchat.agents 模块内
+        from autogen_agentchat.agents import AssistantAgent  # type: ignore
+    except Exception as exc:  # 明确失败原因，直接抛出
+        raise ImportError(
+            "缺少 autogen-agentchat（或版本不含 AssistantAgent），请安装/升级：pip install autogen-agentchat"
+        ) from exc
+    return AssistantAgent
 
 
 def booking_handler(request: str) -> str:
@@ -44,26 +54,18 @@ async def run_agent(agent: Any, prompt: str) -> str:
     """调用 AssistantAgent.run 并提取文本结果。
 
     AssistantAgent.run(task=...) 返回 TaskResult，包含 messages 序列。
-    我们取最后一个带 content 属性的消息内容作为决策文本。
+    取最后一条非空消息的文本作为决策文本（common/messages.py 的 last_text）。
     """
     out = agent.run(task=prompt)
     if asyncio.iscoroutine(out):
         out = await out
 
     # 尝试解析 TaskResult.messages
-    messages = getattr(out, "messages", None) or []
-    content = None
-    for msg in reversed(messages):
-        if hasattr(msg, "content"):
-            content = getattr(msg, "content", None)
-            if content:
-                break
-    if content is None:
-        content = str(out)
-    return str(content)
+    return last_text(getattr(out, "messages", None)) or str(out)
 
 
 async def route_request_with_agent(agent: Any, request: str) -> str:
+    """先由本地的规则 / 线性分类器路由，只有低置信度时才调用 AssistantAgent。"""
     prompt = (
         "分析用户请求并确定应由哪个专业处理程序负责。\n"
         "- 若请求涉及预订航班或酒店，请输出 'booker'；\n"
@@ -72,11 +74,10 @@ async def route_request_with_agent(agent: Any, request: str) -> str:
         "仅输出一个单词：'booker'、'info' 或 'unclear'。\n\n"
         f"用户请求：{request}\n"
     )
-    decision_text = await run_agent(agent, prompt)
-    decision = (decision_text or "").strip().lower()
-    if decision.startswith("book"):
+    decision = await get_router().aroute(request, allm=lambda _: run_agent(agent, prompt))
+    if decision.label == "booker":
         return booking_handler(request)
-    if decision.startswith("info"):
+    if decision.label == "info":
         return info_handler(request)
     return unclear_handler(request)
 
@@ -86,9 +87,12 @@ async def main():
     print(f"使用模型: {model_name}")
 
     # 构造 AssistantAgent：该版本需要显式传入 model_client
+    AssistantAgent = _import_assistant_agent()
     from autogen_ext.models.ollama import OllamaChatCompletionClient
+    from common.reasoning import ReasoningFilterClient
 
-    agent_client = OllamaChatCompletionClient(model=model_name)
+    # 去掉 <think> 推理段，路由标签直接取自可见回复
+    agent_client = ReasoningFilterClient(OllamaChatCompletionClient(model=model_name))
     agent = AssistantAgent(
         name="router",
         model_client=agent_client,
@@ -103,6 +107,8 @@ async def main():
         result = await route_request_with_agent(agent, req)
         print(f"最终结果 {label}: {result}")
 
+    print(f"\n--- 路由分层统计 ---\n{get_router().stats()}")
+
     try:
         await agent_client.close()
     except Exception:
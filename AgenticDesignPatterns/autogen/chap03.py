@@ -14,23 +14,25 @@ python3 autogen/chap03.py
 """
 
 import os
+import sys
 import asyncio
-from typing import Any
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-from autogen_agentchat.agents import AssistantAgent
-from autogen_ext.models.ollama import OllamaChatCompletionClient
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.limiter import get_limits  # 扇出的全局 / 每模型自适应并发限制
+from common.messages import last_text  # 从尾部取最后一条回复文本
+
+if TYPE_CHECKING:  # 仅用于类型标注；运行时延迟到 run_parallel_example 中导入
+    from autogen_agentchat.agents import AssistantAgent
 
 
 def extract_text(task_result: Any) -> str:
-    """从 TaskResult 中提取最后一条带 content 的消息文本。"""
-    messages = getattr(task_result, "messages", None) or []
-    for msg in reversed(messages):
-        if hasattr(msg, "content") and getattr(msg, "content"):
-            return str(getattr(msg, "content"))
-    return str(task_result)
+    """从 TaskResult 中提取最后一条非空消息的文本。"""
+    return last_text(getattr(task_result, "messages", None)) or str(task_result)
 
 
-async def run_agent(agent: AssistantAgent, prompt: str) -> str:
+async def run_agent(agent: "AssistantAgent", prompt: str) -> str:
     out = agent.run(task=prompt)
     if asyncio.iscoroutine(out):
         out = await out
@@ -41,7 +43,12 @@ async def run_parallel_example(topic: str) -> None:
     model_name = os.getenv("LLM_MODEL", "deepseek-r1:14b")
     print(f"使用模型: {model_name}")
 
-    client = OllamaChatCompletionClient(model=model_name)
+    from autogen_agentchat.agents import AssistantAgent
+    from autogen_ext.models.ollama import OllamaChatCompletionClient
+    from common.reasoning import ReasoningFilterClient
+
+    # 各分支的推理段在进入汇总提示之前就被去掉
+    client = ReasoningFilterClient(OllamaChatCompletionClient(model=model_name))
 
     def make_agent(name: str, system_prompt: str) -> AssistantAgent:
         return AssistantAgent(
@@ -70,10 +77,13 @@ async def run_parallel_example(topic: str) -> None:
     terms_prompt = f"话题：{topic}\n识别 5-10 个关键术语，输出逗号分隔列表。"
 
     print("\n--- 并行生成 summary / questions / key_terms ---")
+    # 每个分支在模型的并发名额内执行，多个请求同时扇出时不会压垮本地 Ollama
+    # site 区分各分支的延迟基线：输出长短不同，共用基线会把长输出误判为过载
+    limits = get_limits()
     summary, questions, key_terms = await asyncio.gather(
-        run_agent(summarizer, summarize_prompt),
-        run_agent(questioner, questions_prompt),
-        run_agent(term_agent, terms_prompt),
+        limits.arun(model_name, run_agent(summarizer, summarize_prompt), site="summary"),
+        limits.arun(model_name, run_agent(questioner, questions_prompt), site="questions"),
+        limits.arun(model_name, run_agent(term_agent, terms_prompt), site="key_terms"),
     )
 
     print("\nSummary:\n", summary)
@@ -88,8 +98,9 @@ async def run_parallel_example(topic: str) -> None:
         f"原始话题: {topic}\n"
     )
 
-    final_answer = await run_agent(synth, synthesis_prompt)
+    final_answer = await limits.arun(model_name, run_agent(synth, synthesis_prompt), site="synthesis")
     print("\n--- 最终综合回答 ---\n", final_answer)
+    print("\n--- 并发限制统计 ---\n", limits.stats())
 
     try:
         await client.close()
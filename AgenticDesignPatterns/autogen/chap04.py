@@ -6,52 +6,25 @@ or the maximum number of rounds is reached.
 
 import asyncio
 import os
-from typing import Iterable, List
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from autogen_agentchat.agents import AssistantAgent
-from autogen_ext.models.ollama import OllamaChatCompletionClient
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.messages import last_text  # Last reply text; the first message is the task prompt itself
 
+if TYPE_CHECKING:  # Annotations only; runtime imports are deferred to first use.
+    from common.reasoning import ReasoningFilterClient
 
-def _extract_text_contents(messages: Iterable) -> str:
-    """Flatten TaskResult.messages into a single text string without depending on SDK internals."""
-    chunks: List[str] = []
-    for message in messages:
-        content = getattr(message, "content", None)
-        if isinstance(content, str):
-            chunks.append(content)
-            continue
 
-        if isinstance(content, list):
-            for part in content:
-                if isinstance(part, str):
-                    chunks.append(part)
-                    continue
+def _build_client() -> "ReasoningFilterClient":
+    from autogen_ext.models.ollama import OllamaChatCompletionClient
+    from common.reasoning import ReasoningFilterClient
 
-                if isinstance(part, dict):
-                    text = part.get("text") or part.get("content")
-                    if isinstance(text, str):
-                        chunks.append(text)
-                    continue
-
-                text_attr = getattr(part, "text", None)
-                if isinstance(text_attr, str):
-                    chunks.append(text_attr)
-                    continue
-
-                content_attr = getattr(part, "content", None)
-                if isinstance(content_attr, str):
-                    chunks.append(content_attr)
-                    continue
-
-                # Fallback to string conversion for unknown types.
-                chunks.append(str(part))
-    return "\n".join(filter(None, chunks)).strip()
-
-
-def _build_client() -> OllamaChatCompletionClient:
     model_name = os.getenv("LLM_MODEL", "deepseek-r1:8b")
     # Keep temperature conservative for deterministic improvements.
-    return OllamaChatCompletionClient(model=model_name, temperature=0.2)
+    model_client = OllamaChatCompletionClient(model=model_name, temperature=0.2)
+    return ReasoningFilterClient(model_client)
 
 
 async def run_reflection_loop() -> None:
@@ -65,6 +38,8 @@ async def run_reflection_loop() -> None:
         "5) 负数输入抛出 ValueError。"
     )
 
+    from autogen_agentchat.agents import AssistantAgent
+
     client = _build_client()
 
     coder = AssistantAgent(
@@ -109,7 +84,7 @@ async def run_reflection_loop() -> None:
             )
 
         code_result = await coder.run(task=coder_prompt)
-        current_code = _extract_text_contents(code_result.messages)
+        current_code = last_text(code_result.messages)
         print("\n--- 生成的代码 ---\n" + current_code)
 
         print("\n>>> 阶段 2：对生成的代码进行反思...")
@@ -120,7 +95,7 @@ async def run_reflection_loop() -> None:
             "如满足要求，仅回复 CODE_IS_PERFECT；否则用项目符号列出问题。"
         )
         critique_result = await reviewer.run(task=reviewer_prompt)
-        critique_text = _extract_text_contents(critique_result.messages)
+        critique_text = last_text(critique_result.messages)
 
         if "CODE_IS_PERFECT" in critique_text.upper():
             print("\n--- 批评结果 ---\n未发现进一步问题，代码已令人满意。")
@@ -2,7 +2,8 @@
 Lightweight tool-augmented flow using autogen-agentchat for models without native tool calling.
 
 Flow:
-1) decision_agent emits JSON {"decision": "use_tool|answer", "tool_input": "..."}.
+1) decision_agent emits JSON {"decision": "use_tool|answer", "tool_input": "..."}; the stream is parsed
+   incrementally and generation stops once the decision is final (DECISION_STREAM=off waits for the full reply).
 2) Optional Python tool execution (search_information) for simple factual lookup.
 3) final_agent produces the final answer combining tool output if present.
 
@@ -12,87 +13,97 @@ while keeping the manual fallback.
 """
 
 import asyncio
-import json
 import os
-from typing import Iterable, List, Tuple
-
-from autogen_agentchat.agents import AssistantAgent
-try:
-	# Some SDK versions expose a Tool helper; keep optional to avoid import errors.
-	from autogen_agentchat.tools import Tool  # type: ignore
-except Exception:  # pragma: no cover
-	Tool = None  # type: ignore
-
-from autogen_ext.models.ollama import OllamaChatCompletionClient
-
-
-def _extract_text(messages: Iterable) -> str:
-	"""Flatten TaskResult.messages into plain text across SDK variants."""
-	parts: List[str] = []
-	for message in messages:
-		content = getattr(message, "content", None)
-		if isinstance(content, str):
-			parts.append(content)
-			continue
-		if isinstance(content, list):
-			for item in content:
-				if isinstance(item, str):
-					parts.append(item)
-					continue
-				if isinstance(item, dict):
-					txt = item.get("text") or item.get("content")
-					if isinstance(txt, str):
-						parts.append(txt)
-						continue
-				txt_attr = getattr(item, "text", None)
-				if isinstance(txt_attr, str):
-					parts.append(txt_attr)
-					continue
-				content_attr = getattr(item, "content", None)
-				if isinstance(content_attr, str):
-					parts.append(content_attr)
-					continue
-				parts.append(str(item))
-	return "\n".join(filter(None, parts)).strip()
-
-
-def _build_client() -> OllamaChatCompletionClient:
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.batcher import BatchedModelClient  # Micro-batches concurrent model calls
+from common.reasoning import ReasoningFilterClient, reasoning_stats  # Strips <think> reasoning from replies
+from common.messages import last_text  # Last reply text without scanning the whole run
+from common.jsonstream import adecide, decision_stream_enabled, parse_decision  # Incremental decision JSON parsing
+from common.tools import KnowledgeTable, get_tool_registry, normalize  # Indexed lookups and async tool dispatch
+
+if TYPE_CHECKING:  # Annotations only; runtime imports are deferred to first use.
+	from autogen_agentchat.agents import AssistantAgent
+
+
+def _build_client() -> "BatchedModelClient":
+	"""Ollama client that micro-batches concurrent create() calls.
+
+	Sampling at temperature 0.2 is not deterministic, so identical calls are only coalesced with
+	LLM_BATCH_COALESCE=on; otherwise each call is still dispatched (LLM_BATCH_WINDOW_MS=0 disables batching).
+	"""
+	from autogen_ext.models.ollama import OllamaChatCompletionClient
+
 	model_name = os.getenv("LLM_MODEL", "deepseek-r1:14b")
-	return OllamaChatCompletionClient(model=model_name, temperature=0.2)
+	temperature = 0.2
+	client = OllamaChatCompletionClient(model=model_name, temperature=temperature)
+	return BatchedModelClient(ReasoningFilterClient(client), temperature=temperature)
+
+
+# Canned knowledge indexed once at import: exact hash on normalized keys plus an inverted token index.
+KNOWLEDGE = KnowledgeTable([
+	("weather in london", "伦敦目前多云，气温15°C。"),
+	("capital of france", "法国的首都是巴黎。"),
+	("population of earth", "地球的估计人口约为80亿。"),
+	("tallest mountain", "珠穆朗玛峰是地球上最高的山峰（海拔）。"),
+])
+NOT_FOUND = "未找到具体信息"
 
 
 def search_information(query: str) -> str:
-	"""Simulated search tool returning canned answers."""
+	"""Simulated search tool: exact match first, then fuzzy token-overlap match."""
 	print(f"\n--- 工具已调用: search_information，查询: '{query}' ---")
-	simulated = {
-		"weather in london": "伦敦目前多云，气温15°C。",
-		"capital of france": "法国的首都是巴黎。",
-		"population of earth": "地球的估计人口约为80亿。",
-		"tallest mountain": "珠穆朗玛峰是地球上最高的山峰（海拔）。",
-	}
-	result = simulated.get(query.lower(), f"“{query}”的模拟搜索结果: 未找到具体信息，但该主题似乎很有趣。")
+	result = KNOWLEDGE.lookup(query) or f"“{query}”的模拟搜索结果: {NOT_FOUND}，但该主题似乎很有趣。"
 	print(f"--- 工具结果: {result} ---")
 	return result
 
 
+# Results are cached per normalized query (5 min, misses 30 s); concurrent identical lookups share one execution.
+TOOLS = get_tool_registry()
+TOOLS.register(search_information, ttl=300, negative_ttl=30, key=normalize, is_miss=lambda result: NOT_FOUND in result)
+
+
 def _parse_decision(raw: str, fallback_query: str) -> Tuple[str, str]:
-	"""Parse JSON decision; fallback to simple heuristics."""
-	decision = "answer"
-	tool_input = ""
-	try:
-		obj = json.loads(raw.strip())
-		decision = obj.get("decision", decision)
-		tool_input = obj.get("tool_input", tool_input)
-	except Exception:
-		lowered = raw.lower()
-		if "use_tool" in lowered:
-			decision = "use_tool"
-	if decision == "use_tool" and not tool_input:
-		tool_input = fallback_query
-	return decision, tool_input
-
-
-async def run_agent_with_tool(question: str, decision_agent: AssistantAgent, final_agent: AssistantAgent) -> None:
+	"""Parse the decision JSON, ignoring <think> preambles; falls back to simple heuristics."""
+	return parse_decision(raw, fallback_query)
+
+
+async def _decide(decision_agent: "AssistantAgent", prompt: str, question: str) -> Tuple[str, str]:
+	"""Run the decision agent; when streaming, stop generation as soon as the decision is final."""
+	if not decision_stream_enabled():
+		result = await decision_agent.run(task=prompt)
+		return _parse_decision(last_text(result.messages), question)
+
+	from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+	from autogen_core import CancellationToken
+
+	token = CancellationToken()
+
+	async def chunks():
+		stream = decision_agent.run_stream(task=prompt, cancellation_token=token)
+		try:
+			async for event in stream:
+				if isinstance(event, ModelClientStreamingChunkEvent):
+					yield event.content
+		finally:
+			# Closing early cancels the in-flight model call; the remaining tokens are useless.
+			token.cancel()
+			try:
+				await stream.aclose()
+			except (Exception, asyncio.CancelledError):
+				pass
+
+	choice, tool_input, info = await adecide(chunks(), question)
+	# ReasoningFilterClient has already stripped <think> from the chunks (keeping it out of the agent's
+	# history), so the parser never sees reasoning; the dropped amount is in reasoning_stats() instead.
+	print(f"决策: {choice}，{'提前结束' if info['early'] else '完整输出'}，接收 {info['chars']} 字符")
+	return choice, tool_input
+
+
+async def run_agent_with_tool(question: str, decision_agent: "AssistantAgent", final_agent: "AssistantAgent") -> None:
 	print(f"\n--- 正在处理查询: '{question}' ---")
 
 	decision_prompt = (
@@ -104,13 +115,15 @@ async def run_agent_with_tool(question: str, decision_agent: AssistantAgent, fin
 		f"用户问题：{question}"
 	)
 
-	decision_result = await decision_agent.run(task=decision_prompt)
-	decision_text = _extract_text(decision_result.messages)
-	choice, tool_input = _parse_decision(decision_text, question)
+	choice, tool_input = await _decide(decision_agent, decision_prompt, question)
 
 	tool_result = ""
 	if choice == "use_tool":
-		tool_result = search_information(tool_input or question)
+		try:
+			# Runs on the registry's bounded thread pool so slow tools don't block the event loop.
+			tool_result = await TOOLS.acall("search_information", tool_input or question)
+		except Exception:
+			tool_result = "(工具调用失败，按原问题回答)"
 
 	final_prompt = (
 		"你是一个乐于助人的助手，尽量简洁、准确，用中文回答。\n"
@@ -120,11 +133,18 @@ async def run_agent_with_tool(question: str, decision_agent: AssistantAgent, fin
 	)
 
 	final_result = await final_agent.run(task=final_prompt)
-	final_text = _extract_text(final_result.messages)
+	final_text = last_text(final_result.messages)
 	print("\n--- ✅ 最终回答 ---\n" + final_text)
 
 
 async def main() -> None:
+	from autogen_agentchat.agents import AssistantAgent
+	try:
+		# Some SDK versions expose a Tool helper; keep optional to avoid import errors.
+		from autogen_agentchat.tools import Tool  # type: ignore
+	except Exception:  # pragma: no cover
+		Tool = None  # type: ignore
+
 	client = _build_client()
 
 	# If the backend model supports tool-calling (e.g., qwen3:8b), attach the tool schema so the
@@ -145,6 +165,7 @@ async def main() -> None:
 		model_client=client,
 		system_message="你是一个仅输出 JSON 决策的助手。不要输出除 JSON 外的任何内容。",
 		tools=[search_tool] if search_tool else None,
+		model_client_stream=decision_stream_enabled(),  # Token chunks feed the incremental decision parser
 	)
 
 	final_agent = AssistantAgent(
@@ -158,9 +179,13 @@ async def main() -> None:
 		"法国的首都是什么？",
 		"伦敦天气怎么样？",
 		"告诉我一些关于狗的事情。",
+		"法国首都是哪座城市？",  # Same tool input as the first query: coalesced into one tool call
 	]
 
 	await asyncio.gather(*(run_agent_with_tool(q, decision_agent, final_agent) for q in queries))
+	print(f"\n--- 微批处理统计 ---\n{client.batcher.stats()}")
+	print(f"\n--- 工具延迟与缓存统计 ---\n{TOOLS.stats()}")
+	print(f"\n--- 推理段过滤统计 ---\n{reasoning_stats()}")
 
 
 if __name__ == "__main__":
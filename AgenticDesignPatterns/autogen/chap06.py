@@ -7,12 +7,15 @@ creates bullet points, writer produces the summary and appends the stop word.
 
 import asyncio
 import os
-from typing import Iterable, List, Tuple
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Tuple
 
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.conditions import TextMentionTermination
-from autogen_agentchat.teams import RoundRobinGroupChat  # type: ignore
-from autogen_ext.models.ollama import OllamaChatCompletionClient
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.messages import extract_text, last_text  # Shared TaskResult text extraction
+
+if TYPE_CHECKING:  # Annotations only; runtime imports are deferred to first use.
+    from common.reasoning import ReasoningFilterClient
 
 # 规划使代理能够将复杂目标分解为可操作的顺序步骤。 
 # 它对于处理多步骤任务、工作流自动化和驾驭复杂环境至关重要。
@@ -21,39 +24,13 @@ from autogen_ext.models.ollama import OllamaChatCompletionClient
 TERMINATION_KEYWORD = os.getenv("TERMINATION_KEYWORD", "END_OF_SUMMARY")
 
 
-def _extract_text(messages: Iterable) -> str:
-    """Flatten TaskResult.messages into plain text across SDK variants."""
-    parts: List[str] = []
-    for message in messages:
-        content = getattr(message, "content", None)
-        if isinstance(content, str):
-            parts.append(content)
-            continue
-        if isinstance(content, list):
-            for item in content:
-                if isinstance(item, str):
-                    parts.append(item)
-                    continue
-                if isinstance(item, dict):
-                    txt = item.get("text") or item.get("content")
-                    if isinstance(txt, str):
-                        parts.append(txt)
-                        continue
-                txt_attr = getattr(item, "text", None)
-                if isinstance(txt_attr, str):
-                    parts.append(txt_attr)
-                    continue
-                content_attr = getattr(item, "content", None)
-                if isinstance(content_attr, str):
-                    parts.append(content_attr)
-                    continue
-                parts.append(str(item))
-    return "\n".join(filter(None, parts)).strip()
-
-
-def _build_client() -> OllamaChatCompletionClient:
+def _build_client() -> "ReasoningFilterClient":
+    from autogen_ext.models.ollama import OllamaChatCompletionClient
+    from common.reasoning import ReasoningFilterClient
+
     model_name = os.getenv("LLM_MODEL", "qwen3:8b")
-    return OllamaChatCompletionClient(model=model_name, temperature=0.4)
+    model_client = OllamaChatCompletionClient(model=model_name, temperature=0.4)
+    return ReasoningFilterClient(model_client)
 
 
 def _split_sections(text: str) -> Tuple[str, str]:
@@ -81,6 +58,10 @@ def _split_sections(text: str) -> Tuple[str, str]:
 
 
 async def _run_round_robin(topic: str) -> str:
+    from autogen_agentchat.agents import AssistantAgent
+    from autogen_agentchat.conditions import TextMentionTermination
+    from autogen_agentchat.teams import RoundRobinGroupChat  # type: ignore
+
     client = _build_client()
 
     # RoundRobinGroupChat requires participants; build with actual agents so max_round is derived consistently.
@@ -118,7 +99,7 @@ async def _run_round_robin(topic: str) -> str:
     )
 
     result = await team.run(task=task)
-    text = _extract_text(result.messages)
+    text = extract_text(result.messages)
     plan, summary = _split_sections(text)
     summary_clean = summary.replace(TERMINATION_KEYWORD, "").strip()
 
@@ -129,7 +110,7 @@ async def _run_round_robin(topic: str) -> str:
             f"摘要结束后最后一行写 `{TERMINATION_KEYWORD}`。\n[计划]\n{plan}"
         )
         rewrite = await writer.run(task=rewrite_prompt)
-        summary_clean = _extract_text(rewrite.messages).replace(TERMINATION_KEYWORD, "").strip()
+        summary_clean = last_text(rewrite.messages).replace(TERMINATION_KEYWORD, "").strip()
 
     return "=== 计划 (要点) ===\n" + plan + "\n\n=== 摘要 ===\n" + summary_clean
 
@@ -160,14 +141,14 @@ async def _run_round_robin(topic: str) -> str:
 #         f"主题：{topic}"
 #     )
 #     plan_result = await planner.run(task=plan_prompt)
-#     plan_text = _extract_text(plan_result.messages)
+#     plan_text = extract_text(plan_result.messages)
 
 #     write_prompt = (
 #         "根据下述计划撰写约200字的中文摘要，保持结构清晰、信息密度高：\n"
 #         f"[计划]\n{plan_text}"
 #     )
 #     summary_result = await writer.run(task=write_prompt)
-#     summary_text = _extract_text(summary_result.messages)
+#     summary_text = extract_text(summary_result.messages)
 
 #     return "=== 计划 (要点) ===\n" + plan_text + "\n\n=== 摘要 ===\n" + summary_text
 
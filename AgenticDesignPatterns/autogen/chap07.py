@@ -11,50 +11,31 @@ Autogen 版本：多智能体协作（研究员 -> 撰稿人），参考 `langch
 
 import asyncio
 import os
-from typing import Iterable, List
-
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.conditions import TextMentionTermination
-from autogen_agentchat.teams import RoundRobinGroupChat  # type: ignore
-from autogen_ext.models.ollama import OllamaChatCompletionClient
-
-
-def _extract_text(messages: Iterable) -> str:
-    """Flatten TaskResult.messages content into plain text."""
-    parts: List[str] = []
-    for message in messages:
-        content = getattr(message, "content", None)
-        if isinstance(content, str):
-            parts.append(content)
-            continue
-        if isinstance(content, list):
-            for item in content:
-                if isinstance(item, str):
-                    parts.append(item)
-                    continue
-                if isinstance(item, dict):
-                    txt = item.get("text") or item.get("content")
-                    if isinstance(txt, str):
-                        parts.append(txt)
-                        continue
-                txt_attr = getattr(item, "text", None)
-                if isinstance(txt_attr, str):
-                    parts.append(txt_attr)
-                    continue
-                content_attr = getattr(item, "content", None)
-                if isinstance(content_attr, str):
-                    parts.append(content_attr)
-                    continue
-                parts.append(str(item))
-    return "\n".join(filter(None, parts)).strip()
-
-
-def _build_client() -> OllamaChatCompletionClient:
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.messages import extract_text  # 共享的 TaskResult 文本提取（按类型缓存分派）
+
+if TYPE_CHECKING:  # 仅用于类型标注；运行时在 main() 中才导入
+    from common.reasoning import ReasoningFilterClient
+
+
+def _build_client() -> "ReasoningFilterClient":
+    from autogen_ext.models.ollama import OllamaChatCompletionClient
+    from common.reasoning import ReasoningFilterClient
+
     model_name = os.getenv("LLM_MODEL", "qwen3:8b")
-    return OllamaChatCompletionClient(model=model_name, temperature=0.3)
+    model_client = OllamaChatCompletionClient(model=model_name, temperature=0.3)
+    return ReasoningFilterClient(model_client)
 
 
 async def main() -> None:
+    from autogen_agentchat.agents import AssistantAgent
+    from autogen_agentchat.conditions import TextMentionTermination
+    from autogen_agentchat.teams import RoundRobinGroupChat  # type: ignore
+
     client = _build_client()
     timeout_s = int(os.getenv("CHAT_TIMEOUT", "90"))
 
@@ -98,7 +79,7 @@ async def main() -> None:
         print(f"对话在 {timeout_s}s 内未完成，已超时退出。")
         return
 
-    text = _extract_text(result.messages)
+    text = extract_text(result.messages)
 
     # 截断到终止标记，避免后续噪音。
     if "END_OF_ARTICLE" in text:
@@ -1,20 +1,34 @@
 # https://microsoft.github.io/autogen/stable//user-guide/agentchat-user-guide/memory.html#
 
 
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.ui import Console
-from autogen_core.memory import ListMemory, MemoryContent, MemoryMimeType
-from autogen_ext.models.ollama import OllamaChatCompletionClient
 import asyncio
 import os
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+if TYPE_CHECKING:  # Annotations only; runtime imports are deferred to first use.
+	from common.reasoning import ReasoningFilterClient
+
+def _build_client() -> "ReasoningFilterClient":
+	from autogen_ext.models.ollama import OllamaChatCompletionClient
+	from common.reasoning import ReasoningFilterClient
 
-def _build_client() -> OllamaChatCompletionClient:
 	model_name = os.getenv("LLM_MODEL", "qwen3:8b")
-	return OllamaChatCompletionClient(model=model_name, temperature=0.2)
+	model_client = OllamaChatCompletionClient(model=model_name, temperature=0.2)
+	return ReasoningFilterClient(model_client)
 
 # Initialize user memory
 async def main():
-    user_memory = ListMemory()
+    from autogen_agentchat.agents import AssistantAgent
+    from autogen_agentchat.ui import Console
+    from autogen_core.memory import MemoryContent, MemoryMimeType
+    from common.autogen_memory import build_memory
+
+    # 按与当前任务的相关性注入记忆（token 预算内），而不是每次注入全部记忆
+    user_memory = build_memory("user_memory")
 
     # Add user preferences to memory
     await user_memory.add(MemoryContent(content="The weather should be in metric units", mime_type=MemoryMimeType.TEXT))
@@ -42,6 +56,7 @@ async def main():
     # Run the agent with a task.
     stream = assistant_agent.run_stream(task="What is the weather in New York?")
     await Console(stream)
+    print("Memory Stats:", user_memory.stats())
 
 if __name__ == "__main__":
     asyncio.run(main())
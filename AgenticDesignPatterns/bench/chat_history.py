@@ -0,0 +1,126 @@
+"""
+会话历史存储基准（common/chatstore.py）。
+
+- 内存：向 N 个会话（默认 10 万）各写入若干轮对话，记录写入过程中的常驻内存（RSS），
+  验证内存只取决于热会话 LRU 的大小，与会话总数无关；
+- 窗口读取：单个会话的历史从 10 轮增长到数千轮，测量读取最近 K 轮窗口的耗时
+  （分别测热会话命中与冷会话走磁盘索引两种路径），验证耗时与历史总长无关。
+
+运行示例：
+```bash
+python bench/chat_history.py
+python bench/chat_history.py --sessions 200000 --turns 3 --hot 1024 --output chat_history.json
+```
+"""
+
+import argparse
+import json
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.chatstore import ChatLogStore  # noqa: E402
+
+
+def _rss_mb() -> float:
+    """当前进程的常驻内存（MB），读取 /proc；不可用时退回峰值 RSS。"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * resource.getpagesize() / 1024 / 1024, 1)
+    except OSError:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _turn(i: int) -> List[Dict[str, Any]]:
+    return [
+        {"type": "human", "data": {"content": f"第 {i} 个问题：帮我订一张去东京的机票。"}},
+        {"type": "ai", "data": {"content": f"第 {i} 个回答：好的，请告诉我出发日期与人数。"}},
+    ]
+
+
+def bench_sessions(path: Path, sessions: int, turns: int, hot: int) -> Dict[str, Any]:
+    store = ChatLogStore(str(path), hot_sessions=hot)
+    samples = []
+    started = time.perf_counter()
+    checkpoint = max(1, sessions // 5)
+    for s in range(sessions):
+        for t in range(turns):
+            store.append(f"user-{s}", _turn(t))
+        if (s + 1) % checkpoint == 0:
+            samples.append({"sessions": s + 1, "rss_mb": _rss_mb()})
+    elapsed = time.perf_counter() - started
+    result = {
+        "sessions": sessions,
+        "turns": turns,
+        "append_us_per_message": round(elapsed / (sessions * turns * 2) * 1e6, 2),
+        "rss": samples,
+        "stats": store.stats(),
+    }
+    store.close()
+    return result
+
+
+def bench_window(path: Path, lengths: List[int], window_turns: int, repeat: int) -> List[Dict[str, Any]]:
+    store = ChatLogStore(str(path), hot_sessions=2)
+    rows = []
+    written = 0
+    for length in lengths:
+        while written < length:
+            store.append("long", _turn(written))
+            written += 1
+        store.window("long", window_turns)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            store.window("long", window_turns)
+        hot_us = (time.perf_counter() - started) / repeat * 1e6
+        # 冷路径：每次先把会话挤出热 LRU，窗口只能走索引 + pread
+        cold = 0.0
+        for i in range(repeat):
+            store.window(f"other-{i % 2}", window_turns)
+            store.window(f"other-{(i + 1) % 2}", window_turns)
+            started = time.perf_counter()
+            store.window("long", window_turns)
+            cold += time.perf_counter() - started
+        rows.append({"history_turns": length, "hot_us": round(hot_us, 2), "cold_us": round(cold / repeat * 1e6, 2)})
+    store.close()
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="会话历史存储基准")
+    parser.add_argument("--sessions", type=int, default=100000, help="会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话写入的轮数")
+    parser.add_argument("--hot", type=int, default=1024, help="热会话 LRU 大小")
+    parser.add_argument("--window", type=int, default=10, help="窗口轮数")
+    parser.add_argument("--repeat", type=int, default=200, help="窗口读取的重复次数")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="chat_history_bench_"))
+    try:
+        sessions = bench_sessions(workdir / "sessions", args.sessions, args.turns, args.hot)
+        print(f"写入 {args.sessions} 个会话 × {args.turns} 轮：每条消息 {sessions['append_us_per_message']} µs")
+        for sample in sessions["rss"]:
+            print(f"  {sample['sessions']:>8} 个会话  RSS {sample['rss_mb']} MB")
+        window = bench_window(workdir / "window", [10, 100, 1000, 5000], args.window, args.repeat)
+        print(f"最近 {args.window} 轮窗口的读取耗时：")
+        print(f"{'历史轮数':>10}{'热会话(µs)':>14}{'冷会话(µs)':>14}")
+        for row in window:
+            print(f"{row['history_turns']:>10}{row['hot_us']:>14.2f}{row['cold_us']:>14.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        payload = {"sessions": sessions, "window": window}
+        Path(args.output).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+嵌入服务基准（common/embeddings.py）。
+
+在进程内启动 fake_ollama（/api/embed 带固定延迟 + 每条文本延迟），模拟记忆示例的访问模式：
+若干线程 / 协程并发地对记忆文本做单条嵌入，文本按幂律分布重复（常用记忆被反复查询）。对比：
+- 直接调用：每个请求一次 /api/embed（示例原先的做法）；
+- EmbeddingService 同步路径（多线程，合并成批 + 内容缓存）；
+- EmbeddingService 异步路径（MicroBatcher 窗口合并）；
+- 重启：新进程打开同一缓存目录，全部命中、不调用模型。
+
+运行示例：
+```bash
+python bench/embeddings.py
+python bench/embeddings.py --texts 2000 --requests 4000 --threads 16 --embed-ms 20 --output embeddings.json
+```
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common.embeddings import EmbeddingService, VectorCache, _ollama_embedders  # noqa: E402
+from fake_ollama import FakeConfig, FakeOllamaServer  # noqa: E402
+
+MODEL = "fake-embed"
+
+
+def _workload(texts: int, requests: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    corpus = [f"user memory {i}: prefers topic {i % 37} and format {i % 5}" for i in range(texts)]
+    return [corpus[int(rng.paretovariate(1.1)) % texts] for _ in range(requests)]
+
+
+def _threaded(call: Callable[[str], Any], workload: List[str], threads: int) -> float:
+    chunks = [workload[i::threads] for i in range(threads)]
+    started = time.perf_counter()
+    workers = [threading.Thread(target=lambda c=c: [call(t) for t in c]) for c in chunks]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - started
+
+
+def _server_calls(server: FakeOllamaServer) -> int:
+    calls = server.stats.snapshot()["by_endpoint"].get("/api/embed", 0)
+    server.stats.reset()
+    return calls
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="嵌入服务基准")
+    parser.add_argument("--texts", type=int, default=1000, help="不同的记忆文本数")
+    parser.add_argument("--requests", type=int, default=3000, help="嵌入请求总数")
+    parser.add_argument("--threads", type=int, default=16, help="并发线程数（异步路径为同样数量的协程批次）")
+    parser.add_argument("--embed-ms", type=float, default=20.0, help="替身服务每个嵌入请求的固定延迟")
+    parser.add_argument("--embed-text-ms", type=float, default=0.2, help="替身服务每条文本的额外延迟")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(port=0, config=FakeConfig(embed_ms=args.embed_ms, embed_text_ms=args.embed_text_ms)).start()
+    os.environ["OLLAMA_HOST"] = server.url
+    embed, aembed = _ollama_embedders(MODEL)
+    workload = _workload(args.texts, args.requests)
+    workdir = Path(tempfile.mkdtemp(prefix="embeddings_bench_"))
+    results: Dict[str, Any] = {"texts": args.texts, "requests": args.requests, "threads": args.threads}
+    try:
+        elapsed = _threaded(lambda text: embed([text]), workload, args.threads)
+        results["direct"] = {"seconds": round(elapsed, 3), "model_calls": _server_calls(server)}
+
+        service = EmbeddingService(embed, MODEL, VectorCache(str(workdir / "sync")), aembed=aembed)
+        elapsed = _threaded(service.embed_query, workload, args.threads)
+        results["service_sync"] = {"seconds": round(elapsed, 3), "model_calls": _server_calls(server), "stats": service.stats()}
+        service.close()
+
+        service = EmbeddingService(embed, MODEL, VectorCache(str(workdir / "sync")), aembed=aembed)
+        elapsed = _threaded(service.embed_query, workload, args.threads)
+        results["service_restart"] = {"seconds": round(elapsed, 3), "model_calls": _server_calls(server), "stats": service.stats()}
+        service.close()
+
+        service = EmbeddingService(embed, MODEL, VectorCache(str(workdir / "async")), aembed=aembed)
+
+        async def run_async() -> None:
+            for start in range(0, len(workload), args.threads):
+                await asyncio.gather(*(service.aembed_query(t) for t in workload[start:start + args.threads]))
+
+        started = time.perf_counter()
+        asyncio.run(run_async())
+        results["service_async"] = {
+            "seconds": round(time.perf_counter() - started, 3), "model_calls": _server_calls(server), "stats": service.stats(),
+        }
+        service.close()
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.requests} 次单条嵌入请求（{args.texts} 条不同文本，{args.threads} 路并发）：")
+    print(f"{'方式':<16}{'耗时(s)':>10}{'模型调用':>10}{'命中率':>10}{'平均批大小':>12}")
+    for name in ("direct", "service_sync", "service_restart", "service_async"):
+        row = results[name]
+        stats = row.get("stats", {})
+        print(f"{name:<16}{row['seconds']:>10.3f}{row['model_calls']:>10}"
+              f"{stats.get('hit_rate', 0.0):>10.3f}{stats.get('avg_batch_size', 1.0):>12.2f}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+消息文本提取的微基准：在 1 万条消息的 TaskResult 上对比旧的 _extract_text 与 common/messages.py。
+
+消息由三类组成（比例可调）：纯文本消息（content 为 str）、多模态消息（content 为 [str, Image]）、
+工具调用事件（content 为 FunctionCall 列表）。安装了 autogen_agentchat 时使用真实的消息类型，
+否则用结构相同的轻量替身。对比：
+- legacy：各章原先复制的 _extract_text（逐片段 getattr / isinstance 探测 + filter + join）；
+- extract_text：共享实现，整段对话；
+- last_text：只取最后一条回复（单个智能体 run() 的用法），旧实现在这里只能先展开整段对话。
+
+运行示例：
+```bash
+python bench/extract_text.py
+python bench/extract_text.py --messages 10000 --repeat 20 --output extract.json
+```
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.messages import extract_text, last_text  # noqa: E402
+
+
+def legacy_extract_text(messages: Iterable) -> str:
+    """各章原先的实现（chap05 / chap06 / chap07 版本），作为对照。"""
+    parts: List[str] = []
+    for message in messages:
+        content = getattr(message, "content", None)
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        if isinstance(content, list):
+            for item in content:
+                if isinstance(item, str):
+                    parts.append(item)
+                    continue
+                if isinstance(item, dict):
+                    txt = item.get("text") or item.get("content")
+                    if isinstance(txt, str):
+                        parts.append(txt)
+                        continue
+                txt_attr = getattr(item, "text", None)
+                if isinstance(txt_attr, str):
+                    parts.append(txt_attr)
+                    continue
+                content_attr = getattr(item, "content", None)
+                if isinstance(content_attr, str):
+                    parts.append(content_attr)
+                    continue
+                parts.append(str(item))
+    return "\n".join(filter(None, parts)).strip()
+
+
+@dataclass
+class _TextMessage:
+    source: str
+    content: Any
+
+
+@dataclass
+class _Image:
+    data: str = "iVBORw0KGgo="
+
+    def __str__(self) -> str:
+        return "<image>"
+
+
+@dataclass
+class _FunctionCall:
+    id: str
+    name: str
+    arguments: str
+
+
+def _factories() -> Dict[str, Callable[..., Any]]:
+    """优先使用 autogen_agentchat 的真实消息类型。"""
+    try:
+        from autogen_agentchat.messages import MultiModalMessage, TextMessage, ToolCallRequestEvent
+        from autogen_core import FunctionCall, Image
+        from PIL import Image as PILImage
+
+        image = Image.from_pil(PILImage.new("RGB", (1, 1)))
+        return {
+            "kind": "autogen",
+            "text": lambda source, text: TextMessage(source=source, content=text),
+            "multimodal": lambda source, text: MultiModalMessage(source=source, content=[text, image]),
+            "tool": lambda source, i: ToolCallRequestEvent(
+                source=source, content=[FunctionCall(id=str(i), name="search_information", arguments='{"query": "q"}')]
+            ),
+        }
+    except Exception:
+        return {
+            "kind": "stand-in",
+            "text": lambda source, text: _TextMessage(source, text),
+            "multimodal": lambda source, text: _TextMessage(source, [text, _Image()]),
+            "tool": lambda source, i: _TextMessage(
+                source, [_FunctionCall(str(i), "search_information", '{"query": "q"}')]
+            ),
+        }
+
+
+def build_messages(count: int, multimodal_every: int, tool_every: int) -> List[Any]:
+    make = _factories()
+    messages: List[Any] = []
+    for i in range(count):
+        source = ("planner", "writer", "researcher")[i % 3]
+        text = f"第 {i} 条消息：关于 AI 趋势的要点与来源线索。"
+        if tool_every and i % tool_every == tool_every - 1:
+            messages.append(make["tool"](source, i))
+        elif multimodal_every and i % multimodal_every == multimodal_every - 1:
+            messages.append(make["multimodal"](source, text))
+        else:
+            messages.append(make["text"](source, text))
+    return messages
+
+
+def _time(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    func()  # 预热（填充分派缓存）
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "min_ms": round(min(samples), 4),
+        "max_ms": round(max(samples), 4),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="TaskResult 消息文本提取微基准")
+    parser.add_argument("--messages", type=int, default=10000, help="对话中的消息条数")
+    parser.add_argument("--repeat", type=int, default=20, help="每种实现的重复次数")
+    parser.add_argument("--multimodal-every", type=int, default=10, help="每 N 条插入一条多模态消息（0 表示不插入）")
+    parser.add_argument("--tool-every", type=int, default=25, help="每 N 条插入一条工具调用事件（0 表示不插入）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    messages = build_messages(args.messages, args.multimodal_every, args.tool_every)
+    kind = _factories()["kind"]
+
+    # 两种整段提取的结果应当一致（旧实现对空片段的处理与新实现相同）
+    if legacy_extract_text(messages) != extract_text(messages):
+        print("警告：legacy 与 extract_text 的输出不一致", file=sys.stderr)
+
+    results = {
+        "legacy": _time(lambda: legacy_extract_text(messages), args.repeat),
+        "extract_text": _time(lambda: extract_text(messages), args.repeat),
+        "last_text": _time(lambda: last_text(messages), args.repeat),
+    }
+    baseline = results["legacy"]["median_ms"]
+    print(f"消息类型: {kind}，消息数: {len(messages)}，重复: {args.repeat}")
+    print(f"{'实现':<16}{'中位数(ms)':>12}{'最小(ms)':>12}{'加速':>10}")
+    for name, row in results.items():
+        speedup = baseline / row["median_ms"] if row["median_ms"] else float("inf")
+        print(f"{name:<16}{row['median_ms']:>12.4f}{row['min_ms']:>12.4f}{speedup:>9.1f}x")
+
+    if args.output:
+        payload = {"kind": kind, "messages": len(messages), "repeat": args.repeat, "results": results}
+        Path(args.output).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,519 @@
+"""
+本地 Ollama / OpenAI 兼容的替身服务，用于在没有安装模型的 CPU 机器上压测与分析各个示例。
+
+支持的接口：
+- POST /api/chat              Ollama 聊天（默认流式 NDJSON，stream=false 时一次返回）
+- POST /api/generate          Ollama 补全（同上）
+- POST /v1/chat/completions   OpenAI 兼容聊天（stream=true 时为 SSE）
+- POST /api/embed             Ollama 嵌入（input 为字符串或列表；向量由词的特征哈希生成，词重叠的文本向量相近）
+- GET  /api/tags、/api/version、/v1/models、POST /api/show   供客户端探测
+- GET  /_stats、POST /_stats/reset                           调用次数与 token 统计（aborted 为客户端中途断开的请求数）
+
+回复内容：
+- 可通过 --script 指定 JSON 脚本，按顺序匹配规则：
+  [{"user": "正则", "system": "正则", "model": "正则", "response": "回复文本"}, ...]
+  user/system/model 均可省略；user 匹配最后一条用户消息（generate 接口匹配 prompt），
+  system 匹配所有 system 消息拼接后的文本。默认加载同目录下的 fake_responses.json。
+- 未命中任何规则时，返回基于提示内容哈希生成的确定性文本（长度由 --default-tokens 控制）。
+
+延迟模型：
+- --ttft-ms：首 token 延迟（毫秒）；
+- --tokens-per-sec：生成速度，逐 token 推送；
+- --slots：并发处理槽位数（0 表示不限制），超出的请求排队，用于模拟单机模型服务的过载。
+- --embed-ms / --embed-text-ms：嵌入请求的固定延迟与每条文本的额外延迟（毫秒）。
+
+所有示例默认连接 http://localhost:11434，因此直接在 11434 端口启动即可：
+```bash
+python bench/fake_ollama.py --ttft-ms 200 --tokens-per-sec 40
+# 或指定端口，并通过 OLLAMA_HOST 让 ChatOllama / autogen 客户端连接：
+python bench/fake_ollama.py --port 18080 & export OLLAMA_HOST=http://127.0.0.1:18080
+```
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_SCRIPT = Path(__file__).with_name("fake_responses.json")
+
+# 粗粒度分词：中日韩字符逐字、英文按单词、空白与标点单独成 token。
+_TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]|\w+|\s+|[^\w\s]")
+
+_FILLER = (
+    "agent pattern chain model prompt token latency result step plan tool memory "
+    "route reflect goal output input context summary answer"
+).split()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text or "")
+
+
+def count_tokens(text: str) -> int:
+    return len(tokenize(text))
+
+
+@dataclass
+class Rule:
+    response: str
+    user: Optional["re.Pattern[str]"] = None
+    system: Optional["re.Pattern[str]"] = None
+    model: Optional["re.Pattern[str]"] = None
+
+    def matches(self, model: str, system: str, user: str) -> bool:
+        if self.model is not None and not self.model.search(model):
+            return False
+        if self.system is not None and not self.system.search(system):
+            return False
+        if self.user is not None and not self.user.search(user):
+            return False
+        return True
+
+
+def load_rules(path: Optional[Path]) -> List[Rule]:
+    if path is None or not path.exists():
+        return []
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    rules = []
+    for entry in raw:
+        rules.append(Rule(
+            response=entry["response"],
+            user=re.compile(entry["user"], re.S) if entry.get("user") else None,
+            system=re.compile(entry["system"], re.S) if entry.get("system") else None,
+            model=re.compile(entry["model"]) if entry.get("model") else None,
+        ))
+    return rules
+
+
+@dataclass
+class FakeConfig:
+    ttft_ms: float = 0.0
+    tokens_per_sec: float = 0.0  # 0 表示不限速
+    slots: int = 0  # 0 表示不限制并发
+    default_tokens: int = 32
+    embed_ms: float = 0.0  # 每个嵌入请求的固定延迟
+    embed_text_ms: float = 0.0  # 每条文本的额外延迟
+    embed_dims: int = 384
+    rules: List[Rule] = field(default_factory=list)
+
+
+# 客户端中途断开连接时写回复会抛出的异常
+_DISCONNECTED = (BrokenPipeError, ConnectionResetError)
+
+
+class Stats:
+    """线程安全的调用统计，供基准脚本通过 /_stats 读取。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.by_endpoint: Dict[str, int] = {}
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.aborted = 0
+
+    def begin(self, endpoint: str, prompt_tokens: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self, completion_tokens: int) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.completion_tokens += completion_tokens
+
+    def abort(self) -> None:
+        """记录一次客户端中途断开的请求（如流式输出时提前关闭连接）。"""
+        with self._lock:
+            self.aborted += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "by_endpoint": dict(self.by_endpoint),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "aborted": self.aborted,
+            }
+
+
+def _message_text(content: Any) -> str:
+    """兼容字符串与 OpenAI 多段 content（[{"type": "text", "text": ...}]）。"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+        )
+    return "" if content is None else str(content)
+
+
+def split_messages(messages: List[Dict[str, Any]]) -> Tuple[str, str, str]:
+    """返回 (system 文本, 最后一条 user 文本, 全部消息文本)。"""
+    system_parts, user, everything = [], "", []
+    for msg in messages or []:
+        text = _message_text(msg.get("content"))
+        everything.append(text)
+        if msg.get("role") == "system":
+            system_parts.append(text)
+        elif msg.get("role") == "user":
+            user = text
+    return "\n".join(system_parts), user, "\n".join(everything)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeModel:
+    """根据配置选择回复文本，并按延迟模型逐 token 产出。"""
+
+    def __init__(self, config: FakeConfig) -> None:
+        self.config = config
+        self._slots = threading.BoundedSemaphore(config.slots) if config.slots > 0 else None
+
+    def reply_for(self, model: str, system: str, user: str, prompt_text: str) -> str:
+        for rule in self.config.rules:
+            if rule.matches(model, system, user):
+                return rule.response
+        digest = hashlib.sha1(f"{model}\0{prompt_text}".encode("utf-8")).digest()
+        words = [_FILLER[digest[i % len(digest)] % len(_FILLER)] for i in range(self.config.default_tokens)]
+        return " ".join(words)
+
+    def embedding(self, text: str) -> List[float]:
+        """词的特征哈希向量（L2 归一化）：确定性，且共享词越多的文本越相似。"""
+        dims = self.config.embed_dims
+        vector = [0.0] * dims
+        for word in re.findall(r"\w+", (text or "").lower()):
+            digest = hashlib.sha1(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % dims] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def acquire(self) -> None:
+        if self._slots is not None:
+            self._slots.acquire()
+
+    def release(self) -> None:
+        if self._slots is not None:
+            self._slots.release()
+
+    def stream(self, text: str) -> Iterator[str]:
+        """按 TTFT 与 tokens/sec 节奏产出 token。"""
+        if self.config.ttft_ms > 0:
+            time.sleep(self.config.ttft_ms / 1000)
+        delay = 1.0 / self.config.tokens_per_sec if self.config.tokens_per_sec > 0 else 0.0
+        for i, token in enumerate(tokenize(text)):
+            if delay and i:
+                time.sleep(delay)
+            yield token
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，便于验证客户端连接复用
+    server: "FakeOllamaServer"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002 - 覆盖基类签名
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # --- 基础读写 ---
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _on_disconnect(self) -> None:
+        # 客户端提前断开（取消请求、只读前几块就关闭连接）：记一次中断并放弃这条连接，不打印异常栈
+        self.server.stats.abort()
+        self.close_connection = True
+
+    # --- 路由 ---
+    def do_GET(self) -> None:
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "fake", "model": "fake", "modified_at": _now_iso(), "size": 0}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/v1/models":
+            self._send_json({"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "fake"}]})
+        elif self.path == "/_stats":
+            self._send_json(self.server.stats.snapshot())
+        elif self.path == "/":
+            self._send_json({"status": "Ollama is running"})
+        else:
+            self._send_json({"error": f"not found: {self.path}"}, status=404)
+
+    def do_POST(self) -> None:
+        try:
+            body = self._read_json()
+        except json.JSONDecodeError as e:
+            self._send_json({"error": f"invalid JSON: {e}"}, status=400)
+            return
+
+        if self.path == "/api/chat":
+            self._handle_ollama(body, chat=True)
+        elif self.path == "/api/generate":
+            self._handle_ollama(body, chat=False)
+        elif self.path == "/v1/chat/completions":
+            self._handle_openai(body)
+        elif self.path == "/api/embed":
+            self._handle_embed(body)
+        elif self.path == "/api/show":
+            self._send_json({
+                "modelfile": "", "parameters": "", "template": "{{ .Prompt }}",
+                "details": {"family": "fake", "parameter_size": "0B"},
+                "model_info": {}, "capabilities": ["completion", "tools"],
+            })
+        elif self.path == "/_stats/reset":
+            self.server.stats.reset()
+            self._send_json({"ok": True})
+        else:
+            self._send_json({"error": f"not found: {self.path}"}, status=404)
+
+    # --- Ollama ---
+    def _handle_ollama(self, body: Dict[str, Any], chat: bool) -> None:
+        model = body.get("model", "fake")
+        if chat:
+            system, user, prompt_text = split_messages(body.get("messages") or [])
+        else:
+            system, user = body.get("system") or "", body.get("prompt") or ""
+            prompt_text = f"{system}\n{user}"
+        stream = body.get("stream", True)  # Ollama 默认流式
+        fake = self.server.model
+        text = fake.reply_for(model, system, user, prompt_text)
+        prompt_tokens = count_tokens(prompt_text)
+        endpoint = "/api/chat" if chat else "/api/generate"
+
+        def chunk(piece: str, done: bool) -> Dict[str, Any]:
+            out: Dict[str, Any] = {"model": model, "created_at": _now_iso(), "done": done}
+            if chat:
+                out["message"] = {"role": "assistant", "content": piece}
+            else:
+                out["response"] = piece
+            return out
+
+        self.server.stats.begin(endpoint, prompt_tokens)
+        fake.acquire()
+        started = time.perf_counter_ns()
+        produced = 0
+        try:
+            if stream:
+                self._start_chunked("application/x-ndjson")
+            pieces = []
+            for token in fake.stream(text):
+                produced += 1
+                if stream:
+                    self._write_chunk((json.dumps(chunk(token, False), ensure_ascii=False) + "\n").encode("utf-8"))
+                else:
+                    pieces.append(token)
+            final = chunk("" if stream else "".join(pieces), True)
+            elapsed = time.perf_counter_ns() - started
+            final.update({
+                "done_reason": "stop",
+                "total_duration": elapsed,
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": 0,
+                "eval_count": produced,
+                "eval_duration": elapsed,
+            })
+            if stream:
+                self._write_chunk((json.dumps(final, ensure_ascii=False) + "\n").encode("utf-8"))
+                self._end_chunked()
+            else:
+                self._send_json(final)
+        except _DISCONNECTED:
+            self._on_disconnect()
+        finally:
+            fake.release()
+            self.server.stats.end(produced)
+
+    def _handle_embed(self, body: Dict[str, Any]) -> None:
+        texts = body.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        fake = self.server.model
+        prompt_tokens = sum(count_tokens(t) for t in texts)
+        self.server.stats.begin("/api/embed", prompt_tokens)
+        fake.acquire()
+        started = time.perf_counter_ns()
+        try:
+            delay = fake.config.embed_ms + fake.config.embed_text_ms * len(texts)
+            if delay > 0:
+                time.sleep(delay / 1000)
+            self._send_json({
+                "model": body.get("model", "fake"),
+                "embeddings": [fake.embedding(t) for t in texts],
+                "total_duration": time.perf_counter_ns() - started,
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+            })
+        except _DISCONNECTED:
+            self._on_disconnect()
+        finally:
+            fake.release()
+            self.server.stats.end(0)
+
+    # --- OpenAI ---
+    def _handle_openai(self, body: Dict[str, Any]) -> None:
+        model = body.get("model", "fake")
+        system, user, prompt_text = split_messages(body.get("messages") or [])
+        stream = bool(body.get("stream", False))
+        fake = self.server.model
+        text = fake.reply_for(model, system, user, prompt_text)
+        prompt_tokens = count_tokens(prompt_text)
+        completion_id = "chatcmpl-" + hashlib.sha1(f"{time.time_ns()}".encode()).hexdigest()[:12]
+        created = int(time.time())
+
+        self.server.stats.begin("/v1/chat/completions", prompt_tokens)
+        fake.acquire()
+        produced = 0
+        try:
+            if not stream:
+                produced = sum(1 for _ in fake.stream(text))
+                self._send_json({
+                    "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": produced,
+                              "total_tokens": prompt_tokens + produced},
+                })
+                return
+
+            def sse(delta: Dict[str, Any], finish: Optional[str] = None) -> bytes:
+                payload = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }
+                return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+            self._start_chunked("text/event-stream")
+            self._write_chunk(sse({"role": "assistant", "content": ""}))
+            for token in fake.stream(text):
+                produced += 1
+                self._write_chunk(sse({"content": token}))
+            self._write_chunk(sse({}, finish="stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": produced,
+                                             "total_tokens": prompt_tokens + produced},
+                }
+                self._write_chunk(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._end_chunked()
+        except _DISCONNECTED:
+            self._on_disconnect()
+        finally:
+            fake.release()
+            self.server.stats.end(produced)
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """可在后台线程中运行的替身服务，便于基准脚本在进程内启动。"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 11434,
+                 config: Optional[FakeConfig] = None, verbose: bool = False) -> None:
+        super().__init__((host, port), FakeOllamaHandler)
+        self.model = FakeModel(config or FakeConfig(rules=load_rules(DEFAULT_SCRIPT)))
+        self.stats = Stats()
+        self.verbose = verbose
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地 Ollama / OpenAI 兼容替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft-ms", type=float, default=0.0, help="首 token 延迟（毫秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="生成速度，0 表示不限速")
+    parser.add_argument("--slots", type=int, default=0, help="并发处理槽位数，0 表示不限制")
+    parser.add_argument("--default-tokens", type=int, default=32, help="未命中脚本时的确定性回复长度")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="每个嵌入请求的固定延迟（毫秒）")
+    parser.add_argument("--embed-text-ms", type=float, default=0.0, help="嵌入请求中每条文本的额外延迟（毫秒）")
+    parser.add_argument("--script", default=str(DEFAULT_SCRIPT), help="回复脚本 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="打印每个请求的访问日志")
+    args = parser.parse_args(argv)
+
+    config = FakeConfig(
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        slots=args.slots,
+        default_tokens=args.default_tokens,
+        embed_ms=args.embed_ms,
+        embed_text_ms=args.embed_text_ms,
+        rules=load_rules(Path(args.script)),
+    )
+    server = FakeOllamaServer(args.host, args.port, config, verbose=args.verbose)
+    print(f"Fake Ollama 服务已启动: {server.url} （{len(config.rules)} 条脚本规则）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
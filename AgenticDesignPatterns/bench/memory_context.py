@@ -0,0 +1,101 @@
+"""
+记忆注入基准：ListMemory（注入全部记忆）与 common/memory.py 的 MemoryIndex（相关性 + token 预算）。
+
+用户记忆从 10 条增长到 1 万条（合成的偏好记录，每个查询对应一条事先埋入的相关记忆），测量：
+- 每次模型调用注入的记忆 token 数：ListMemory 为全部记忆，MemoryIndex 受 token_budget 约束；
+- add() 与挑选的耗时（索引在 add() 时建好，挑选只访问查询词的倒排表）；
+- 埋入的相关记忆是否被选中（命中率）。
+
+不依赖 autogen，直接测量 RelevanceMemory 使用的 MemoryIndex。
+
+运行示例：
+```bash
+python bench/memory_context.py
+python bench/memory_context.py --sizes 10 100 1000 10000 --budget 256 --output memory_context.json
+```
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.history import estimate_tokens  # noqa: E402
+from common.memory import MemoryIndex  # noqa: E402
+
+_TOPICS = "coffee tea hiking cycling jazz opera sushi pasta chess poker python rust gardening sailing yoga".split()
+_CITIES = "Paris Tokyo Berlin Lisbon Denver Austin Oslo Seoul Lima Cairo".split()
+
+
+def _memories(count: int, rng: random.Random) -> List[str]:
+    return [
+        f"Note {i}: the user mentioned {rng.choice(_TOPICS)} while planning a trip to {rng.choice(_CITIES)} "
+        f"and prefers {rng.choice(['short', 'detailed', 'formal', 'casual'])} answers"
+        for i in range(count)
+    ]
+
+
+def _planted(q: int) -> Tuple[str, str]:
+    """(相关记忆, 查询)：记忆中含有查询的关键信息。"""
+    item = f"allergy{q}"
+    return f"The user has a severe {item} and must avoid it in every meal plan", f"Suggest a dinner recipe given my {item}"
+
+
+def bench(size: int, queries: int, budget: int, max_entries: int, seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    texts = _memories(size, rng)
+    planted = [_planted(q) for q in range(queries)]
+    positions = sorted(rng.sample(range(size + queries), queries))
+    for (memory, _), pos in zip(planted, positions):
+        texts.insert(pos, memory)
+
+    index = MemoryIndex()
+    started = time.perf_counter()
+    for text in texts:
+        index.add(text, tokens=estimate_tokens(text) + 2)
+    add_us = (time.perf_counter() - started) / len(texts) * 1e6
+
+    samples, hits, injected = [], 0, []
+    for memory, query in planted:
+        started = time.perf_counter()
+        chosen = index.select(query, token_budget=budget, max_entries=max_entries)
+        samples.append((time.perf_counter() - started) * 1e6)
+        hits += any(texts[row] == memory for row, _ in chosen)
+        injected.append(sum(int(index.tokens[row]) for row, _ in chosen))
+    return {
+        "memories": len(texts),
+        "list_memory_tokens": int(index.tokens[:index.size].sum()),
+        "injected_tokens": round(statistics.mean(injected), 1),
+        "add_us": round(add_us, 2),
+        "select_us": round(statistics.median(samples), 2),
+        "hit_rate": round(hits / queries, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="记忆注入基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="背景记忆条数")
+    parser.add_argument("--queries", type=int, default=50, help="查询次数（每个查询埋入一条相关记忆）")
+    parser.add_argument("--budget", type=int, default=256, help="每次注入的 token 上限")
+    parser.add_argument("--entries", type=int, default=8, help="每次最多注入的条数")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    rows = [bench(size, args.queries, args.budget, args.entries) for size in args.sizes]
+    print(f"{'记忆条数':>10}{'ListMemory 注入':>16}{'相关性注入':>12}{'add(µs)':>10}{'挑选(µs)':>10}{'命中率':>8}")
+    for row in rows:
+        print(f"{row['memories']:>10}{row['list_memory_tokens']:>16}{row['injected_tokens']:>12}"
+              f"{row['add_us']:>10.2f}{row['select_us']:>10.2f}{row['hit_rate']:>8.3f}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
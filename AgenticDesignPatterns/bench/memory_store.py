@@ -0,0 +1,127 @@
+"""
+记忆存储检索基准：LangGraph InMemoryStore 与 common/vectorstore.py 的 VectorMemoryStore。
+
+向一个用户命名空间写入 N 条记忆（默认 5 万），嵌入函数是确定性的替身：每条记忆属于一个主题，
+向量为主题中心加噪声（与真实嵌入一样有聚类结构），不调用任何模型。测量：
+- 写入耗时与嵌入调用次数（VectorMemoryStore 按批嵌入）；
+- 带 / 不带元数据过滤的 top-k 搜索延迟：InMemoryStore、精确打分、IVF 近似索引；
+- IVF 相对精确结果的 recall@k。
+
+运行示例：
+```bash
+python bench/memory_store.py
+python bench/memory_store.py --items 50000 --dims 384 --queries 50 --output memory_store.json
+```
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.vectorstore import VectorMemoryStore  # noqa: E402
+
+NAMESPACE = ("user-1", "memories")
+
+
+class TopicEmbedder:
+    """“topic-<t> item-<i>” -> 主题中心 + 噪声；其他文本按哈希落到某个主题。"""
+
+    def __init__(self, dims: int, topics: int = 256, noise: float = 0.6, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+        self.centers = rng.standard_normal((topics, dims)).astype(np.float32)
+        self.dims, self.noise = dims, noise
+        self.calls: List[int] = []
+
+    def _vector(self, text: str) -> np.ndarray:
+        parts = dict(p.split("-", 1) for p in text.split() if "-" in p)
+        topic = int(parts.get("topic", abs(hash(text)))) % len(self.centers)
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return self.centers[topic] + self.noise * rng.standard_normal(self.dims).astype(np.float32)
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(len(texts))
+        return [self._vector(t).tolist() for t in texts]
+
+
+def _time(func: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="记忆存储检索基准")
+    parser.add_argument("--items", type=int, default=50000, help="命名空间中的记忆条数")
+    parser.add_argument("--dims", type=int, default=384, help="向量维度")
+    parser.add_argument("--queries", type=int, default=30, help="搜索次数")
+    parser.add_argument("--limit", type=int, default=10, help="top-k")
+    parser.add_argument("--skip-baseline", action="store_true", help="不测 InMemoryStore（它的写入与搜索都较慢）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    embed = TopicEmbedder(args.dims)
+    index = {"embed": embed, "dims": args.dims, "fields": ["text"]}
+    values = [
+        {"text": f"topic-{i % 256} item-{i}", "kind": ("preference", "fact", "event")[i % 3]}
+        for i in range(args.items)
+    ]
+    queries = [f"topic-{(q * 37) % 256} query-{q}" for q in range(args.queries)]
+    results: Dict[str, Any] = {"items": args.items, "dims": args.dims, "limit": args.limit}
+
+    stores: Dict[str, Any] = {
+        "exact": VectorMemoryStore(index=index, ann_threshold=args.items + 1),
+        "ivf": VectorMemoryStore(index=index, ann_threshold=min(20000, args.items)),
+    }
+    if not args.skip_baseline:
+        from langgraph.store.memory import InMemoryStore
+
+        stores = {"InMemoryStore": InMemoryStore(index=index), **stores}
+
+    for name, store in stores.items():
+        embed.calls.clear()
+        started = time.perf_counter()
+        for i, value in enumerate(values):
+            store.put(NAMESPACE, f"m{i}", value)
+        if hasattr(store, "flush"):
+            store.flush()
+        put_s = time.perf_counter() - started
+        store.search(NAMESPACE, query=queries[0], limit=args.limit)  # 预热（构建 IVF）
+        row = {
+            "put_s": round(put_s, 2),
+            "embed_calls": len(embed.calls),
+            "search_ms": _time(lambda: [store.search(NAMESPACE, query=q, limit=args.limit) for q in queries], 1) / len(queries),
+            "filtered_search_ms": _time(
+                lambda: [store.search(NAMESPACE, query=q, filter={"kind": "event"}, limit=args.limit) for q in queries], 1
+            ) / len(queries),
+        }
+        results[name] = row
+        print(f"{name:<14} 写入 {row['put_s']:>7.2f}s（{row['embed_calls']} 次嵌入调用）  "
+              f"搜索 {row['search_ms']:>8.3f} ms  带过滤 {row['filtered_search_ms']:>8.3f} ms")
+
+    exact, ivf = stores["exact"], stores["ivf"]
+    hits = expected = 0
+    for q in queries:
+        truth = {r.key for r in exact.search(NAMESPACE, query=q, limit=args.limit)}
+        hits += len(truth & {r.key for r in ivf.search(NAMESPACE, query=q, limit=args.limit)})
+        expected += len(truth)  # 条目少于 limit 时按实际结果数计
+    results["ivf_recall"] = round(hits / expected, 4) if expected else 1.0
+    results["ivf_stats"] = ivf.stats()
+    print(f"IVF recall@{args.limit}: {results['ivf_recall']}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
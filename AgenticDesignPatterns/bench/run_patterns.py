@@ -0,0 +1,325 @@
+"""
+智能体设计模式基准：对每个模式的 LangChain / AutoGen 实现，在本地替身模型上
+以并发 C 运行 N 次，统计延迟分位数、每请求 LLM 调用次数、输入/输出 token 与吞吐。
+
+每次“请求”即该章节 `__main__` 中演示的完整场景（例如 chap02 的三条路由请求）。
+LLM 调用次数与 token 数来自替身服务的 /_stats 增量，按请求数平均。
+
+运行示例：
+```bash
+python bench/run_patterns.py -n 20 -c 4                          # 进程内启动 fake_ollama（临时端口）
+python bench/run_patterns.py --ttft-ms 100 --tokens-per-sec 50 --output bench.json
+python bench/run_patterns.py --patterns routing,tool_use --compare bench.json
+python bench/run_patterns.py --server http://127.0.0.1:11434     # 使用已启动的服务
+```
+
+缺少某个框架的依赖时，对应实现会被标记为 skipped，其余模式照常运行。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from fake_ollama import FakeConfig, FakeOllamaServer, load_rules, DEFAULT_SCRIPT
+
+ROOT = Path(__file__).resolve().parent.parent
+FRAMEWORKS = ("langchain", "autogen")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """一个模式在某个框架下的演示场景：章节文件 + 在模块上执行一次请求的函数。"""
+
+    chapter: str
+    run: Callable[[Any], Any]  # 接收已加载的模块，返回 None 或协程
+
+
+def _lc_chap08_01(mod: Any) -> None:
+    # 每次请求使用独立会话，避免历史在多次运行之间累积
+    session_id = f"bench-{uuid.uuid4().hex}"
+    mod.ask("I want to book a flight.", session_id)
+    mod.ask("My name is Sam, by theway.", session_id)
+    mod.ask("What was my name again?", session_id)
+
+
+PATTERNS: Dict[str, Dict[str, Scenario]] = {
+    "prompt_chaining": {
+        "langchain": Scenario("chap01.py", lambda m: m.main()),
+        "autogen": Scenario("chap01.py", lambda m: m.main()),
+    },
+    "routing": {
+        "langchain": Scenario("chap02.py", lambda m: m.main()),
+        "autogen": Scenario("chap02.py", lambda m: m.main()),
+    },
+    "parallelization": {
+        "langchain": Scenario("chap03.py", lambda m: m.run_parallel_example("太空探索的历史")),
+        "autogen": Scenario("chap03.py", lambda m: m.main()),
+    },
+    "reflection": {
+        "langchain": Scenario("chap04.py", lambda m: m.run_reflection_loop()),
+        "autogen": Scenario("chap04.py", lambda m: m.run_reflection_loop()),
+    },
+    "tool_use": {
+        "langchain": Scenario("chap05.py", lambda m: m.main()),
+        "autogen": Scenario("chap05.py", lambda m: m.main()),
+    },
+    "planning": {
+        "langchain": Scenario("chap06.py", lambda m: m.main()),
+        "autogen": Scenario("chap06.py", lambda m: m.main()),
+    },
+    "multi_agent": {
+        "langchain": Scenario("chap07.py", lambda m: m.main()),
+        "autogen": Scenario("chap07.py", lambda m: m.main()),
+    },
+    "memory": {
+        "langchain": Scenario("chap08_01.py", _lc_chap08_01),
+        "autogen": Scenario("chap08.py", lambda m: m.main()),
+    },
+    "goal_monitoring": {
+        "langchain": Scenario("chap11.py", lambda m: m.run_code_agent(
+            "编写代码以查找给定正整数的二进制间距",
+            "代码易于理解，功能正确，处理全面的边缘情况，仅接受正整数输入，并用少量示例打印结果",
+        )),
+    },
+}
+
+
+def load_chapter(framework: str, chapter: str) -> Any:
+    """按文件路径加载章节模块；两个框架的章节同名，因此使用带前缀的模块名。"""
+    path = ROOT / framework / chapter
+    name = f"bench_{framework}_{path.stem}"
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(name, None)
+        raise
+    return module
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值分位数，q 取 0-100。"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def fetch_stats(server_url: str) -> Optional[Dict[str, Any]]:
+    try:
+        with urllib.request.urlopen(f"{server_url}/_stats", timeout=5) as resp:
+            return json.load(resp)
+    except Exception:
+        return None  # 真实 Ollama 没有 /_stats，此时不统计调用与 token
+
+
+async def _drive(scenario: Scenario, module: Any, requests: int, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # 同步场景放到线程里执行，避免阻塞事件循环；异步场景返回的协程回到本循环中等待
+                out = await asyncio.to_thread(scenario.run, module)
+                if asyncio.iscoroutine(out):
+                    await out
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return {"latencies": latencies, "errors": errors, "wall": time.perf_counter() - started}
+
+
+async def bench_one(framework: str, scenario: Scenario, server_url: str,
+                    requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    try:
+        module = load_chapter(framework, scenario.chapter)
+    except Exception as e:
+        return {"chapter": f"{framework}/{scenario.chapter}", "skipped": f"{type(e).__name__}: {e}"}
+
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        if warmup:
+            # 预热：触发延迟导入与模型创建，不计入统计
+            warm = await _drive(scenario, module, warmup, 1)
+            if warm["errors"] and not warm["latencies"]:
+                return {"chapter": f"{framework}/{scenario.chapter}", "skipped": warm["errors"][0]}
+        before = fetch_stats(server_url)
+        run = await _drive(scenario, module, requests, concurrency)
+        after = fetch_stats(server_url)
+
+    lat = sorted(run["latencies"])
+    ok = len(lat)
+    result: Dict[str, Any] = {
+        "chapter": f"{framework}/{scenario.chapter}",
+        "requests": requests,
+        "ok": ok,
+        "errors": len(run["errors"]),
+        "p50_ms": round(percentile(lat, 50) * 1000, 2),
+        "p95_ms": round(percentile(lat, 95) * 1000, 2),
+        "p99_ms": round(percentile(lat, 99) * 1000, 2),
+        "mean_ms": round(sum(lat) / ok * 1000, 2) if ok else 0.0,
+        "rps": round(ok / run["wall"], 3) if run["wall"] > 0 else 0.0,
+    }
+    if run["errors"]:
+        result["first_error"] = run["errors"][0]
+    if before is not None and after is not None and requests:
+        result["llm_calls_per_request"] = round((after["requests"] - before["requests"]) / requests, 3)
+        result["tokens_in_per_request"] = round((after["prompt_tokens"] - before["prompt_tokens"]) / requests, 1)
+        result["tokens_out_per_request"] = round((after["completion_tokens"] - before["completion_tokens"]) / requests, 1)
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_table(results: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+    cols = ("p50_ms", "p95_ms", "p99_ms", "rps", "llm_calls_per_request", "tokens_in_per_request", "tokens_out_per_request")
+    heads = ("p50", "p95", "p99", "rps", "calls", "tok_in", "tok_out")
+    print(f"\n{'pattern':<18}{'framework':<11}" + "".join(f"{h:>10}" for h in heads))
+    for pattern, by_fw in results.items():
+        for fw in FRAMEWORKS:
+            if fw not in by_fw:
+                continue
+            r = by_fw[fw]
+            if "skipped" in r:
+                print(f"{pattern:<18}{fw:<11}  skipped: {r['skipped'][:70]}")
+                continue
+            cells = "".join(f"{r.get(c, '-'):>10}" for c in cols)
+            suffix = f"  ({r['errors']} errors)" if r["errors"] else ""
+            print(f"{pattern:<18}{fw:<11}{cells}{suffix}")
+
+
+def print_comparison(results: Dict[str, Any], baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))["results"]
+    print(f"\n与 {baseline_path}（{'/'.join(FRAMEWORKS)}）对比：p50 与 rps 的相对变化")
+    for pattern, by_fw in results.items():
+        for fw, r in by_fw.items():
+            old = baseline.get(pattern, {}).get(fw)
+            if not old or "skipped" in r or "skipped" in old or not old.get("p50_ms") or not old.get("rps"):
+                continue
+            dp50 = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            drps = (r["rps"] - old["rps"]) / old["rps"] * 100
+            print(f"{pattern:<18}{fw:<11} p50 {dp50:+7.1f}%   rps {drps:+7.1f}%")
+
+
+async def bench_all(patterns: List[str], frameworks: List[str], server_url: str,
+                    requests: int, concurrency: int, warmup: int) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    # 所有模式共用一个事件循环：共享的异步连接池绑定在创建它的循环上
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for pattern in patterns:
+        for fw in frameworks:
+            scenario = PATTERNS[pattern].get(fw)
+            if scenario is None:
+                continue
+            print(f"运行 {pattern} / {fw} ...", file=sys.stderr)
+            results.setdefault(pattern, {})[fw] = await bench_one(
+                fw, scenario, server_url, requests, concurrency, warmup
+            )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="智能体设计模式延迟/吞吐基准")
+    parser.add_argument("-n", "--requests", type=int, default=10, help="每个实现的请求次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=2, help="并发度")
+    parser.add_argument("--warmup", type=int, default=1, help="预热次数（不计入统计）")
+    parser.add_argument("--patterns", help="逗号分隔的模式名，默认全部：" + ",".join(PATTERNS))
+    parser.add_argument("--frameworks", default=",".join(FRAMEWORKS), help="langchain,autogen")
+    parser.add_argument("--server", help="使用已运行的服务地址；不传则在进程内启动 fake_ollama")
+    parser.add_argument("--ttft-ms", type=float, default=20.0, help="进程内替身服务的首 token 延迟")
+    parser.add_argument("--tokens-per-sec", type=float, default=500.0, help="进程内替身服务的生成速度")
+    parser.add_argument("--slots", type=int, default=0, help="进程内替身服务的并发槽位（0 不限制）")
+    parser.add_argument("--output", help="结果 JSON 路径")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args(argv)
+
+    patterns = args.patterns.split(",") if args.patterns else list(PATTERNS)
+    unknown = [p for p in patterns if p not in PATTERNS]
+    if unknown:
+        parser.error(f"未知模式: {', '.join(unknown)}")
+    frameworks = [f for f in args.frameworks.split(",") if f]
+
+    server = None
+    server_url = args.server
+    fake_config = None
+    if server_url is None:
+        fake_config = FakeConfig(
+            ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec, slots=args.slots,
+            rules=load_rules(DEFAULT_SCRIPT),
+        )
+        server = FakeOllamaServer("127.0.0.1", 0, fake_config).start()
+        server_url = server.url
+    # 所有客户端都在首次调用时创建，因此在此设置即可生效
+    os.environ["OLLAMA_HOST"] = server_url
+    os.environ.setdefault("OPENAI_BASE_URL", f"{server_url}/v1")
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    workdir = tempfile.TemporaryDirectory(prefix="adp-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir.name)  # chap11 会把生成的代码写入当前目录
+    try:
+        results = asyncio.run(bench_all(
+            patterns, frameworks, server_url, args.requests, args.concurrency, args.warmup
+        ))
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+        if server is not None:
+            server.stop()
+
+    print_table(results)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "server": args.server or "in-process fake_ollama",
+            "ttft_ms": fake_config.ttft_ms if fake_config else None,
+            "tokens_per_sec": fake_config.tokens_per_sec if fake_config else None,
+            "slots": fake_config.slots if fake_config else None,
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已写入 {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
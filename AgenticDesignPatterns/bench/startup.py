@@ -0,0 +1,117 @@
+"""
+冷启动基准：用 `python -X importtime` 测量每个章节脚本的顶层导入耗时。
+
+各章节把 langchain_core / crewai / nest_asyncio / autogen_* 等重型依赖
+推迟到第一次调用时才导入，因此“导入章节模块”本身应当很快。
+本脚本在独立子进程中逐个导入章节模块，解析 importtime 输出中该模块的
+cumulative 耗时，并与预算比较；任一章节超出预算时退出码为 1。
+
+运行示例：
+```bash
+python bench/startup.py                       # 默认预算 100ms
+python bench/startup.py --budget-ms 50 --repeat 5 --output startup.json
+```
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+CHAPTER_DIRS = ("langchain", "autogen")
+
+
+def discover_chapters() -> List[Path]:
+    chapters: List[Path] = []
+    for name in CHAPTER_DIRS:
+        chapters.extend(sorted((ROOT / name).glob("chap*.py")))
+    return chapters
+
+
+def parse_importtime(stderr: str, module: str) -> Optional[int]:
+    """从 importtime 输出中取出指定模块的 cumulative 耗时（微秒）。"""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        # 格式：import time: self [us] | cumulative | imported package
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or parts[2].strip() != module:
+            continue
+        try:
+            return int(parts[1].strip())
+        except ValueError:
+            return None
+    return None
+
+
+def measure(chapter: Path) -> Dict[str, float]:
+    """在新解释器中导入一次章节模块，返回导入耗时与进程总耗时（毫秒）。"""
+    module = chapter.stem
+    code = f"import sys; sys.path.insert(0, {str(chapter.parent)!r}); import {module}"
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=str(chapter.parent),
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        last = proc.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        raise RuntimeError(f"导入 {chapter.relative_to(ROOT)} 失败: {last[0]}")
+    cumulative_us = parse_importtime(proc.stderr, module)
+    if cumulative_us is None:
+        raise RuntimeError(f"importtime 输出中未找到模块 {module}")
+    return {"import_ms": cumulative_us / 1000, "process_ms": wall_ms}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="章节脚本冷启动（导入耗时）基准")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="每个章节的导入耗时预算（毫秒）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个章节测量次数，取中位数")
+    parser.add_argument("--output", help="可选：将结果写入 JSON 文件，便于跨提交对比")
+    parser.add_argument("chapters", nargs="*", help="可选：只测指定脚本，如 langchain/chap01.py")
+    args = parser.parse_args(argv)
+
+    chapters = [ROOT / c for c in args.chapters] if args.chapters else discover_chapters()
+
+    results = []
+    over_budget = False
+    print(f"{'chapter':<24}{'import(ms)':>12}{'process(ms)':>14}  status")
+    for chapter in chapters:
+        name = str(chapter.relative_to(ROOT))
+        try:
+            runs = [measure(chapter) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            print(f"{name:<24}{'-':>12}{'-':>14}  ERROR {e}")
+            results.append({"chapter": name, "error": str(e)})
+            over_budget = True
+            continue
+
+        import_ms = statistics.median(r["import_ms"] for r in runs)
+        process_ms = statistics.median(r["process_ms"] for r in runs)
+        ok = import_ms <= args.budget_ms
+        over_budget = over_budget or not ok
+        print(f"{name:<24}{import_ms:>12.1f}{process_ms:>14.1f}  {'ok' if ok else 'OVER'}")
+        results.append({
+            "chapter": name,
+            "import_ms": round(import_ms, 3),
+            "process_ms": round(process_ms, 3),
+            "within_budget": ok,
+        })
+
+    if args.output:
+        report = {"budget_ms": args.budget_ms, "python": sys.version.split()[0], "results": results}
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已写入 {args.output}")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
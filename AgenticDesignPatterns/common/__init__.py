@@ -0,0 +1,14 @@
+"""
+智能体设计模式示例共用的辅助模块。
+
+langchain/ 与 autogen/ 下的章节脚本通过把 AgenticDesignPatterns 目录加入
+sys.path 来导入本包，例如：
+
+```python
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model
+```
+"""
@@ -0,0 +1,138 @@
+"""
+Autogen 的相关性记忆：实现 autogen_core.memory.Memory 接口，可直接替换 ListMemory。
+
+ListMemory.update_context 把全部记忆按时间顺序注入；RelevanceMemory 用 common/memory.py 的
+MemoryIndex，以上下文中最后一条用户消息为查询，只注入最相关、且总量不超过 token_budget 的若干条：
+- add() 时建好 BM25 倒排表（以及可选的嵌入向量），查询时不再逐条扫描文本；
+- 提供 embedder（common/embeddings.py 的 EmbeddingService）时加入语义相似度，记忆与查询没有共同词也能命中；
+- query() 返回按相关性排序的记忆，分数写在 metadata["score"] 中。
+
+通过环境变量配置（见 build_memory）：
+- MEMORY_TOKENS: 每次注入的记忆 token 上限（默认 256）。
+- MEMORY_ENTRIES: 每次最多注入的条数（默认 8）。
+- MEMORY_EMBED: 设为 "on" 时使用共享的嵌入服务（get_embedding_service）计算语义相似度。
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from autogen_core import CancellationToken
+from autogen_core.memory import Memory, MemoryContent, MemoryQueryResult, UpdateContextResult
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import SystemMessage, UserMessage
+
+from .history import estimate_tokens
+from .memory import MemoryIndex
+from .messages import message_text
+
+
+def content_text(content: MemoryContent) -> str:
+    """参与排序与注入的文本；图片等非文本记忆返回空字符串（不会被注入）。"""
+    value = content.content
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return ""
+
+
+class RelevanceMemory(Memory):
+    """按与当前任务的相关性、在 token 预算内注入记忆的 Memory。"""
+
+    component_type = "memory"
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        token_budget: int = 256,
+        max_entries: int = 8,
+        min_score: float = 0.0,
+        embedder: Any = None,
+        embed_weight: float = 0.5,
+    ) -> None:
+        self._name = name or "relevance_memory"
+        self.token_budget = token_budget
+        self.max_entries = max_entries
+        self.min_score = min_score
+        self._embedder = embedder
+        self._contents: List[MemoryContent] = []
+        self._index = MemoryIndex(embed_weight=embed_weight)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def content(self) -> List[MemoryContent]:
+        return list(self._contents)
+
+    async def _vector(self, text: str) -> Any:
+        if self._embedder is None or not text:
+            return None
+        return (await self._embedder.avectors([text]))[0]
+
+    async def add(self, content: MemoryContent, cancellation_token: CancellationToken | None = None) -> None:
+        text = content_text(content)
+        # 注入时每条记忆前还有序号与换行，约多 2 个 token
+        self._index.add(text, await self._vector(text), tokens=estimate_tokens(text) + 2)
+        self._contents.append(content)
+
+    async def query(
+        self,
+        query: str | MemoryContent = "",
+        cancellation_token: CancellationToken | None = None,
+        **kwargs: Any,
+    ) -> MemoryQueryResult:
+        """按相关性返回记忆；kwargs 可临时覆盖 token_budget / max_entries / min_score。"""
+        text = query if isinstance(query, str) else content_text(query)
+        if not text or not self._contents:
+            return MemoryQueryResult(results=[])
+        chosen = self._index.select(
+            text,
+            await self._vector(text),
+            token_budget=kwargs.get("token_budget", self.token_budget),
+            max_entries=kwargs.get("max_entries", self.max_entries),
+            min_score=kwargs.get("min_score", self.min_score),
+        )
+        results = []
+        for row, score in chosen:
+            content = self._contents[row]
+            metadata = {**(content.metadata or {}), "score": round(score, 4)}
+            results.append(content.model_copy(update={"metadata": metadata}))
+        return MemoryQueryResult(results=results)
+
+    async def update_context(self, model_context: ChatCompletionContext) -> UpdateContextResult:
+        messages = await model_context.get_messages()
+        task = next((message_text(m) for m in reversed(messages) if isinstance(m, UserMessage)), "")
+        result = await self.query(task)
+        if result.results:
+            lines = [f"{i}. {content_text(memory)}" for i, memory in enumerate(result.results, 1)]
+            memory_context = "\nRelevant memory content (most relevant first):\n" + "\n".join(lines) + "\n"
+            await model_context.add_message(SystemMessage(content=memory_context))
+        return UpdateContextResult(memories=result)
+
+    async def clear(self) -> None:
+        self._contents = []
+        self._index.clear()
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return self._index.stats()
+
+
+def build_memory(name: Optional[str] = None) -> RelevanceMemory:
+    """按环境变量创建 RelevanceMemory（见模块说明）。"""
+    embedder = None
+    if os.getenv("MEMORY_EMBED", "off").lower() == "on":
+        from .embeddings import get_embedding_service
+
+        embedder = get_embedding_service()
+    return RelevanceMemory(
+        name,
+        token_budget=int(os.getenv("MEMORY_TOKENS", "256")),
+        max_entries=int(os.getenv("MEMORY_ENTRIES", "8")),
+        embedder=embedder,
+    )
@@ -0,0 +1,251 @@
+"""
+并发单提示调用的微批处理。
+
+MicroBatcher 在一个很短的时间窗口（默认 10 ms）内收集并发请求，然后把整批交给 dispatch：
+- dispatch 背后是真正的批量接口时（如 common/embeddings.py 一次请求嵌入多条文本），合批减少模型调用次数；
+- coalesce=True 时，窗口内完全相同的输入只派发一次，结果分发给所有等待者（合并）；
+- 达到 max_batch 时不等窗口结束立即派发。
+
+对话模型（chap05 用 asyncio.gather 并发跑多个查询）没有批量接口：Ollama / OpenAI 的对话接口
+不接受多段对话的批量请求，abatch 只是并发的 ainvoke。batched() / BatchedModelClient 仍按窗口合批
+（一批一次 abatch / gather，每批不超过 max_batch），但请求数不会因此减少；减少请求数靠合并相同的提示。
+合批与合并分开控制：温度大于 0 时合并会把同一次采样结果交给多个调用方，改变结果，
+所以只在模型温度为 0、或显式设置 LLM_BATCH_COALESCE=on 时合并；其余情况照常合批、不去重。
+
+只在异步路径上批处理；同步 invoke 原样直通。
+
+通过环境变量配置（见 get_batch_settings）：
+- LLM_BATCH_WINDOW_MS: 收集窗口毫秒数（默认 10）；设为 0 关闭微批处理。
+- LLM_BATCH_MAX: 每批最多请求数（默认 16）。
+- LLM_BATCH_COALESCE: "on" 时即使温度大于 0 也合并相同的提示（调用方会拿到同一个采样结果）；
+  "off" 时从不合并（仍合批）；不设置时只对温度为 0 的模型合并。
+"""
+
+import os
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+Dispatch = Callable[[List[Any]], Awaitable[Sequence[Any]]]
+
+
+def _default_key(item: Any) -> str:
+    return repr(item)
+
+
+class _LoopState:
+    """单个事件循环上的待派发请求；Future 与定时器都绑定在该循环上。"""
+
+    __slots__ = ("pending", "timer")
+
+    def __init__(self) -> None:
+        self.pending: List[Tuple[Any, Any, float]] = []  # (输入, future, 入队时间)
+        self.timer = None
+
+
+class MicroBatcher:
+    """在时间窗口内收集请求并批量派发；dispatch(输入列表) 须按顺序返回等长的结果列表。
+
+    结果列表中的异常实例会被当作对应请求的异常抛给调用方。
+    coalesce=True 时按 key 合并完全相同的输入（只适用于确定性的 dispatch）。
+    """
+
+    def __init__(
+        self,
+        dispatch: Dispatch,
+        window_ms: float = 10.0,
+        max_batch: int = 16,
+        key: Callable[[Any], str] = _default_key,
+        coalesce: bool = False,
+    ) -> None:
+        if max_batch <= 0:
+            raise ValueError("max_batch 必须为正整数")
+        self.dispatch = dispatch
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.key = key
+        self.coalesce = coalesce
+        self._lock = threading.Lock()
+        self._states: "weakref.WeakKeyDictionary[Any, _LoopState]" = weakref.WeakKeyDictionary()
+        self._stats = {"requests": 0, "batches": 0, "dispatched": 0, "coalesced": 0, "max_batch_size": 0, "queue_ms_total": 0.0}
+
+    def _state(self, loop: Any) -> _LoopState:
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    async def submit(self, item: Any) -> Any:
+        """提交一个请求，等待它所在批次派发完成后返回对应结果。"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        state = self._state(loop)
+        state.pending.append((item, future, time.perf_counter()))
+        if len(state.pending) >= self.max_batch:
+            self._flush(loop)
+        elif state.timer is None:
+            state.timer = loop.call_later(self.window, self._flush, loop)
+        return await future
+
+    def _flush(self, loop: Any) -> None:
+        state = self._state(loop)
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        batch, state.pending = state.pending, []
+        if batch:
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, Any, float]]) -> None:
+        started = time.perf_counter()
+        # 合并完全相同的输入：同一个键只派发一次；不合并时每个请求各占一个键
+        groups: Dict[Any, List[Any]] = {}
+        unique: List[Any] = []
+        for i, (item, future, _) in enumerate(batch):
+            k = self.key(item) if self.coalesce else i
+            if k not in groups:
+                groups[k] = []
+                unique.append((k, item))
+            groups[k].append(future)
+        with self._lock:
+            self._stats["requests"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["dispatched"] += len(unique)
+            self._stats["coalesced"] += len(batch) - len(unique)
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(unique))
+            self._stats["queue_ms_total"] += sum((started - queued) * 1000 for _, _, queued in batch)
+        try:
+            results = list(await self.dispatch([item for _, item in unique]))
+            if len(results) != len(unique):
+                raise RuntimeError(f"dispatch 返回 {len(results)} 个结果，期望 {len(unique)} 个")
+        except Exception as exc:  # 整批失败：每个等待者都收到同一个异常
+            results = [exc] * len(unique)
+        except BaseException:
+            # 派发任务被取消（如事件循环关闭）：取消等待者，让取消继续传播，而不是当作结果交给它们
+            for futures in groups.values():
+                for future in futures:
+                    future.cancel()
+            raise
+        for (k, _), result in zip(unique, results):
+            for future in groups[k]:
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        queue_ms = out.pop("queue_ms_total")
+        out["avg_batch_size"] = round(out["dispatched"] / out["batches"], 3) if out["batches"] else 0.0
+        out["avg_queue_ms"] = round(queue_ms / out["requests"], 3) if out["requests"] else 0.0
+        return out
+
+
+def get_batch_settings() -> Tuple[float, int]:
+    """从环境变量读取 (窗口毫秒数, 每批上限)。"""
+    return float(os.getenv("LLM_BATCH_WINDOW_MS", "10")), int(os.getenv("LLM_BATCH_MAX", "16"))
+
+
+def coalesce_enabled(temperature: Optional[float]) -> bool:
+    """是否合并相同的提示：LLM_BATCH_COALESCE=on/off 显式指定，否则只在温度为 0 时合并。"""
+    setting = (os.getenv("LLM_BATCH_COALESCE") or "").strip().lower()
+    if setting in ("on", "off"):
+        return setting == "on"
+    return temperature == 0
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[int, MicroBatcher] = {}  # id(runnable) -> 批处理器；runnable 被回收时由 weakref.finalize 移除
+
+
+def batched(runnable: Any, window_ms: Optional[float] = None, max_batch: Optional[int] = None):
+    """把模型（或任意 Runnable）包装成异步调用时按窗口合批的 Runnable。
+
+    同一个 runnable 对象多次包装时共用同一个批处理器，因此共享同一模型的多条链
+    （例如决策链与汇总链）的并发请求落进同一批。合并安全时（见 coalesce_enabled）批内相同的请求只派发一次，
+    否则照常派发、不去重。窗口为 0 时直接返回原 runnable，不增加等待。
+    """
+    default_window, default_max = get_batch_settings()
+    window_ms = default_window if window_ms is None else window_ms
+    max_batch = default_max if max_batch is None else max_batch
+    if window_ms <= 0:
+        return runnable
+
+    from langchain_core.runnables import RunnableLambda
+
+    with _shared_lock:
+        batcher = _shared.get(id(runnable))
+        if batcher is None:
+            ref = weakref.ref(runnable)  # 批处理器不持有 runnable，runnable 被回收后条目随之移除
+
+            async def dispatch(items: List[Tuple[Any, Any]]) -> List[Any]:
+                # 每个请求带着各自的 config（回调、tags、run_name）派发；合并的请求沿用第一个调用方的 config
+                return await ref().abatch([i for i, _ in items], [c for _, c in items], return_exceptions=True)
+
+            coalesce = coalesce_enabled(getattr(runnable, "temperature", None))
+            batcher = MicroBatcher(dispatch, window_ms, max_batch, key=lambda item: _default_key(item[0]), coalesce=coalesce)
+            _shared[id(runnable)] = batcher
+            weakref.finalize(runnable, _shared.pop, id(runnable), None)
+
+    def _invoke(inputs: Any, config: Any = None) -> Any:
+        return runnable.invoke(inputs, config)
+
+    async def _ainvoke(inputs: Any, config: Any = None) -> Any:
+        return await batcher.submit((inputs, config))
+
+    wrapped = RunnableLambda(_invoke, afunc=_ainvoke, name="micro_batched")
+    wrapped.batcher = batcher  # 便于示例读取 stats()
+    return wrapped
+
+
+class BatchedModelClient:
+    """Autogen ChatCompletionClient 的代理：按窗口合批并发的 create() 调用，其余属性与方法原样转发。
+
+    temperature 是客户端的采样温度（autogen 客户端不公开该参数，由调用方给出）；
+    合并安全时（见 coalesce_enabled）批内相同的调用只派发一次，否则只合批不去重。窗口为 0 时 create() 直接转发。
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        temperature: Optional[float] = None,
+    ) -> None:
+        default_window, default_max = get_batch_settings()
+        self._client = client
+        self.batcher = MicroBatcher(
+            self._dispatch,
+            default_window if window_ms is None else window_ms,
+            default_max if max_batch is None else max_batch,
+            key=self._key,
+            coalesce=coalesce_enabled(temperature),
+        )
+        self.enabled = self.batcher.window > 0
+
+    @staticmethod
+    def _key(item: Tuple[Any, Dict[str, Any]]) -> str:
+        messages, kwargs = item
+        # cancellation_token 每次调用都不同，不参与合并判断
+        return repr((messages, sorted((k, repr(v)) for k, v in kwargs.items() if k != "cancellation_token")))
+
+    async def _dispatch(self, items: List[Tuple[Any, Dict[str, Any]]]) -> List[Any]:
+        import asyncio
+
+        return await asyncio.gather(
+            *(self._client.create(messages, **kwargs) for messages, kwargs in items), return_exceptions=True
+        )
+
+    async def create(self, messages: Any, **kwargs: Any) -> Any:
+        if not self.enabled:
+            return await self._client.create(messages, **kwargs)
+        return await self.batcher.submit((messages, kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
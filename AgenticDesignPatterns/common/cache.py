@@ -0,0 +1,167 @@
+"""
+精确匹配的 LLM 响应缓存。
+
+基于 LangChain 的 BaseCache 扩展点：聊天模型在每次调用前会用
+(序列化后的消息, 模型及其参数的字符串) 查询缓存，命中时直接返回，不再请求模型服务。
+因此把缓存交给模型（ChatOllama(cache=...)，或 build_model 自动注入）后，
+任何 `prompt | llm | StrOutputParser()` 链都能透明地使用它。
+
+两级结构：
+- 内存 LRU：OrderedDict，按条目数上限淘汰，可选 TTL；
+- 可选的 SQLite 持久层（开启 mmap），进程重启后仍可命中，命中后回填内存层。
+
+通过环境变量启用（见 get_response_cache）：
+- LLM_CACHE: 不设置或 "off" 时关闭；"memory" 仅使用内存；其他值视为 SQLite 文件路径。
+- LLM_CACHE_SIZE: 内存层最大条目数（默认 1024）。
+- LLM_CACHE_TTL: 条目有效期秒数（默认不过期）。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+
+def _cache_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache(BaseCache):
+    """带 LRU 淘汰、TTL 与可选 SQLite 持久层的精确匹配缓存。"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        if max_entries <= 0:
+            raise ValueError("max_entries 必须为正整数")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, RETURN_VAL_TYPE]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0, "expired": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA mmap_size=268435456")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def _remember(self, key: str, created: float, value: RETURN_VAL_TYPE) -> None:
+        """写入内存层并按 LRU 淘汰；调用方需持有锁。"""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = _cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute("SELECT created, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    created, raw = row
+                    if not self._expired(created, now):
+                        with warnings.catch_warnings():
+                            # 数据由本缓存自己写入；忽略 loads 的 beta / 默认参数提示
+                            warnings.simplefilter("ignore")
+                            value = loads(raw)
+                        self._remember(key, created, value)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = _cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, return_val)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, created, value) VALUES (?, ?, ?)",
+                    (key, now, dumps(return_val)),
+                )
+                self._db.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    # 内存命中只需微秒级，直接在当前协程中完成，不再切换到线程池。
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear(**kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中等计数，以及当前内存层条目数与命中率。"""
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["size"] = len(self._memory)
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / total, 4) if total else 0.0
+        return out
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, Optional[ResponseCache]] = {}
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """按环境变量返回进程内共享的响应缓存；未启用时返回 None。"""
+    if "cache" not in _shared:
+        with _shared_lock:
+            if "cache" not in _shared:
+                setting = (os.getenv("LLM_CACHE") or "").strip()
+                if not setting or setting.lower() == "off":
+                    _shared["cache"] = None
+                else:
+                    ttl = os.getenv("LLM_CACHE_TTL")
+                    _shared["cache"] = ResponseCache(
+                        max_entries=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+                        ttl=float(ttl) if ttl else None,
+                        path=None if setting.lower() == "memory" else setting,
+                    )
+    return _shared["cache"]
@@ -0,0 +1,479 @@
+"""
+持久化、按窗口读取的会话历史。
+
+chap08_01 原先把会话放在模块级 dict 的 InMemoryChatMessageHistory 里：从不淘汰、重启即丢，
+每轮还要把整段历史交给提示。这里换成磁盘上的追加日志 + 索引：
+
+- 段文件：消息记录（一行 JSON）追加写入 segment-XXXXXX.log，单个段超过 segment_bytes 后滚动到新段；
+  所有会话共用段文件，每条记录带会话 id 与序号。只追加、从不改写，clear() 只在索引里前移起点。
+- SQLite 索引：messages(session, seq) 主键（WITHOUT ROWID，同一会话的记录在索引中相邻）记录
+  每条消息所在的段、偏移、长度、估算 token 数与所属轮次；sessions 表记录每个会话的下一个序号、轮次与起点。
+- 窗口读取：window(session, max_turns, max_tokens) 沿主键倒序遍历，满足最近 K 轮 / token 预算即停止，
+  再按偏移 pread 这几条记录——读取量只与窗口大小有关，与历史总长无关。
+- 热会话 LRU：最近使用的 hot_sessions 个会话在内存中保留会话元数据与最近 hot_messages 条消息，
+  窗口落在这段尾部内时完全不访问磁盘；淘汰的会话只是从内存中移除，数据都在磁盘上。
+  因此内存占用只取决于 hot_sessions × hot_messages，与会话总数（10 万+）无关。
+
+同一目录只应由一个进程写入（段偏移由进程内分配）；进程内多线程安全。
+
+WindowedChatHistory 是 LangChain BaseChatMessageHistory 的实现，可直接交给 RunnableWithMessageHistory；
+它的 messages 只返回窗口内的消息，因此每轮拼装提示的开销是 O(窗口) 而不是 O(历史)。
+HistoryRenderer 再按会话缓存渲染好的历史文本，每轮只为新增的消息生成文本、估算 token。
+
+通过环境变量配置（见 get_chat_store / get_session_history）：
+- CHAT_HISTORY: 存储目录（默认 .chat_history）；"off" 时退回进程内、不做窗口的 InMemoryChatMessageHistory。
+- CHAT_HISTORY_TURNS: 每次提示带上的最近轮数（默认 10，0 表示不限）。
+- CHAT_HISTORY_TOKENS: 历史部分的估算 token 上限（默认不限）。
+- CHAT_HISTORY_HOT: 内存中保留的热会话数（默认 1024）。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from .history import estimate_tokens
+
+_SEGMENT_NAME = "segment-{:06d}.log"
+
+# (seq, turn, tokens, message) —— 热会话尾部与窗口读取共用的记录形式
+_Entry = Tuple[int, int, int, Dict[str, Any]]
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """一条消息（message_to_dict 的结果）按 "type: content" 渲染后的估算 token 数。"""
+    data = message.get("data") or {}
+    content = data.get("content", "")
+    if not isinstance(content, str):
+        content = str(content)
+    return estimate_tokens(f"{message.get('type', '')}: {content}")
+
+
+class _HotSession:
+    __slots__ = ("next_seq", "turn", "floor", "tail")
+
+    def __init__(self, next_seq: int, turn: int, floor: int, tail_size: int) -> None:
+        self.next_seq = next_seq
+        self.turn = turn
+        self.floor = floor  # 小于该序号的消息已被 clear()
+        self.tail: Deque[_Entry] = deque(maxlen=tail_size)
+
+
+class ChatLogStore:
+    """追加写的段文件 + SQLite 索引 + 热会话 LRU。"""
+
+    def __init__(
+        self,
+        path: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        hot_sessions: int = 1024,
+        hot_messages: int = 64,
+        max_open_segments: int = 16,
+    ) -> None:
+        if hot_sessions <= 0 or hot_messages <= 0:
+            raise ValueError("hot_sessions 与 hot_messages 必须为正整数")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.hot_sessions = hot_sessions
+        self.hot_messages = hot_messages
+        self.max_open_segments = max_open_segments
+        self._lock = threading.RLock()
+        self._hot: "OrderedDict[str, _HotSession]" = OrderedDict()
+        self._readers: "OrderedDict[int, int]" = OrderedDict()  # 段号 -> 只读 fd（LRU）
+        self._stats = {
+            "appends": 0, "windows": 0, "hot_hits": 0, "disk_reads": 0, "records_read": 0,
+            "loads": 0, "evictions": 0, "segments_rolled": 0,
+        }
+
+        self._db = sqlite3.connect(str(self.path / "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA cache_size=-8192")  # 页缓存上限约 8MB，与会话数无关
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages (session TEXT NOT NULL, seq INTEGER NOT NULL, turn INTEGER NOT NULL, "
+            "segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, tokens INTEGER NOT NULL, "
+            "PRIMARY KEY (session, seq)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session TEXT PRIMARY KEY, next_seq INTEGER NOT NULL, "
+            "turn INTEGER NOT NULL, floor INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+        segments = sorted(self.path.glob("segment-*.log"))
+        self._segment = int(segments[-1].stem.split("-")[1]) if segments else 0
+        self._writer = self._open_writer(self._segment)
+        self._offset = os.fstat(self._writer).st_size
+
+    # ---- 段文件 ----
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path / _SEGMENT_NAME.format(segment)
+
+    def _open_writer(self, segment: int) -> int:
+        return os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _reader(self, segment: int) -> int:
+        fd = self._readers.get(segment)
+        if fd is not None:
+            self._readers.move_to_end(segment)
+            return fd
+        fd = os.open(self._segment_path(segment), os.O_RDONLY)
+        self._readers[segment] = fd
+        while len(self._readers) > self.max_open_segments:
+            os.close(self._readers.popitem(last=False)[1])
+        return fd
+
+    def _write(self, data: bytes) -> Tuple[int, int]:
+        """追加一条记录，返回 (段号, 偏移)；当前段写满时先滚动。"""
+        if self._offset and self._offset + len(data) > self.segment_bytes:
+            os.close(self._writer)
+            self._segment += 1
+            self._writer = self._open_writer(self._segment)
+            self._offset = 0
+            self._stats["segments_rolled"] += 1
+        offset = self._offset
+        os.write(self._writer, data)
+        self._offset += len(data)
+        return self._segment, offset
+
+    def _read(self, segment: int, offset: int, length: int) -> Dict[str, Any]:
+        raw = os.pread(self._reader(segment), length, offset)
+        return json.loads(raw)["m"]
+
+    # ---- 热会话 ----
+
+    def _session(self, session: str) -> _HotSession:
+        """取热会话（不在内存中时从索引加载元数据），并标记为最近使用；调用方需持有锁。"""
+        hot = self._hot.get(session)
+        if hot is not None:
+            self._hot.move_to_end(session)
+            return hot
+        row = self._db.execute(
+            "SELECT next_seq, turn, floor FROM sessions WHERE session = ?", (session,)
+        ).fetchone()
+        # 只加载元数据；尾部在第一次窗口读取时用读到的记录填充
+        hot = _HotSession(*(row or (0, 0, 0)), tail_size=self.hot_messages)
+        self._stats["loads"] += 1
+        self._hot[session] = hot
+        while len(self._hot) > self.hot_sessions:
+            self._hot.popitem(last=False)
+            self._stats["evictions"] += 1
+        return hot
+
+    # ---- 公共接口 ----
+
+    def append(self, session: str, messages: Sequence[Dict[str, Any]]) -> None:
+        """追加若干条消息（message_to_dict 的结果）；human 消息开启新的一轮。"""
+        if not messages:
+            return
+        with self._lock:
+            hot = self._session(session)
+            rows = []
+            for message in messages:
+                if message.get("type") == "human" or hot.turn == 0:
+                    hot.turn += 1
+                seq = hot.next_seq
+                hot.next_seq += 1
+                tokens = message_tokens(message)
+                data = (json.dumps({"s": session, "q": seq, "m": message}, ensure_ascii=False) + "\n").encode("utf-8")
+                segment, offset = self._write(data)
+                rows.append((session, seq, hot.turn, segment, offset, len(data), tokens))
+                hot.tail.append((seq, hot.turn, tokens, message))
+            with self._db:
+                self._db.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)", (session, hot.next_seq, hot.turn, hot.floor)
+                )
+            self._stats["appends"] += len(rows)
+
+    def _scan(
+        self, session: str, floor: int, max_turns: Optional[int], max_tokens: Optional[int], last_turn: int,
+    ) -> List[_Entry]:
+        """沿主键倒序读取窗口内的记录（新 -> 旧）；调用方需持有锁。"""
+        cursor = self._db.execute(
+            "SELECT seq, turn, tokens, segment, offset, length FROM messages "
+            "WHERE session = ? AND seq >= ? ORDER BY seq DESC",
+            (session, floor),
+        )
+        picked = []
+        used = 0
+        for seq, turn, tokens, segment, offset, length in cursor:
+            if max_turns and last_turn - turn >= max_turns:
+                break
+            if max_tokens is not None and used + tokens > max_tokens:
+                break
+            used += tokens
+            picked.append((seq, turn, tokens, segment, offset, length))
+        cursor.close()
+        self._stats["disk_reads"] += 1
+        self._stats["records_read"] += len(picked)
+        return [(seq, turn, tokens, self._read(segment, offset, length)) for seq, turn, tokens, segment, offset, length in picked]
+
+    def window(
+        self, session: str, max_turns: Optional[int] = None, max_tokens: Optional[int] = None
+    ) -> List[_Entry]:
+        """最近 max_turns 轮、且总估算 token 不超过 max_tokens 的消息（旧 -> 新）。"""
+        with self._lock:
+            hot = self._session(session)
+            self._stats["windows"] += 1
+            picked: List[_Entry] = []
+            used = 0
+            complete = False  # 窗口是否已在尾部内确定
+            for entry in reversed(hot.tail):
+                seq, turn, tokens, _ = entry
+                if seq < hot.floor:
+                    complete = True
+                    break
+                if (max_turns and hot.turn - turn >= max_turns) or (max_tokens is not None and used + tokens > max_tokens):
+                    complete = True
+                    break
+                used += tokens
+                picked.append(entry)
+            else:
+                # 尾部已用完：尾部覆盖了起点之后的全部消息时窗口同样已确定
+                oldest = hot.tail[0][0] if hot.tail else hot.next_seq
+                complete = oldest <= hot.floor
+            if complete:
+                self._stats["hot_hits"] += 1
+            else:
+                picked = self._scan(session, hot.floor, max_turns, max_tokens, hot.turn)
+                if len(picked) > len(hot.tail):
+                    # 读到的窗口是该会话最新的一段记录，直接作为尾部留在内存中
+                    hot.tail.clear()
+                    hot.tail.extend(reversed(picked[:self.hot_messages]))
+            picked.reverse()
+            return picked
+
+    def count(self, session: str) -> int:
+        """会话中（clear 之后）的消息条数。"""
+        with self._lock:
+            hot = self._session(session)
+            return hot.next_seq - hot.floor
+
+    def clear(self, session: str) -> None:
+        """清空会话：只前移起点，段文件中的旧记录保持不变。"""
+        with self._lock:
+            hot = self._session(session)
+            hot.floor = hot.next_seq
+            hot.tail.clear()
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)", (session, hot.next_seq, hot.turn, hot.floor)
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["hot_sessions"] = len(self._hot)
+            out["segment"] = self._segment
+        out["hot_hit_rate"] = round(out["hot_hits"] / out["windows"], 4) if out["windows"] else 0.0
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            os.close(self._writer)
+            while self._readers:
+                os.close(self._readers.popitem()[1])
+            self._db.close()
+
+
+class WindowedChatHistory(BaseChatMessageHistory):
+    """ChatLogStore 上的一个会话；messages 只返回最近的窗口。"""
+
+    def __init__(
+        self, store: ChatLogStore, session_id: str, max_turns: Optional[int] = 10, max_tokens: Optional[int] = None
+    ) -> None:
+        self.store = store
+        self.session_id = session_id
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        entries = self.store.window(self.session_id, self.max_turns, self.max_tokens)
+        messages = messages_from_dict([message for _, _, _, message in entries])
+        for (seq, _, _, _), message in zip(entries, messages):
+            if message.id is None:
+                # 稳定的 id：HistoryRenderer 据此识别上一轮已经渲染过的消息
+                message.id = f"{self.session_id}:{seq}"
+        return messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.append(self.session_id, [message_to_dict(m) for m in messages])
+
+    def clear(self) -> None:
+        self.store.clear(self.session_id)
+
+
+def _same_message(cached: Any, message: Any) -> bool:
+    if cached is message:
+        return True
+    ident = getattr(message, "id", None)
+    return ident is not None and ident == getattr(cached, "id", None) and cached.type == message.type
+
+
+class _Rendered:
+    __slots__ = ("messages", "sizes", "counts", "text", "tokens")
+
+    def __init__(self) -> None:
+        self.messages: Deque[Any] = deque()
+        self.sizes: Deque[int] = deque()  # 每行的字符数
+        self.counts: Deque[int] = deque()  # 每行的估算 token 数
+        self.text = ""
+        self.tokens = 0
+
+
+class HistoryRenderer:
+    """按会话缓存 "type: content" 形式的历史文本，每轮只渲染新增的消息。
+
+    两次调用之间，历史（或其窗口）通常只是在末尾多了一问一答、开头滑出了最早的几条。
+    render() 先在缓存中找到新列表第一条消息的位置（消息对象相同，或 id 相同——
+    WindowedChatHistory 为每条消息给出由序号构成的稳定 id），再核对重叠部分的最后一条：
+    - 对得上：从缓存文本开头切掉滑出的行，只为新增消息生成文本并估算 token；
+    - 对不上（clear()、历史被截断或改写）：整段重新渲染。
+    渲染后的估算 token 数随增删增量维护，tokens(session) 直接返回，不重新计算。
+    """
+
+    def __init__(self, max_sessions: int = 1024) -> None:
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _Rendered]" = OrderedDict()
+        self._stats = {"renders": 0, "full": 0, "incremental": 0, "lines_rendered": 0, "lines_reused": 0}
+
+    @staticmethod
+    def _line(message: Any) -> str:
+        return f"{message.type}: {message.content}"
+
+    def _reset(self, rendered: _Rendered, messages: Sequence[Any]) -> None:
+        lines = [self._line(m) for m in messages]
+        rendered.messages = deque(messages)
+        rendered.sizes = deque(len(line) for line in lines)
+        rendered.counts = deque(estimate_tokens(line) for line in lines)
+        rendered.text = "\n".join(lines)
+        rendered.tokens = sum(rendered.counts)
+        self._stats["full"] += 1
+        self._stats["lines_rendered"] += len(lines)
+
+    def _overlap(self, rendered: _Rendered, messages: Sequence[Any]) -> Optional[int]:
+        """新列表开头在缓存中的位置；无法与缓存对齐时返回 None。"""
+        if not rendered.messages or not messages:
+            return None
+        first = messages[0]
+        for start, cached in enumerate(rendered.messages):  # 通常只滑出几条，扫描很短
+            if _same_message(cached, first):
+                overlap = len(rendered.messages) - start
+                if overlap <= len(messages) and _same_message(rendered.messages[-1], messages[overlap - 1]):
+                    return start
+                return None
+        return None
+
+    def render(self, session: str, messages: Sequence[Any]) -> Tuple[str, int]:
+        """返回 (历史文本, 估算 token 数)。"""
+        with self._lock:
+            self._stats["renders"] += 1
+            rendered = self._sessions.get(session)
+            if rendered is None:
+                rendered = self._sessions[session] = _Rendered()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session)
+
+            start = self._overlap(rendered, messages)
+            if start is None:
+                self._reset(rendered, messages)
+                return rendered.text, rendered.tokens
+
+            self._stats["incremental"] += 1
+            if start:
+                cut = start  # 每行之后的换行符
+                for _ in range(start):
+                    rendered.messages.popleft()
+                    cut += rendered.sizes.popleft()
+                    rendered.tokens -= rendered.counts.popleft()
+                rendered.text = rendered.text[cut:]
+            kept = len(rendered.messages)
+            self._stats["lines_reused"] += kept
+            new = messages[kept:]
+            if new:
+                lines = [self._line(m) for m in new]
+                for message, line in zip(new, lines):
+                    count = estimate_tokens(line)
+                    rendered.messages.append(message)
+                    rendered.sizes.append(len(line))
+                    rendered.counts.append(count)
+                    rendered.tokens += count
+                rendered.text = "\n".join([rendered.text, *lines]) if rendered.text else "\n".join(lines)
+                self._stats["lines_rendered"] += len(lines)
+            return rendered.text, rendered.tokens
+
+    def tokens(self, session: str) -> int:
+        """最近一次渲染结果的估算 token 数。"""
+        with self._lock:
+            rendered = self._sessions.get(session)
+            return rendered.tokens if rendered else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["sessions"] = len(self._sessions)
+        total = out["lines_rendered"] + out["lines_reused"]
+        out["reuse_rate"] = round(out["lines_reused"] / total, 4) if total else 0.0
+        return out
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, Any] = {}
+
+
+def _optional_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = (os.getenv(name) or "").strip()
+    if not value:
+        return default
+    number = int(value)
+    return number if number > 0 else None
+
+
+def get_chat_store() -> Optional[ChatLogStore]:
+    """按环境变量返回进程内共享的会话存储；CHAT_HISTORY=off 时返回 None。"""
+    if "store" not in _shared:
+        with _shared_lock:
+            if "store" not in _shared:
+                setting = (os.getenv("CHAT_HISTORY") or ".chat_history").strip()
+                if setting.lower() == "off":
+                    _shared["store"] = None
+                else:
+                    _shared["store"] = ChatLogStore(setting, hot_sessions=int(os.getenv("CHAT_HISTORY_HOT", "1024")))
+    return _shared["store"]
+
+
+def get_history_renderer() -> HistoryRenderer:
+    """进程内共享的历史渲染缓存。"""
+    if "renderer" not in _shared:
+        with _shared_lock:
+            if "renderer" not in _shared:
+                _shared["renderer"] = HistoryRenderer(int(os.getenv("CHAT_HISTORY_HOT", "1024")))
+    return _shared["renderer"]
+
+
+def get_session_history(session_id: str) -> BaseChatMessageHistory:
+    """RunnableWithMessageHistory 的 get_session_history：持久化的窗口历史，未启用时退回进程内历史。"""
+    store = get_chat_store()
+    if store is None:
+        with _shared_lock:
+            memory = _shared.setdefault("memory", {})
+            return memory.setdefault(session_id, InMemoryChatMessageHistory())
+    return WindowedChatHistory(
+        store,
+        session_id,
+        max_turns=_optional_int("CHAT_HISTORY_TURNS", 10),
+        max_tokens=_optional_int("CHAT_HISTORY_TOKENS", None),
+    )
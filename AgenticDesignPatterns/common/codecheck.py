@@ -0,0 +1,258 @@
+"""
+生成代码的确定性本地检查：在请模型审查之前先跑一遍，能判定的就不再调用模型。
+
+检查内容：
+1. ast.parse：语法错误直接判为失败；
+2. 静态检查：安装了 pyflakes 时使用 pyflakes，否则用内置的少量 AST 规则
+   （未使用的导入、裸 except、可变默认参数）；
+3. 运行：在沙箱子进程（见 common/sandbox.py）中以 __main__ 身份执行代码，
+   捕获未处理异常与超时，然后运行其中的 doctest 与无参 test_* 函数；
+   模块级（含 if __name__ == "__main__" 块中）的 assert 随执行一起生效。
+
+结论（CheckResult.status）：
+- "failed"：语法错误、未处理异常、超时或任一测试失败——无需模型审查，直接把 feedback() 作为批评；
+- "passed"：执行成功、至少有一个测试且全部通过、静态检查无问题——确定性的停止信号；
+- "inconclusive"：没有测试、需要交互输入等无法判定的情况——照常交给模型审查。
+
+设置 PRECHECK=off 可关闭本地检查，恢复纯模型审查。
+"""
+
+import ast
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+_SENTINEL = "__CODECHECK_REPORT__"
+_FENCE_RE = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.S | re.I)
+_THINK_RE = re.compile(r"<think>.*?</think>", re.S)
+
+# 在沙箱中执行的驱动脚本：代码从 stdin 读入，报告以一行 JSON 写到真正的 stdout 末尾
+_RUNNER = r'''
+import contextlib, doctest, inspect, io, json, linecache, sys, traceback, types
+
+source = sys.stdin.read()
+linecache.cache["<generated>"] = (len(source), None, source.splitlines(True), "<generated>")
+sys.stdin = io.StringIO("")
+report = {"error": None, "error_type": None, "doctest_attempted": 0, "doctest_failed": 0,
+          "tests": [], "stdout": ""}
+module = types.ModuleType("__main__")
+module.__file__ = "<generated>"
+sys.modules["__main__"] = module
+buf = io.StringIO()
+with contextlib.redirect_stdout(buf):
+    try:
+        exec(compile(source, "<generated>", "exec"), module.__dict__)
+    except SystemExit as exc:
+        if exc.code not in (None, 0):
+            report["error"], report["error_type"] = f"SystemExit({exc.code!r})", "SystemExit"
+    except BaseException as exc:
+        # 只保留生成代码自身的栈帧，去掉驱动脚本的
+        tb = traceback.TracebackException.from_exception(exc)
+        tb.stack = traceback.StackSummary.from_list([f for f in tb.stack if f.filename == "<generated>"][-5:])
+        report["error"] = "".join(tb.format())
+        report["error_type"] = type(exc).__name__
+    if report["error"] is None:
+        runner = doctest.DocTestRunner(verbose=False)
+        for test in doctest.DocTestFinder().find(module, "__main__"):
+            runner.run(test, out=buf.write)
+        results = runner.summarize(verbose=False)
+        report["doctest_failed"], report["doctest_attempted"] = results.failed, results.attempted
+        for name, fn in list(vars(module).items()):
+            if not (name.startswith("test_") and inspect.isfunction(fn)):
+                continue
+            params = inspect.signature(fn).parameters.values()
+            if any(p.default is p.empty and p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD) for p in params):
+                continue
+            try:
+                fn()
+                report["tests"].append([name, None])
+            except BaseException as exc:
+                report["tests"].append([name, f"{type(exc).__name__}: {exc}"])
+report["stdout"] = buf.getvalue()[-2000:]
+sys.__stdout__.write("\n" + "__CODECHECK_REPORT__" + json.dumps(report, ensure_ascii=False) + "\n")
+'''
+
+# 这些异常通常意味着程序需要交互输入或命令行参数，而不是代码本身有错
+_INCONCLUSIVE_ERRORS = {"EOFError", "SystemExit", "KeyboardInterrupt"}
+
+
+def precheck_enabled() -> bool:
+    return (os.getenv("PRECHECK") or "").strip().lower() != "off"
+
+
+def extract_python(text: str) -> str:
+    """从模型输出中取出代码：去掉 <think> 段，优先取 ```python 代码块，否则取全文。"""
+    cleaned = _THINK_RE.sub("", text or "")
+    blocks = _FENCE_RE.findall(cleaned)
+    if blocks:
+        return max(blocks, key=len).strip()
+    return cleaned.strip()
+
+
+def _ast_lint(tree: ast.AST) -> List[str]:
+    issues: List[str] = []
+    imported = {}
+    used = set()
+    star_import = False
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    star_import = True
+                    continue
+                name = (alias.asname or alias.name).split(".")[0]
+                imported.setdefault(name, node.lineno)
+        elif isinstance(node, ast.Name):
+            used.add(node.id)
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            issues.append(f"第 {node.lineno} 行：裸 except 会吞掉所有异常（包括 KeyboardInterrupt）")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for default in node.args.defaults + node.args.kw_defaults:
+                if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                    issues.append(f"第 {default.lineno} 行：函数 {node.name} 使用了可变默认参数")
+    if not star_import:
+        for name, lineno in sorted(imported.items(), key=lambda item: item[1]):
+            if name not in used and name != "__future__":
+                issues.append(f"第 {lineno} 行：导入了 {name} 但未使用")
+    return issues
+
+
+def lint(code: str, tree: Optional[ast.AST] = None) -> List[str]:
+    """静态检查，返回问题列表；pyflakes 可用时优先使用。"""
+    try:
+        from pyflakes.api import check
+        from pyflakes.reporter import Reporter
+    except ImportError:
+        return _ast_lint(tree if tree is not None else ast.parse(code))
+    import io
+
+    out, err = io.StringIO(), io.StringIO()
+    check(code, "<generated>", Reporter(out, err))
+    return [line.replace("<generated>:", "第 ", 1) for line in out.getvalue().splitlines() if line.strip()]
+
+
+def _count_asserts(tree: ast.Module) -> int:
+    """统计执行模块时必然会运行的 assert：模块顶层与 if 块（含 __main__ 块）中的，不含函数 / 类体。"""
+    count = 0
+    stack: List[ast.stmt] = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Assert):
+            count += 1
+        elif isinstance(node, ast.If):
+            stack.extend(node.body)
+            stack.extend(node.orelse)
+    return count
+
+
+@dataclass
+class CheckResult:
+    status: str  # "failed" / "passed" / "inconclusive"
+    syntax_error: Optional[str] = None
+    lint: List[str] = field(default_factory=list)
+    tests_run: int = 0
+    tests_failed: int = 0
+    failures: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    output: str = ""
+    elapsed_ms: float = 0.0
+    interrupted: Optional[str] = None  # 非代码错误导致的提前结束（等待输入、SystemExit 等）的异常信息
+
+    @property
+    def failed(self) -> bool:
+        return self.status == "failed"
+
+    @property
+    def passed(self) -> bool:
+        return self.status == "passed"
+
+    def summary(self) -> str:
+        parts = [f"状态={self.status}", f"测试 {self.tests_run - self.tests_failed}/{self.tests_run} 通过"]
+        if self.syntax_error:
+            parts.append("语法错误")
+        if self.error:
+            parts.append("运行出错")
+        if self.lint:
+            parts.append(f"静态检查 {len(self.lint)} 项")
+        parts.append(f"{self.elapsed_ms:.0f} ms")
+        return "，".join(parts)
+
+    def feedback(self) -> str:
+        """把检查发现的问题写成项目符号列表，可直接作为下一轮的批评意见。"""
+        lines: List[str] = []
+        if self.syntax_error:
+            lines.append(f"• 语法错误：{self.syntax_error}")
+        if self.error:
+            lines.append(f"• 运行代码时出错：\n{self.error.strip()}")
+        lines.extend(f"• 测试失败：{failure}" for failure in self.failures)
+        lines.extend(f"• 静态检查：{issue}" for issue in self.lint)
+        return "\n".join(lines) if lines else "• 本地检查未发现问题。"
+
+
+def _classify(run, lint_issues: List[str], asserts: int) -> CheckResult:
+    """根据沙箱运行结果（common.sandbox.RunResult）给出结论。"""
+    result = CheckResult("inconclusive", lint=lint_issues, elapsed_ms=run.elapsed_ms)
+    if run.timed_out:
+        result.status, result.error = "failed", "执行超时（可能存在死循环或等待输入）"
+        return result
+    _, _, raw = run.stdout.rpartition(_SENTINEL)
+    try:
+        report = json.loads(raw.strip().splitlines()[0])
+    except (ValueError, IndexError):
+        # 没有报告：进程被 rlimit 杀掉或解释器崩溃
+        result.status = "failed"
+        result.error = (run.stderr or "").strip()[-1500:] or f"进程异常退出（返回码 {run.returncode}）"
+        return result
+    result.output = report["stdout"]
+    if report["error"] is not None:
+        if report["error_type"] in _INCONCLUSIVE_ERRORS:
+            result.error, result.interrupted = None, report["error"]
+            return result
+        result.status, result.error = "failed", report["error"]
+        if report["error_type"] == "AssertionError":
+            result.tests_run, result.tests_failed = 1, 1
+            result.failures.append("模块中的 assert 未通过")
+        return result
+    test_failures = [f"{name}: {err}" for name, err in report["tests"] if err]
+    result.tests_run = report["doctest_attempted"] + len(report["tests"]) + asserts
+    result.tests_failed = report["doctest_failed"] + len(test_failures)
+    result.failures = test_failures
+    if report["doctest_failed"]:
+        result.failures.append(f"{report['doctest_failed']} 个 doctest 示例未通过")
+    if result.tests_failed:
+        result.status = "failed"
+    elif result.tests_run and not lint_issues:
+        result.status = "passed"
+    return result
+
+
+def _prepare(code: str):
+    """语法与静态检查；语法错误时返回 (CheckResult, None, 0)。"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as exc:
+        return CheckResult("failed", syntax_error=f"第 {exc.lineno} 行：{exc.msg}"), None, 0
+    return None, lint(code, tree), _count_asserts(tree)
+
+
+def check_code(code: str, timeout: Optional[float] = None) -> CheckResult:
+    """对一段代码做完整的本地检查。"""
+    return check_many([code], timeout)[0]
+
+
+def check_many(codes: Sequence[str], timeout: Optional[float] = None) -> List[CheckResult]:
+    """并发检查多段代码（在共享沙箱池中运行），结果与输入顺序一致。"""
+    from .sandbox import get_sandbox_pool
+
+    pool = get_sandbox_pool()
+    prepared = [_prepare(code) for code in codes]
+    futures = [
+        None if early is not None else pool.submit(_RUNNER, stdin=code, timeout=timeout)
+        for code, (early, _, _) in zip(codes, prepared)
+    ]
+    results = []
+    for code, (early, lint_issues, asserts), future in zip(codes, prepared, futures):
+        results.append(early if early is not None else _classify(future.result(), lint_issues, asserts))
+    return results
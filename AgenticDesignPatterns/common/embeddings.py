@@ -0,0 +1,392 @@
+"""
+嵌入计算的缓存与合并层。
+
+chap08_02（交给记忆存储的 embed）与 autogen/chap08（用户记忆）里，同一段记忆文本在每次写入、
+每次查询时都会重新嵌入；嵌入是仅次于生成的第二大模型开销。EmbeddingService 放在嵌入模型前面：
+
+- 内容寻址缓存：键是 sha256(模型名 \\0 文本) 的前 16 字节，向量保存在 VectorCache 中。
+  指定目录时，向量按维度写入 float32 文件 vectors-<dims>.f32（np.memmap 映射，容量翻倍增长），
+  键按行号顺序追加到 keys-<dims>.bin；重启后只读回键文件建索引，向量由操作系统按页载入。
+  不指定目录时只保存在进程内存中。
+- 合并成批：一次请求中的多条文本去重后按 max_batch 分批调用模型。多个线程同时请求时，
+  第一个线程负责调用模型，其间到达的请求进入队列，上一批返回后合成一批发出（不额外等待）；
+  同一文本正在计算时，后来者直接等待同一结果。异步路径用 common/batcher.py 的 MicroBatcher
+  在 window_ms 窗口内收集并发请求。
+- stats()：请求文本数、缓存命中率、合并数、模型调用次数与批大小分布。
+
+同一缓存目录只应由一个进程写入。
+
+通过环境变量配置（见 get_embedding_service）：
+- EMBED_MODEL: Ollama 嵌入模型名（如 nomic-embed-text）；不设置时使用纯 CPU 的 hashed_ngram_embedding。
+- EMBED_CACHE: 向量缓存目录（默认 .embed_cache）；"memory" 只用内存；"off" 关闭缓存。
+- EMBED_BATCH: 每批最多文本数（默认 64）。
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .batcher import MicroBatcher
+
+KEY_BYTES = 16
+_INITIAL_ROWS = 1024
+
+EmbedFunc = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+def content_key(model: str, text: str) -> bytes:
+    """缓存键：同一模型下内容相同的文本得到同一个键。"""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()[:KEY_BYTES]
+
+
+class _Table:
+    """同一维度的向量，按写入顺序占用行号；有目录时映射到文件。"""
+
+    def __init__(self, dims: int, directory: Optional[Path]) -> None:
+        self.dims = dims
+        self.size = 0
+        self.keys: List[bytes] = []
+        self._path: Optional[Path] = None
+        self._keys_file: Any = None
+        if directory is None:
+            self.data = np.zeros((_INITIAL_ROWS, dims), dtype=np.float32)
+            return
+        self._path = directory / f"vectors-{dims}.f32"
+        keys_path = directory / f"keys-{dims}.bin"
+        capacity = self._path.stat().st_size // (dims * 4) if self._path.exists() else 0
+        raw = keys_path.read_bytes() if keys_path.exists() else b""
+        # 向量先于键写入：键文件中的每一行都有对应向量；末尾不完整的键（写入中断）截掉
+        self.size = min(len(raw) // KEY_BYTES, capacity)
+        self.keys = [raw[i * KEY_BYTES:(i + 1) * KEY_BYTES] for i in range(self.size)]
+        if len(raw) != self.size * KEY_BYTES:
+            os.truncate(keys_path, self.size * KEY_BYTES)
+        self._keys_file = open(keys_path, "ab")
+        self._map(max(capacity, _INITIAL_ROWS))
+
+    def _map(self, capacity: int) -> None:
+        if not self._path.exists() or self._path.stat().st_size < capacity * self.dims * 4:
+            with open(self._path, "ab") as f:
+                f.truncate(capacity * self.dims * 4)
+        self.data = np.memmap(self._path, dtype=np.float32, mode="r+", shape=(capacity, self.dims))
+
+    def append(self, key: bytes, vector: np.ndarray) -> int:
+        if self.size == len(self.data):
+            if self._path is None:
+                self.data = np.resize(self.data, (len(self.data) * 2, self.dims))
+            else:
+                self.data.flush()
+                self._map(len(self.data) * 2)
+        row = self.size
+        self.data[row] = vector
+        if self._keys_file is not None:
+            self._keys_file.write(key)
+        self.keys.append(key)
+        self.size += 1
+        return row
+
+    def flush(self) -> None:
+        if self._keys_file is not None:
+            self.data.flush()
+            self._keys_file.flush()
+
+    def close(self) -> None:
+        if self._keys_file is not None:
+            self.flush()
+            self._keys_file.close()
+            self._keys_file = None
+
+
+class VectorCache:
+    """内容键 -> float32 向量；directory 为 None 时只在内存中。"""
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = Path(directory) if directory else None
+        self._lock = threading.Lock()
+        self._tables: Dict[int, _Table] = {}
+        self._rows: Dict[bytes, Tuple[_Table, int]] = {}
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for keys_path in sorted(self.directory.glob("keys-*.bin")):
+                dims = int(keys_path.stem.split("-", 1)[1])
+                table = self._tables[dims] = _Table(dims, self.directory)
+                for row, key in enumerate(table.keys):
+                    self._rows[key] = (table, row)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            found = self._rows.get(key)
+            if found is None:
+                return None
+            table, row = found
+            return np.array(table.data[row])  # 复制一份：扩容重新映射后旧视图失效
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                if key in self._rows:
+                    continue
+                table = self._tables.get(len(vector))
+                if table is None:
+                    table = self._tables[len(vector)] = _Table(len(vector), self.directory)
+                self._rows[key] = (table, table.append(key, vector))
+            for table in self._tables.values():
+                table.flush()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def close(self) -> None:
+        with self._lock:
+            for table in self._tables.values():
+                table.close()
+
+
+def _bucket(size: int) -> str:
+    """批大小分桶：1、2-3、4-7、8-15 ……"""
+    low = 1 << (size.bit_length() - 1)
+    return str(low) if low == 1 else f"{low}-{2 * low - 1}"
+
+
+class EmbeddingService:
+    """带内容缓存与请求合并的嵌入服务。
+
+    embed 可以是 texts -> 向量列表 的函数，也可以是带 embed_documents 的对象（如 LangChain Embeddings）；
+    aembed 缺省时，带 aembed_documents 的对象使用它，否则在线程中调用 embed。
+    embed_documents / embed_query 及其异步版本与 LangChain Embeddings 的接口一致，
+    实例本身也可以当作 texts -> 向量 的函数传给 LangGraph 记忆存储的 index["embed"]。
+    """
+
+    def __init__(
+        self,
+        embed: Any,
+        model: str = "",
+        cache: Optional[VectorCache] = None,
+        max_batch: int = 64,
+        window_ms: float = 5.0,
+        aembed: Optional[Callable[[List[str]], Any]] = None,
+    ) -> None:
+        if max_batch <= 0:
+            raise ValueError("max_batch 必须为正整数")
+        self._embed: EmbedFunc = getattr(embed, "embed_documents", embed)
+        self._aembed = aembed or getattr(embed, "aembed_documents", None)
+        self.model = model
+        self.cache = cache
+        self.max_batch = max_batch
+        self.batcher = MicroBatcher(self._adispatch, window_ms, max_batch, key=lambda text: text, coalesce=True)
+        self._lock = threading.Lock()
+        self._inflight: Dict[bytes, "Future[np.ndarray]"] = {}
+        self._queue: List[Tuple[bytes, str]] = []
+        self._atasks: Dict[Tuple[Any, bytes], "asyncio.Task[np.ndarray]"] = {}
+        self._leader = False
+        self._stats = {"requests": 0, "hits": 0, "misses": 0, "coalesced": 0, "model_calls": 0, "embedded": 0}
+        self._batch_sizes: Dict[str, int] = {}
+
+    # ---- 同步路径 ----
+
+    def vectors(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """按顺序返回每条文本的 float32 向量。"""
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        waits: List[Tuple[int, "Future[np.ndarray]"]] = []
+        leader = False
+        with self._lock:
+            self._stats["requests"] += len(texts)
+            for i, text in enumerate(texts):
+                key = content_key(self.model, text)
+                vector = self.cache.get(key) if self.cache is not None else None
+                if vector is not None:
+                    out[i] = vector
+                    self._stats["hits"] += 1
+                    continue
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    self._queue.append((key, text))
+                    self._stats["misses"] += 1
+                else:
+                    self._stats["coalesced"] += 1
+                waits.append((i, future))
+            if self._queue and not self._leader:
+                self._leader = leader = True
+        if leader:
+            self._drain()
+        for i, future in waits:
+            out[i] = future.result()
+        return out  # type: ignore[return-value]
+
+    def _drain(self) -> None:
+        """由第一个发现队列非空的线程执行：逐批调用模型，直到队列清空。"""
+        batch: List[Tuple[bytes, str]] = []
+        try:
+            while True:
+                with self._lock:
+                    batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+                    if not batch:
+                        self._leader = False  # 与入队在同一把锁下交接，之后到达的请求会自己成为负责线程
+                        return
+                try:
+                    vectors = self._matrix(self._embed([text for _, text in batch]), len(batch))
+                except Exception as exc:  # 本批失败：等待者各自收到异常，继续处理队列
+                    self._resolve(batch, None, exc)
+                    continue
+                self._resolve(batch, vectors)
+        except BaseException:
+            # 被 KeyboardInterrupt 等打断时，不让排队者永远等待
+            with self._lock:
+                self._leader = False
+                stranded, self._queue = batch + self._queue, []
+            self._resolve(stranded, None, RuntimeError("嵌入批处理被中断"))
+            raise
+
+    def _resolve(self, batch: List[Tuple[bytes, str]], vectors: Optional[np.ndarray], exc: Optional[BaseException] = None) -> None:
+        if not batch:
+            return
+        if vectors is not None:
+            self._record([key for key, _ in batch], vectors)
+        with self._lock:
+            futures = [self._inflight.pop(key, None) for key, _ in batch]
+        for i, future in enumerate(futures):
+            if future is None or future.done():
+                continue
+            if vectors is not None:
+                future.set_result(vectors[i])
+            else:
+                future.set_exception(exc)
+
+    def _matrix(self, vectors: Any, expected: int) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != expected:
+            raise RuntimeError(f"嵌入模型返回了 {len(matrix)} 个向量，期望 {expected} 个")
+        return matrix
+
+    def _record(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        if self.cache is not None:
+            self.cache.put_many(keys, vectors)
+        with self._lock:
+            self._stats["model_calls"] += 1
+            self._stats["embedded"] += len(keys)
+            bucket = _bucket(len(keys))
+            self._batch_sizes[bucket] = self._batch_sizes.get(bucket, 0) + 1
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.vectors(list(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors([text])[0].tolist()
+
+    __call__ = embed_documents
+
+    # ---- 异步路径 ----
+
+    async def _adispatch(self, texts: List[str]) -> List[np.ndarray]:
+        if self._aembed is not None:
+            raw = await self._aembed(texts)
+        else:
+            raw = await asyncio.to_thread(self._embed, texts)
+        vectors = self._matrix(raw, len(texts))
+        self._record([content_key(self.model, text) for text in texts], vectors)
+        return list(vectors)
+
+    async def avectors(self, texts: Sequence[str]) -> List[np.ndarray]:
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        waits: List[Tuple[int, "asyncio.Future[np.ndarray]"]] = []
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats["requests"] += len(texts)
+            for i, text in enumerate(texts):
+                key = content_key(self.model, text)
+                vector = self.cache.get(key) if self.cache is not None else None
+                if vector is not None:
+                    out[i] = vector
+                    self._stats["hits"] += 1
+                    continue
+                task = self._atasks.get((loop, key))
+                if task is None:
+                    # 并发请求经 MicroBatcher 在窗口内合成一批；正在计算的文本直接等待同一个任务
+                    task = self._atasks[(loop, key)] = loop.create_task(self.batcher.submit(text))
+                    task.add_done_callback(lambda _, k=(loop, key): self._atasks.pop(k, None))
+                    self._stats["misses"] += 1
+                else:
+                    self._stats["coalesced"] += 1
+                waits.append((i, task))
+        for i, task in waits:
+            out[i] = await asyncio.shield(task)
+        return out  # type: ignore[return-value]
+
+    async def aembed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in await self.avectors(list(texts))]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.avectors([text]))[0].tolist()
+
+    # ---- 统计 ----
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["batch_sizes"] = dict(sorted(self._batch_sizes.items(), key=lambda item: int(item[0].split("-")[0])))
+        out["cached"] = len(self.cache) if self.cache is not None else 0
+        out["hit_rate"] = round(out["hits"] / out["requests"], 4) if out["requests"] else 0.0
+        out["avg_batch_size"] = round(out["embedded"] / out["model_calls"], 3) if out["model_calls"] else 0.0
+        return out
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+
+def _hashed_ngram(texts: List[str]) -> List[np.ndarray]:
+    from .semantic_cache import hashed_ngram_embedding
+
+    return [hashed_ngram_embedding(text) for text in texts]
+
+
+def _ollama_embedders(model: str) -> Tuple[EmbedFunc, Callable[[List[str]], Any]]:
+    """Ollama 的同步 / 异步嵌入函数；一次请求发送整批文本（/api/embed），OLLAMA_HOST 由客户端读取。"""
+    from ollama import AsyncClient, Client
+
+    client = Client()
+    async_clients: Dict[Any, Any] = {}
+
+    def embed(texts: List[str]) -> Sequence[Sequence[float]]:
+        return client.embed(model=model, input=texts).embeddings
+
+    async def aembed(texts: List[str]) -> Sequence[Sequence[float]]:
+        # AsyncClient 的连接绑定在创建它的事件循环上
+        loop = asyncio.get_running_loop()
+        if loop not in async_clients:
+            async_clients[loop] = AsyncClient()
+        return (await async_clients[loop].embed(model=model, input=texts)).embeddings
+
+    return embed, aembed
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, EmbeddingService] = {}
+
+
+def get_embedding_service() -> EmbeddingService:
+    """按环境变量创建的共享嵌入服务（见模块说明）；同一进程内各示例共用同一个缓存。"""
+    model = os.getenv("EMBED_MODEL") or ""
+    with _shared_lock:
+        service = _shared.get(model)
+        if service is not None:
+            return service
+        setting = os.getenv("EMBED_CACHE", ".embed_cache")
+        if setting.lower() == "off":
+            cache = None
+        else:
+            cache = VectorCache(None if setting.lower() == "memory" else setting)
+        max_batch = int(os.getenv("EMBED_BATCH", "64"))
+        if model:
+            embed, aembed = _ollama_embedders(model)
+            service = EmbeddingService(embed, f"ollama:{model}", cache, max_batch, aembed=aembed)
+        else:
+            service = EmbeddingService(_hashed_ngram, "hashed-ngram-512", cache, max_batch)
+        _shared[model] = service
+        return service
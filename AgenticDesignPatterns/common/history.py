@@ -0,0 +1,153 @@
+"""
+反思循环的有界增量历史。
+
+原始实现把每一版代码、每一条批评都追加进 message_history 并整段重发，
+提示长度（以及首 token 延迟）随迭代次数线性增长。ReflectionHistory 只保留：
+- 原始任务（原文）；
+- 最新一版代码与最新一条批评（原文）；
+- 更早轮次的滚动摘要：旧代码已被新版本取代，直接丢弃；旧批评只保留要点行
+  （项目符号 / 编号行，没有时取开头一段），按 summary_budget 从最旧的开始淘汰。
+  摘要是抽取式的，不额外调用模型；也可以传入 summarize(旧摘要, 新批评) -> 新摘要 替换。
+
+token_budget 约束整段提示的估算 token 数：超出时先缩减摘要；
+任务与最新代码 / 批评始终保留原文，因此它们本身超出预算时只能标记 over_budget。
+
+report() 对比“完整历史”（原实现会发送的消息）与实际发送的 token 数，给出每轮节省量。
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]")
+_BULLET_RE = re.compile(r"^\s*(?:[•\-\*]|\d+[\.\)、])\s*")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日文字符按 1 个计，其余字符约 4 个计 1 个。"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def critique_points(critique: str, fallback_chars: int = 200) -> List[str]:
+    """从批评中抽取要点行；没有项目符号时取开头 fallback_chars 个字符。"""
+    points = [_BULLET_RE.sub("", line).strip() for line in critique.splitlines() if _BULLET_RE.match(line)]
+    points = [p for p in points if p]
+    if points:
+        return points
+    head = " ".join(critique.split())[:fallback_chars]
+    return [head] if head else []
+
+
+class ReflectionHistory:
+    """生成 -> 批评 -> 改进 循环的消息历史，保持提示长度有界。"""
+
+    CRITIQUE_PREFIX = "上次代码的批评意见:\n"
+    SUMMARY_PREFIX = "更早轮次的批评要点（已压缩，均已在后续版本中处理或仍需注意）:\n"
+
+    def __init__(
+        self,
+        task: str,
+        token_budget: int = 2000,
+        summary_budget: int = 300,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        summarize: Optional[Callable[[str, str], str]] = None,
+    ) -> None:
+        self.task = task
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.count_tokens = count_tokens
+        self.summarize = summarize
+        self.latest_code: Optional[str] = None
+        self.latest_critique: Optional[str] = None
+        self._summary_lines: List[str] = []
+        self._summary_text = ""
+        self._round = 0
+        # 原实现的 message_history 的 token 数：只增不减
+        self._full_tokens = count_tokens(task)
+        self.reports: List[Dict[str, Any]] = []
+
+    # --- 写入 ---
+    def add_code(self, code: str) -> None:
+        """记录新一版代码；上一轮的批评转入滚动摘要，上一版代码被取代。"""
+        if self.latest_critique is not None:
+            self._compress(self.latest_critique)
+            self.latest_critique = None
+        self.latest_code = code
+        self._round += 1
+        self._full_tokens += self.count_tokens(code)
+
+    def add_critique(self, critique: str) -> None:
+        self.latest_critique = critique
+        self._full_tokens += self.count_tokens(self.CRITIQUE_PREFIX + critique)
+
+    def _compress(self, critique: str) -> None:
+        if self.summarize is not None:
+            self._summary_text = self.summarize(self._summary_text, critique)
+            return
+        for point in critique_points(critique):
+            line = f"第 {self._round} 版：{point}"
+            if line not in self._summary_lines:
+                self._summary_lines.append(line)
+        self._trim_summary(self.summary_budget)
+
+    def _trim_summary(self, budget: int) -> None:
+        """从最旧的要点开始丢弃，直到摘要不超过 budget 个 token。"""
+        if self.summarize is not None:
+            # 自定义摘要函数的输出无法按行拆分，超预算时按字符截断
+            while self._summary_text and self.count_tokens(self._summary_text) > budget:
+                self._summary_text = self._summary_text[len(self._summary_text) // 4 + 1:]
+            return
+        while self._summary_lines and self.count_tokens("\n".join(self._summary_lines)) > budget:
+            self._summary_lines.pop(0)
+
+    @property
+    def summary(self) -> str:
+        return self._summary_text if self.summarize is not None else "\n".join(self._summary_lines)
+
+    # --- 读取 ---
+    def _contents(self, instruction: Optional[str]) -> List[tuple]:
+        parts = [("human", self.task)]
+        if self.summary:
+            parts.append(("human", self.SUMMARY_PREFIX + self.summary))
+        if self.latest_code is not None:
+            parts.append(("ai", self.latest_code))
+        if self.latest_critique is not None:
+            parts.append(("human", self.CRITIQUE_PREFIX + self.latest_critique))
+        if instruction:
+            parts.append(("human", instruction))
+        return parts
+
+    def messages(self, instruction: Optional[str] = None) -> List[Any]:
+        """构建本轮要发送的消息列表，并记录一条 token 报告（见 report）。"""
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        if instruction:
+            # 原实现每轮都会把这条指令永久追加到历史中
+            self._full_tokens += self.count_tokens(instruction)
+        parts = self._contents(instruction)
+        total = sum(self.count_tokens(text) for _, text in parts)
+        if total > self.token_budget and self.summary:
+            fixed = total - self.count_tokens(self.SUMMARY_PREFIX + self.summary)
+            self._trim_summary(max(0, self.token_budget - fixed - self.count_tokens(self.SUMMARY_PREFIX)))
+            parts = self._contents(instruction)
+            total = sum(self.count_tokens(text) for _, text in parts)
+
+        self.reports.append({
+            "iteration": self._round + 1,  # 即将生成的版本号
+            "prompt_tokens": total,
+            "full_history_tokens": self._full_tokens,
+            "saved_tokens": max(0, self._full_tokens - total),
+            "over_budget": total > self.token_budget,
+        })
+        return [AIMessage(content=text) if role == "ai" else HumanMessage(content=text) for role, text in parts]
+
+    def report(self) -> Dict[str, Any]:
+        """最近一次 messages() 的 token 报告。"""
+        return self.reports[-1] if self.reports else {}
+
+    def totals(self) -> Dict[str, int]:
+        sent = sum(r["prompt_tokens"] for r in self.reports)
+        full = sum(r["full_history_tokens"] for r in self.reports)
+        return {"prompt_tokens": sent, "full_history_tokens": full, "saved_tokens": full - sent}
@@ -0,0 +1,199 @@
+"""
+决策 JSON 的增量解析。
+
+chap05 的决策链只输出一个形如 {"decision": "use_tool|answer", "tool_input": "..."} 的对象。
+原实现等模型输出完毕再 json.loads，失败时退回子串匹配。这里边接收 token 边解析：
+
+- IncrementalJSONObject：只解析最外层对象，每个字段的值一完整就可以读取（字符串、数字、
+  true/false/null、嵌套对象 / 数组），对象前的 ```json 代码块标记等杂质直接跳过；
+- DecisionParser：先经 ThinkFilter（common/reasoning.py）去掉 deepseek-r1 的 <think> 段，
+  decision 为 answer、或 decision 为 use_tool 且 tool_input 已完整时立即定案；
+- adecide：消费异步 token 流，定案后立刻关闭流（取消剩余生成），并返回省掉的等待信息。
+
+设置 DECISION_STREAM=off 时示例退回“完整输出后再解析”（仍使用同一个解析器）。
+"""
+
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from .reasoning import ThinkFilter
+
+_WS = " \t\r\n"
+
+
+def decision_stream_enabled() -> bool:
+    return (os.getenv("DECISION_STREAM") or "").strip().lower() != "off"
+
+
+class IncrementalJSONObject:
+    """最外层 JSON 对象的增量解析器：feed() 之后从 fields 读取已完整的字段。"""
+
+    def __init__(self) -> None:
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._state = "seek"
+        self._start = 0  # 当前 token 在 _buf 中的起点
+        self._key: Optional[str] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        self._buf += text
+        buf = self._buf
+        i = self._pos
+        while i < len(buf) and not self.done:
+            c = buf[i]
+            state = self._state
+            if state == "seek":
+                if c == "{":
+                    self._state = "key"
+            elif state == "key":
+                if c == '"':
+                    self._state, self._start, self._escape = "key_str", i, False
+                elif c == "}":
+                    self.done = True
+            elif state in ("key_str", "str_value"):
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    raw = buf[self._start:i + 1]
+                    if state == "key_str":
+                        self._key, self._state = _loads(raw), "colon"
+                    else:
+                        self.fields[self._key] = _loads(raw)
+                        self._state = "key"
+            elif state == "colon":
+                if c == ":":
+                    self._state = "value"
+            elif state == "value":
+                if c == '"':
+                    self._state, self._start, self._escape = "str_value", i, False
+                elif c in "{[":
+                    self._state, self._start, self._depth, self._in_string, self._escape = "nested", i, 1, False, False
+                elif c not in _WS:
+                    self._state, self._start = "bare", i
+            elif state == "nested":
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        self._in_string = False
+                elif c == '"':
+                    self._in_string = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self.fields[self._key] = _loads(buf[self._start:i + 1])
+                        self._state = "key"
+            elif state == "bare":
+                if c in ",}" or c in _WS:
+                    self.fields[self._key] = _loads(buf[self._start:i].strip())
+                    self._state = "key"
+                    if c == "}":
+                        self.done = True
+            i += 1
+        self._pos = i
+        return self.fields
+
+
+def _loads(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.strip('"')
+
+
+class DecisionParser:
+    """decision / tool_input 决策的流式解析；ready 为真后 result() 即为最终决策。"""
+
+    def __init__(self, fallback_query: str = "") -> None:
+        self.fallback_query = fallback_query
+        self.think = ThinkFilter()
+        self.json = IncrementalJSONObject()
+        self.visible = ""
+        self.chars = 0
+        self.ready = False
+
+    def feed(self, chunk: str) -> bool:
+        """输入一个块，返回是否已能定案。"""
+        self.chars += len(chunk or "")
+        visible = self.think.feed(chunk)
+        if visible:
+            self.visible += visible
+            fields = self.json.feed(visible)
+            decision = fields.get("decision")
+            if self.json.done or (decision is not None and (decision != "use_tool" or "tool_input" in fields)):
+                self.ready = True
+        return self.ready
+
+    def close(self) -> None:
+        """流已结束（未能提前定案）。"""
+        tail = self.think.flush()
+        if tail:
+            self.visible += tail
+            self.json.feed(tail)
+
+    def result(self) -> Tuple[str, str]:
+        fields = self.json.fields
+        decision = fields.get("decision")
+        tool_input = fields.get("tool_input") or ""
+        if decision is None:
+            # 没有可解析的 JSON：退回子串判断
+            decision = "use_tool" if "use_tool" in self.visible.lower() else "answer"
+        decision = str(decision).strip()
+        tool_input = str(tool_input).strip()
+        if decision == "use_tool" and not tool_input:
+            tool_input = self.fallback_query
+        return decision, tool_input
+
+
+def parse_decision(raw: str, fallback_query: str = "") -> Tuple[str, str]:
+    """解析完整的决策输出（非流式路径）。"""
+    parser = DecisionParser(fallback_query)
+    parser.feed(raw or "")
+    parser.close()
+    return parser.result()
+
+
+async def adecide(chunks: AsyncIterator[Any], fallback_query: str = "") -> Tuple[str, str, Dict[str, Any]]:
+    """消费异步 token 流，能定案时立即关闭流（服务端随连接关闭停止生成）。
+
+    返回 (decision, tool_input, info)；info 含 early（是否提前结束）、chars（实际接收的字符数）、
+    think_chars（丢弃的推理字符数）、parsed（decision 是否来自 JSON 而非子串判断）与 elapsed_ms。
+    块可以是字符串，也可以是带 content 属性的消息块。
+    """
+    started = time.perf_counter()
+    parser = DecisionParser(fallback_query)
+    early = False
+    try:
+        async for chunk in chunks:
+            text = chunk if isinstance(chunk, str) else getattr(chunk, "content", "")
+            if isinstance(text, str) and parser.feed(text):
+                early = True
+                break
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    if not early:
+        parser.close()
+    decision, tool_input = parser.result()
+    info = {
+        "early": early,
+        "chars": parser.chars,
+        "think_chars": parser.think.dropped_chars,
+        "parsed": "decision" in parser.json.fields,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    return decision, tool_input, info
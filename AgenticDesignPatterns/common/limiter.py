@@ -0,0 +1,353 @@
+"""
+扇出（RunnableParallel / asyncio.gather）的并发限制与自适应调整。
+
+单个本地 Ollama 同时只能高效处理少量请求；把所有分支一次性打过去，多个请求同时到来时
+模型服务会被压垮，吞吐反而下降。这里在“模型调用”这一层加闸门：
+
+- 全局上限：所有模型调用共享的固定并发数；
+- 每个模型的上限：按 AIMD 自适应——调用延迟接近空载基线时每轮 +1（加性增），
+  延迟超过基线的 latency_tolerance 倍或调用失败时乘以 backoff（乘性减）；
+  基线按调用点（site）分别记录：同一模型上的不同提示（总结 / 提问 / 术语 / 综合）生成的文本长短差别很大，
+  共用一个基线会把长输出误判为过载。wrap() 以提示中 system 消息（没有时取第一条消息）的首行作为调用点，
+  arun() / aslot() 可显式传入；
+- 排队指标：当前 / 最大排队深度、平均 / 最大等待时间，见 stats()。
+
+同一个限流器可以同时被线程（RunnableParallel.invoke 在线程池中执行各分支）
+和协程（ainvoke / asyncio.gather）使用：等待者排成一个 FIFO 队列，
+释放时按顺序唤醒（线程用 Event，协程用所在事件循环的 Future）。
+
+用法：
+- LangChain：prompt | limits.wrap(llm) | parser，所有扇出分支共享同一组闸门；
+- asyncio.gather：await asyncio.gather(limits.arun(model, coro1), limits.arun(model, coro2))。
+
+通过环境变量配置（见 get_limits）：
+- LLM_GLOBAL_CONCURRENCY: 全局并发上限（默认 8）。
+- LLM_MODEL_CONCURRENCY: 每个模型的初始并发上限（默认 4）。
+- LLM_MODEL_MAX_CONCURRENCY: 每个模型自适应调整的上限（默认 16）。
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None) -> None:
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+def _resolve(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发上限；adaptive=False 时为固定上限的信号量。"""
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        adaptive: bool = True,
+        latency_tolerance: float = 2.5,
+        backoff: float = 0.7,
+    ) -> None:
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("需要满足 1 <= min_limit <= initial <= max_limit")
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self._limit = float(initial)
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+        self._in_flight = 0
+        self._baselines: Dict[Any, float] = {}  # 调用点 -> 空载延迟基线（秒）
+        self._last_decrease = 0.0
+        self._stats = {
+            "acquired": 0,
+            "queued": 0,
+            "max_queue_depth": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0,
+            "increases": 0,
+            "decreases": 0,
+            "errors": 0,
+        }
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def _try_take(self) -> bool:
+        """有空位且没有人排队时直接占用；调用方需持有锁。"""
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return True
+        return False
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        self._waiters.append(waiter)
+        self._stats["queued"] += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+
+    def _grant(self) -> None:
+        """按 FIFO 顺序唤醒等待者，直到占满当前上限；调用方需持有锁。"""
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _record_wait(self, started: float) -> None:
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["wait_total_ms"] += waited_ms
+            self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], waited_ms)
+
+    def acquire(self) -> None:
+        """阻塞当前线程直到拿到一个并发名额。"""
+        started = time.perf_counter()
+        with self._lock:
+            if self._try_take():
+                waiter = None
+            else:
+                waiter = _Waiter(event=threading.Event())
+                self._enqueue(waiter)
+        if waiter is not None:
+            waiter.event.wait()
+        self._record_wait(started)
+
+    async def aacquire(self) -> None:
+        """在协程中等待一个并发名额，不阻塞事件循环。"""
+        import asyncio
+
+        started = time.perf_counter()
+        with self._lock:
+            if self._try_take():
+                waiter = None
+            else:
+                loop = asyncio.get_running_loop()
+                waiter = _Waiter(loop=loop, future=loop.create_future())
+                self._enqueue(waiter)
+        if waiter is not None:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if not waiter.granted:
+                        self._waiters.remove(waiter)
+                        raise
+                # 名额已经分配给了这个被取消的等待者，归还后再向上抛出
+                self.release(None)
+                raise
+        self._record_wait(started)
+
+    def release(self, latency: Optional[float], ok: bool = True, site: Any = None) -> None:
+        """归还名额；latency（秒）与调用点 site 的基线比较做 AIMD 调整，None 表示不参与调整。"""
+        now = time.perf_counter()
+        with self._lock:
+            self._in_flight -= 1
+            if not ok:
+                self._stats["errors"] += 1
+            if self.adaptive and (latency is not None or not ok):
+                self._adjust(latency, ok, now, site)
+            self._grant()
+
+    def _adjust(self, latency: Optional[float], ok: bool, now: float, site: Any) -> None:
+        baseline = self._baselines.get(site)
+        if latency is not None:
+            # 基线跟踪空载延迟：更快的观测立即下调，更慢的观测只缓慢上浮（适应提示长度的整体变化）
+            if baseline is None or latency < baseline:
+                baseline = latency
+            else:
+                baseline += (latency - baseline) * 0.01
+            self._baselines[site] = baseline
+        overloaded = not ok or (
+            latency is not None and baseline is not None
+            and latency > baseline * self.latency_tolerance
+        )
+        if overloaded:
+            # 同一批过载请求往往同时返回，冷却一个基线时长，避免连续多次减半
+            cooldown = baseline or 0.0
+            if now - self._last_decrease >= cooldown:
+                self._limit = max(float(self.min_limit), self._limit * self.backoff)
+                self._last_decrease = now
+                self._stats["decreases"] += 1
+        elif self._limit < self.max_limit:
+            # 加性增：大约每完成 limit 个请求上限 +1
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            self._stats["increases"] += 1
+
+    @contextmanager
+    def slot(self, site: Any = None):
+        self.acquire()
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.release(time.perf_counter() - started, ok, site)
+
+    @asynccontextmanager
+    async def aslot(self, site: Any = None):
+        await self.aacquire()
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.release(time.perf_counter() - started, ok, site)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["limit"] = self.limit
+            out["in_flight"] = self._in_flight
+            out["queue_depth"] = len(self._waiters)
+            out["baseline_ms"] = {str(site): round(value * 1000, 2) for site, value in self._baselines.items()}
+        total_ms = out.pop("wait_total_ms")
+        out["wait_avg_ms"] = round(total_ms / out["acquired"], 3) if out["acquired"] else 0.0
+        out["wait_max_ms"] = round(out["wait_max_ms"], 3)
+        return out
+
+
+def _model_key(runnable: Any) -> str:
+    return str(getattr(runnable, "model", None) or getattr(runnable, "model_name", None) or "default")
+
+
+def _site(inputs: Any) -> Optional[str]:
+    """调用点：提示中 system 消息（没有时取第一条消息）的首行，截断到 32 个字符；无法识别时为 None。"""
+    messages = inputs.to_messages() if hasattr(inputs, "to_messages") else inputs
+    if not isinstance(messages, list) or not messages:
+        return None
+    message = next((m for m in messages if getattr(m, "type", None) == "system"), messages[0])
+    content = getattr(message, "content", None)
+    if not isinstance(content, str):
+        return None
+    return content.strip().split("\n", 1)[0][:32]
+
+
+class ConcurrencyLimits:
+    """全局固定上限 + 每个模型一个 AIMD 限流器。先占模型名额、再占全局名额，顺序固定，不会死锁。"""
+
+    def __init__(self, global_limit: int = 8, model_initial: int = 4, model_max: int = 16) -> None:
+        self.global_limiter = AdaptiveLimiter("global", global_limit, global_limit, global_limit, adaptive=False)
+        self.model_initial = min(model_initial, model_max)
+        self.model_max = model_max
+        self._lock = threading.Lock()
+        self._models: Dict[str, AdaptiveLimiter] = {}
+
+    def limiter(self, model: str) -> AdaptiveLimiter:
+        with self._lock:
+            limiter = self._models.get(model)
+            if limiter is None:
+                limiter = AdaptiveLimiter(model, self.model_initial, 1, self.model_max)
+                self._models[model] = limiter
+        return limiter
+
+    # 延迟只统计调用本身，不包含排队等待全局名额的时间，否则模型限流器会把全局排队误判为过载。
+    @contextmanager
+    def slot(self, model: str, site: Any = None):
+        limiter = self.limiter(model)
+        limiter.acquire()
+        try:
+            self.global_limiter.acquire()
+        except BaseException:
+            limiter.release(None)
+            raise
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            latency = time.perf_counter() - started
+            self.global_limiter.release(latency, ok)
+            limiter.release(latency, ok, site)
+
+    @asynccontextmanager
+    async def aslot(self, model: str, site: Any = None):
+        limiter = self.limiter(model)
+        await limiter.aacquire()
+        try:
+            await self.global_limiter.aacquire()
+        except BaseException:
+            limiter.release(None)
+            raise
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            latency = time.perf_counter() - started
+            self.global_limiter.release(latency, ok)
+            limiter.release(latency, ok, site)
+
+    async def arun(self, model: str, awaitable: Awaitable[T], site: Any = None) -> T:
+        """在名额内等待 awaitable，用于包装 asyncio.gather 的每个分支；site 区分各分支的延迟基线。"""
+        async with self.aslot(model, site):
+            return await awaitable
+
+    def wrap(self, runnable: Any, model: Optional[str] = None):
+        """把模型（或任意 Runnable）包装成受限调用的 Runnable，sync / async 两条路径都受限。"""
+        from langchain_core.runnables import RunnableLambda
+
+        key = model or _model_key(runnable)
+
+        def _invoke(inputs: Any, config: Any = None) -> Any:
+            with self.slot(key, _site(inputs)):
+                return runnable.invoke(inputs, config)
+
+        async def _ainvoke(inputs: Any, config: Any = None) -> Any:
+            async with self.aslot(key, _site(inputs)):
+                return await runnable.ainvoke(inputs, config)
+
+        return RunnableLambda(_invoke, afunc=_ainvoke, name=f"limited[{key}]")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = dict(self._models)
+        return {
+            "global": self.global_limiter.stats(),
+            "models": {name: limiter.stats() for name, limiter in models.items()},
+        }
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, ConcurrencyLimits] = {}
+
+
+def get_limits() -> ConcurrencyLimits:
+    """返回进程内共享的并发限制（同一进程内所有示例、所有请求共用）。"""
+    with _shared_lock:
+        limits = _shared.get("limits")
+        if limits is None:
+            limits = ConcurrencyLimits(
+                global_limit=int(os.getenv("LLM_GLOBAL_CONCURRENCY", "8")),
+                model_initial=int(os.getenv("LLM_MODEL_CONCURRENCY", "4")),
+                model_max=int(os.getenv("LLM_MODEL_MAX_CONCURRENCY", "16")),
+            )
+            _shared["limits"] = limits
+    return limits
@@ -0,0 +1,192 @@
+"""
+按相关性与 token 预算挑选记忆。
+
+autogen/chap08 的 ListMemory 在每次模型调用时把全部记忆注入上下文，不论与当前任务是否相关；
+用户记忆增长到上千条时，提示长度随之线性增长。MemoryIndex 在 add() 时建好查询所需的索引：
+
+- BM25 倒排表：词 -> (条目编号数组, 词频数组)，查询时只访问查询词的倒排表，
+  用 NumPy 对这些条目一次性累加 BM25 分数；过于常见的词（倒排表超过 max_postings）不参与打分。
+- 可选的向量：add() 时传入嵌入向量（见 common/embeddings.py），归一化后写入矩阵，
+  查询时一次矩阵-向量乘得到余弦相似度；与归一化后的 BM25 分数按 embed_weight 加权。
+- BM25 按查询可达的分数归一化，而不是按本次的最高分：基准是一条平均长度、每个查询词各出现一次的条目，
+  即各查询词 idf 之和（索引中没有的查询词按 df=0 计入），超过 1 的截断为 1。
+  只命中一个次要词的条目分数也低，min_score 可以过滤弱匹配。
+- 挑选：按分数从高到低（同分时新记忆优先），在 token_budget 内贪心放入，最多 max_entries 条；
+  单条超出剩余预算的跳过，继续看下一条。
+
+分词与 common/tools.py 的知识表一致（英文单词与数字、单个汉字），但停用词表更完整：
+知识表的查询是短问句，记忆与任务则是完整的句子，should / be / must / i 这类虚词会让任意两条句子“相关”。
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .history import estimate_tokens
+from .tools import terms as _tool_terms
+
+_INITIAL_ROWS = 64
+
+# 英文虚词：代词、助动词、情态动词、介词、连词、限定词等
+_STOPWORDS = frozenset(
+    """
+    a about above after again against all am an and any are as at be because been before being below between
+    both but by can could did do does doing down during each few for from further had has have having he her
+    here hers herself him himself his how i if in into is it its itself just let lets me might more most must
+    my myself no nor not now of off on once only or other our ours ourselves out over own please same shall she
+    should so some such than that the their theirs them themselves then there these they this those through to
+    too under until up very was we were what whats when where which while who whom why will with would you your
+    yours yourself yourselves s t d ll m re ve
+    """.split()
+)
+
+
+def terms(text: str) -> List[str]:
+    """记忆与查询的词：common/tools.py 的 terms，再去掉英文虚词。"""
+    return [word for word in _tool_terms(text) if word not in _STOPWORDS]
+
+
+class MemoryIndex:
+    """记忆文本的 BM25 + 向量索引；条目编号即 add() 的顺序。"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, embed_weight: float = 0.5, max_postings: int = 100000) -> None:
+        self.k1 = k1
+        self.b = b
+        self.embed_weight = embed_weight
+        self.max_postings = max_postings
+        self._stats = {"queries": 0, "postings_scored": 0, "selected": 0, "selected_tokens": 0, "over_budget": 0}
+        self.clear()
+
+    def clear(self) -> None:
+        self.size = 0
+        self.tokens = np.zeros(_INITIAL_ROWS, dtype=np.int64)  # 每条注入时的估算 token 数
+        self.lengths = np.zeros(_INITIAL_ROWS, dtype=np.float64)  # 每条的词数（BM25 文档长度）
+        self._total_length = 0.0
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # 倒排表的数组形式，条目增加后按需重建
+        self.vectors: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self) -> None:
+        grow = len(self.tokens) * 2
+        self.tokens = np.resize(self.tokens, grow)
+        self.lengths = np.resize(self.lengths, grow)
+        if self.vectors is not None:
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+
+    def add(self, text: str, vector: Optional[Any] = None, tokens: Optional[int] = None) -> int:
+        """加入一条记忆；tokens 是注入时占用的 token 数（默认按文本估算）。"""
+        if self.size == len(self.tokens):
+            self._grow()
+        row = self.size
+        words = terms(text)
+        counts: Dict[str, int] = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        for word, tf in counts.items():
+            ids, tfs = self._postings.setdefault(word, ([], []))
+            ids.append(row)
+            tfs.append(tf)
+            self._arrays.pop(word, None)
+        self.tokens[row] = estimate_tokens(text) if tokens is None else tokens
+        self.lengths[row] = len(words)
+        self._total_length += len(words)
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+            if self.vectors is None:
+                self.vectors = np.zeros((len(self.tokens), len(vector)), dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            if norm > 0:
+                self.vectors[row] = vector / norm
+        self.size += 1
+        return row
+
+    def _posting(self, word: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        arrays = self._arrays.get(word)
+        if arrays is None:
+            found = self._postings.get(word)
+            if found is None:
+                return None
+            arrays = self._arrays[word] = (np.asarray(found[0], dtype=np.int64), np.asarray(found[1], dtype=np.float64))
+        return arrays
+
+    def scores(self, query: str, vector: Optional[Any] = None) -> np.ndarray:
+        """每条记忆与查询的相关性分数（0~1）；没有任何相关性的条目为 0。"""
+        n = self.size
+        bm25 = np.zeros(n, dtype=np.float64)
+        if not n:
+            return bm25
+        avg_length = self._total_length / n or 1.0
+        attainable = 0.0  # 平均长度、每个查询词各出现一次的条目的分数，即各查询词 idf 之和
+        for word in dict.fromkeys(terms(query)):
+            posting = self._posting(word)
+            if posting is None:
+                attainable += math.log(1 + (n + 0.5) / 0.5)
+                continue
+            if len(posting[0]) > self.max_postings:
+                continue
+            ids, tfs = posting
+            df = len(ids)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[ids] / avg_length)
+            bm25[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            attainable += idf
+            self._stats["postings_scored"] += df
+        if attainable > 0:
+            np.minimum(bm25 / attainable, 1.0, out=bm25)
+        if vector is None or self.vectors is None:
+            return bm25
+        query_vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(query_vector))
+        if norm == 0:
+            return bm25
+        cosine = np.clip(self.vectors[:n] @ (query_vector / norm), 0.0, None)
+        return (1 - self.embed_weight) * bm25 + self.embed_weight * cosine
+
+    def select(
+        self,
+        query: str,
+        vector: Optional[Any] = None,
+        token_budget: int = 256,
+        max_entries: int = 8,
+        min_score: float = 0.0,
+    ) -> List[Tuple[int, float]]:
+        """按相关性挑选在 token_budget 内的条目，返回 [(条目编号, 分数)]，分数从高到低。"""
+        self._stats["queries"] += 1
+        scores = self.scores(query, vector)
+        candidates = np.flatnonzero(scores > min_score)
+        if not len(candidates):
+            return []
+        # 分数降序；同分时编号大（更新）的在前
+        order = candidates[np.lexsort((-candidates, -scores[candidates]))]
+        chosen: List[Tuple[int, float]] = []
+        used = skipped = 0
+        for row in order.tolist():
+            cost = int(self.tokens[row])
+            if used + cost > token_budget:
+                # 放不下的跳过；跳过太多说明剩余预算已塞不进候选，不再遍历长尾
+                skipped += 1
+                self._stats["over_budget"] += 1
+                if skipped > 4 * max_entries:
+                    break
+                continue
+            chosen.append((row, float(scores[row])))
+            used += cost
+            if len(chosen) >= max_entries or token_budget - used <= 0:
+                break
+        self._stats["selected"] += len(chosen)
+        self._stats["selected_tokens"] += used
+        return chosen
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self._stats)
+        out["entries"] = self.size
+        out["terms"] = len(self._postings)
+        out["stored_tokens"] = int(self.tokens[:self.size].sum())
+        queries = out["queries"]
+        out["avg_selected"] = round(out["selected"] / queries, 3) if queries else 0.0
+        out["avg_selected_tokens"] = round(out["selected_tokens"] / queries, 1) if queries else 0.0
+        return out
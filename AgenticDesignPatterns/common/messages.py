@@ -0,0 +1,147 @@
+"""
+Autogen 消息（TaskResult.messages）的文本提取，autogen 各章共用。
+
+chap04–chap07 原先各自复制一份 _extract_text：逐条消息、逐个片段重复做 getattr / isinstance 探测，
+再把整段对话 join 起来——即使调用方只需要最后一条回复（chap02、chap03 另写了反向扫描）。这里合并为一个实现：
+
+- 片段读取按类型分派并缓存：content 为列表时，每种片段类型的读取方式只解析一次——str 直接使用，dict 取
+  text / content 键（都没有时转字符串），声明了 text / content 字段的 pydantic / dataclass 类型直接读字段，两者都没有声明的
+  （Image、FunctionCall 等）直接转字符串，无法确定的类型才逐个探测属性——之后同类型片段直接查表；
+- extract_text(messages)：单次遍历，片段直接写进同一个列表，不为每条消息构造中间结果；
+- last_text(messages)：单个智能体 run() 只需要最后一条回复（前面是任务提示本身），从尾部向前
+  找第一条非空文本；序列直接反向迭代，不复制、不展开整段对话，非序列的迭代器也只保留最后一条。
+
+bench/extract_text.py 在 1 万条消息的 TaskResult 上对比新旧实现。
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_Reader = Callable[[Any], Optional[str]]
+
+
+def _read_str(part: str) -> Optional[str]:
+    return part
+
+
+def _read_dict(part: Dict[str, Any]) -> Optional[str]:
+    text = part.get("text") or part.get("content")
+    return text if isinstance(text, str) else str(part)  # 没有文本键的片段与旧实现一样转字符串
+
+
+def _read_object(part: Any) -> Optional[str]:
+    text = getattr(part, "text", None)
+    if isinstance(text, str):
+        return text
+    text = getattr(part, "content", None)
+    if isinstance(text, str):
+        return text
+    return str(part)  # 未知类型（图片、FunctionCall 等）退回字符串形式
+
+
+def _read_text_field(part: Any) -> Optional[str]:
+    text = part.text
+    return text if isinstance(text, str) else _read_object(part)
+
+
+def _read_content_field(part: Any) -> Optional[str]:
+    text = part.content
+    return text if isinstance(text, str) else _read_object(part)
+
+
+def _declared_fields(cls: type) -> Optional[frozenset]:
+    """有字段声明（pydantic / dataclass）的类型返回字段名集合，否则返回 None（属性可能是动态的）。"""
+    fields = getattr(cls, "model_fields", None)
+    if not isinstance(fields, dict):
+        fields = getattr(cls, "__dataclass_fields__", None)
+    return frozenset(fields) if isinstance(fields, dict) else None
+
+
+_READERS: Dict[type, _Reader] = {str: _read_str, dict: _read_dict}
+
+
+def _reader_for(cls: type) -> _Reader:
+    """解析某个片段类型的读取函数并缓存：字段声明里有 text / content 的直接读该字段，
+    两者都没有的直接转字符串，只有无法确定的类型才逐个探测属性。"""
+    if issubclass(cls, str):
+        reader: _Reader = _read_str
+    elif issubclass(cls, dict):
+        reader = _read_dict
+    else:
+        fields = _declared_fields(cls)
+        if fields is None or hasattr(cls, "text") or hasattr(cls, "content"):
+            reader = _read_object
+        elif "text" in fields:
+            reader = _read_text_field
+        elif "content" in fields:
+            reader = _read_content_field
+        else:
+            reader = str
+    _READERS[cls] = reader
+    return reader
+
+
+def _append_parts(content: List[Any], out: List[str]) -> None:
+    readers = _READERS
+    for part in content:
+        cls = type(part)
+        if cls is str:
+            if part:
+                out.append(part)
+            continue
+        reader = readers.get(cls) or _reader_for(cls)
+        text = reader(part)
+        if text:
+            out.append(text)
+
+
+def message_text(message: Any) -> str:
+    """单条消息的文本；没有文本时返回空字符串。"""
+    content = getattr(message, "content", None)
+    if type(content) is str:  # 绝大多数消息：TextMessage 等
+        return content
+    if isinstance(content, str):
+        return str(content)
+    if isinstance(content, list):
+        out: List[str] = []
+        _append_parts(content, out)
+        return "\n".join(out)
+    return ""
+
+
+def extract_text(messages: Iterable[Any]) -> str:
+    """把整段对话的文本按换行拼接（群聊需要完整记录时使用）。"""
+    out: List[str] = []
+    append = out.append
+    # 热循环内联了 message_text 的分支，省掉每条消息一次函数调用
+    for message in messages:
+        content = getattr(message, "content", None)
+        if type(content) is str:
+            if content:
+                append(content)
+        elif isinstance(content, list):
+            _append_parts(content, out)
+        elif isinstance(content, str) and content:
+            append(str(content))
+    return "\n".join(out).strip()
+
+
+def last_text(messages: Optional[Iterable[Any]]) -> str:
+    """最后一条非空消息的文本；没有时返回空字符串。"""
+    if not messages:
+        return ""
+    try:
+        backwards = reversed(messages)  # type: ignore[call-overload]
+    except TypeError:
+        backwards = None
+    if backwards is not None:
+        for message in backwards:
+            text = message_text(message).strip()
+            if text:
+                return text
+        return ""
+    last = ""
+    for message in messages:
+        text = message_text(message).strip()
+        if text:
+            last = text
+    return last
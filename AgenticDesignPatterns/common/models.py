@@ -0,0 +1,184 @@
+"""
+进程级共享的聊天模型工厂。
+
+各章节原先各自复制一份 build_model()，并在导入时新建 ChatOllama/ChatOpenAI，
+每个客户端都有自己的 httpx 连接池。这里改为：
+
+- 按 (provider, model, temperature) 缓存模型实例，同一进程内重复调用直接复用；
+- 所有实例共用同一对 httpx transport（同步 / 异步各一个），
+  因此对同一服务端的请求复用同一组 keep-alive 连接，避免重复的 TCP/TLS 握手；
+  异步连接绑定在创建它的事件循环上，异步 transport 因此按正在运行的事件循环各建一个连接池，
+  同一进程内多次 asyncio.run 不会复用上一个（已关闭的）事件循环的连接。
+
+可选环境变量：
+- LLM_MODEL: 未显式传入 model_name 时使用的模型名。
+- LLM_MAX_CONNECTIONS: 连接池最大连接数（默认 20）。
+- LLM_KEEPALIVE_EXPIRY: 空闲 keep-alive 连接的保留秒数（默认 60）。
+- LLM_CACHE: 启用响应缓存（"memory" 或 SQLite 文件路径），见 common/cache.py。
+- LLM_THINK: 设为 "off" 时请求 Ollama 关闭推理（reasoning=False），见 common/reasoning.py。
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "ollama": "deepseek-r1:14b",
+}
+
+_lock = threading.Lock()
+_models: Dict[Tuple[str, str, Optional[float]], Any] = {}
+_transports: Dict[str, Any] = {}
+
+
+def _per_loop_transport(limits: Any) -> Any:
+    """异步 transport：按正在运行的事件循环各建一个 httpx.AsyncHTTPTransport（连接池绑定在事件循环上）。"""
+    import asyncio
+
+    import httpx
+
+    class PerLoopTransport(httpx.AsyncBaseTransport):
+        def __init__(self) -> None:
+            self._lock = threading.Lock()
+            self._pools: Dict[Any, httpx.AsyncHTTPTransport] = {}
+
+        def _pool(self) -> httpx.AsyncHTTPTransport:
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                pool = self._pools.get(loop)
+                if pool is None:
+                    # 新事件循环：顺带丢弃已关闭事件循环的连接池（其连接已随事件循环失效，
+                    # 事件循环关闭后无法再 await aclose()，套接字由垃圾回收关闭）
+                    for closed in [other for other in self._pools if other.is_closed()]:
+                        del self._pools[closed]
+                    pool = self._pools[loop] = httpx.AsyncHTTPTransport(limits=limits)
+            return pool
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            return await self._pool().handle_async_request(request)
+
+        async def aclose(self) -> None:
+            # 只能在所属事件循环中关闭，其余的交给 close_all
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                pool = self._pools.pop(loop, None)
+            if pool is not None:
+                await pool.aclose()
+
+        def close_all(self) -> None:
+            """关闭全部连接池：未运行的事件循环中同步关闭，正在运行的调度到其中关闭，已关闭的直接丢弃。"""
+            with self._lock:
+                pools = list(self._pools.items())
+                self._pools.clear()
+            for loop, pool in pools:
+                if loop.is_closed():
+                    continue
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(pool.aclose(), loop)
+                else:
+                    loop.run_until_complete(pool.aclose())
+
+    return PerLoopTransport()
+
+
+def _shared_transports() -> Tuple[Any, Any]:
+    """返回进程内共享的 (同步, 异步) httpx transport，首次调用时创建。"""
+    if not _transports:
+        # 延迟导入，避免仅导入本模块时就加载 httpx
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+        )
+        _transports["sync"] = httpx.HTTPTransport(limits=limits)
+        _transports["async"] = _per_loop_transport(limits)
+    return _transports["sync"], _transports["async"]
+
+
+def _create_model(provider: str, name: str, temperature: Optional[float]):
+    sync_transport, async_transport = _shared_transports()
+    extra: Dict[str, Any] = {} if temperature is None else {"temperature": temperature}
+    if os.getenv("LLM_CACHE"):
+        # 仅在启用时才导入缓存模块（依赖 langchain_core）
+        from .cache import get_response_cache
+
+        cache = get_response_cache()
+        if cache is not None:
+            extra["cache"] = cache
+
+    if provider == "openai":
+        # 延迟导入，避免未安装依赖或本地无用时报错
+        import httpx
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            model=name,
+            http_client=httpx.Client(transport=sync_transport),
+            http_async_client=httpx.AsyncClient(transport=async_transport),
+            **extra,
+        )
+
+    if os.getenv("LLM_THINK"):
+        from .reasoning import ollama_think_kwargs
+
+        extra.update(ollama_think_kwargs())
+
+    # 延迟导入，避免未安装依赖或本地无用时报错
+    from langchain_ollama import ChatOllama
+
+    return ChatOllama(
+        model=name,
+        sync_client_kwargs={"transport": sync_transport},
+        async_client_kwargs={"transport": async_transport},
+        **extra,
+    )
+
+
+def build_model(
+    provider: str,
+    model_name: Optional[str] = None,
+    temperature: Optional[float] = None,
+):
+    """根据提供商返回（共享的）聊天模型。
+
+    参数：
+    - provider: "openai" 或 "ollama"
+    - model_name: 可选模型名；不传则读取环境变量 LLM_MODEL；再不传使用合理默认值。
+    - temperature: 可选采样温度；不传则使用模型默认值。
+
+    相同 (provider, model, temperature) 的调用返回同一个实例。
+    """
+    provider = provider.lower()
+    if provider not in DEFAULT_MODELS:
+        raise ValueError(
+            f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
+        )
+
+    name = model_name or os.getenv("LLM_MODEL") or DEFAULT_MODELS[provider]
+    key = (provider, name, temperature)
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _create_model(provider, name, temperature)
+            _models[key] = model
+    return model
+
+
+def clear_models() -> None:
+    """清空模型缓存并关闭共享的同步 / 异步连接池（主要用于测试或切换服务端）。"""
+    with _lock:
+        _models.clear()
+        sync_transport = _transports.pop("sync", None)
+        async_transport = _transports.pop("async", None)
+    if sync_transport is not None:
+        sync_transport.close()
+    if async_transport is not None:
+        async_transport.close_all()
@@ -0,0 +1,273 @@
+"""
+推理模型（deepseek-r1 等）输出中 <think>...</think> 段的流式过滤。
+
+示例默认使用 deepseek-r1，它的每次回复都带一段很长的推理。推理段原样流过 StrOutputParser、
+autogen 的 _extract_text，再被拼进下一阶段的提示（chap01 的 {specifications}、chap03 的汇总提示等），
+是提示长度最大的浪费。这里在输出进入下一阶段之前把推理段去掉：
+
+- ThinkFilter：逐块接收模型输出，返回去掉推理段之后的可见文本。标签可能被拆在两个块之间
+  （"<thi" + "nk>"），块尾可能是标签前缀的部分先暂存；未闭合的 <think> 段一直丢弃到流结束；
+  推理段之后紧跟的空白一并去掉。统计丢弃的字符数与估算 token 数。
+- text_parser()：LangChain 中替代 StrOutputParser()，流式与非流式路径都会过滤；
+- visible_text()：直接读取 .content 的代码（chap04、chap11）使用；
+- ReasoningFilterClient：Autogen 模型客户端的代理，create / create_stream 的文本都会过滤，
+  因此推理段也不会进入智能体的对话上下文。
+
+通过环境变量 LLM_THINK 选择模式（见 think_mode）：
+- "strip"（默认）：过滤推理段；
+- "off"：另外请求后端关闭推理（Ollama 的 think=false；LangChain 中为 ChatOllama(reasoning=False)），
+  支持的模型直接不生成推理 token，不支持时仍由过滤兜底；
+- "keep"：不做任何处理（原行为）。
+
+reasoning_stats() 汇总本进程内所有过滤的结果：处理的回复数、含推理的回复数、丢弃 / 保留的字符与估算 token 数。
+"""
+
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+from .history import estimate_tokens
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+_WS = " \t\r\n"
+
+
+def think_mode() -> str:
+    mode = (os.getenv("LLM_THINK") or "strip").strip().lower()
+    return mode if mode in ("strip", "off", "keep") else "strip"
+
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """text 末尾与 tag 前缀重合的最大长度（可能是被拆开的标签）。"""
+    for size in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+
+class ThinkFilter:
+    """流式去除 <think>...</think> 段。"""
+
+    def __init__(self) -> None:
+        self.inside = False
+        self.spans = 0
+        self.dropped_chars = 0
+        self.dropped_tokens = 0  # 流式时每个块约为一个 token，按块估算更接近真实值
+        self.kept_chars = 0
+        self._pending = ""
+        self._started = False  # 是否已输出过非空白的可见文本
+
+    def feed(self, chunk: str) -> str:
+        """输入一个块，返回其中可以确定为可见的文本（可能为空字符串）。"""
+        text = self._pending + (chunk or "")
+        self._pending = ""
+        out: List[str] = []
+        while text:
+            tag = CLOSE_TAG if self.inside else OPEN_TAG
+            idx = text.find(tag)
+            if idx >= 0:
+                self._emit(out, text[:idx])
+                self._drop(tag)
+                if not self.inside:
+                    self.spans += 1
+                self.inside = not self.inside
+                text = text[idx + len(tag):]
+                continue
+            keep = _partial_suffix(text, tag)
+            self._emit(out, text[:len(text) - keep])
+            self._pending = text[len(text) - keep:]
+            break
+        return "".join(out)
+
+    def _drop(self, text: str) -> None:
+        if text:
+            self.dropped_chars += len(text)
+            self.dropped_tokens += estimate_tokens(text)
+
+    def _emit(self, out: List[str], text: str) -> None:
+        if self.inside:
+            self._drop(text)
+            return
+        if not self._started and self.spans:
+            # 推理段之后的换行 / 空白不属于回答
+            stripped = text.lstrip(_WS)
+            self._drop(text[:len(text) - len(stripped)])
+            text = stripped
+        if text:
+            self._started = self._started or bool(text.strip(_WS))
+            self.kept_chars += len(text)
+            out.append(text)
+
+    def flush(self) -> str:
+        """流结束：暂存的半个标签按普通文本处理（推理段内的则丢弃）。"""
+        text, self._pending = self._pending, ""
+        out: List[str] = []
+        self._emit(out, text)
+        return "".join(out)
+
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {
+    "responses": 0, "with_reasoning": 0, "dropped_chars": 0, "dropped_tokens": 0, "kept_chars": 0, "kept_tokens": 0,
+}
+
+
+def _record(f: ThinkFilter, kept_text: str = "") -> None:
+    with _stats_lock:
+        _stats["responses"] += 1
+        _stats["with_reasoning"] += 1 if f.spans else 0
+        _stats["dropped_chars"] += f.dropped_chars
+        _stats["dropped_tokens"] += f.dropped_tokens
+        _stats["kept_chars"] += f.kept_chars
+        _stats["kept_tokens"] += estimate_tokens(kept_text)
+
+
+def reasoning_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_stats)
+    total = out["dropped_tokens"] + out["kept_tokens"]
+    out["dropped_fraction"] = round(out["dropped_tokens"] / total, 3) if total else 0.0
+    out["mode"] = think_mode()
+    return out
+
+
+def strip_think(text: str, record: bool = False) -> str:
+    """一次性去除完整文本中的推理段；record=True 时计入 reasoning_stats()。"""
+    f = ThinkFilter()
+    out = f.feed(text) + f.flush()
+    if record:
+        _record(f, out)
+    return out
+
+
+def visible_text(message: Any) -> str:
+    """模型回复（消息对象或字符串）去掉推理段后的文本；LLM_THINK=keep 时原样返回。"""
+    text = message if isinstance(message, str) else getattr(message, "content", "")
+    if not isinstance(text, str):
+        text = str(text)
+    return text if think_mode() == "keep" else strip_think(text, record=True)
+
+
+def filter_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """过滤同步文本流，流结束（或提前关闭）时计入统计。"""
+    f = ThinkFilter()
+    kept: List[str] = []
+    try:
+        for chunk in chunks:
+            out = f.feed(chunk)
+            if out:
+                kept.append(out)
+                yield out
+        tail = f.flush()
+        if tail:
+            kept.append(tail)
+            yield tail
+        if not kept:
+            yield ""  # 空回复或只有推理段：与 StrOutputParser 一样得到 ""，而不是 None
+    finally:
+        _record(f, "".join(kept))
+
+
+async def afilter_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """filter_stream 的异步版本。"""
+    f = ThinkFilter()
+    kept: List[str] = []
+    try:
+        async for chunk in chunks:
+            out = f.feed(chunk)
+            if out:
+                kept.append(out)
+                yield out
+        tail = f.flush()
+        if tail:
+            kept.append(tail)
+            yield tail
+        if not kept:
+            yield ""  # 空回复或只有推理段：与 StrOutputParser 一样得到 ""，而不是 None
+    finally:
+        _record(f, "".join(kept))
+
+
+def text_parser():
+    """替代 StrOutputParser()：输出文本并流式去除推理段（LLM_THINK=keep 时即为 StrOutputParser）。"""
+    from langchain_core.output_parsers import StrOutputParser
+
+    if think_mode() == "keep":
+        return StrOutputParser()
+    from langchain_core.runnables import RunnableGenerator
+
+    return StrOutputParser() | RunnableGenerator(filter_stream, afilter_stream, name="strip_reasoning")
+
+
+def ollama_think_kwargs() -> Dict[str, Any]:
+    """LLM_THINK=off 时传给 ChatOllama 的参数（关闭推理）。"""
+    return {"reasoning": False} if think_mode() == "off" else {}
+
+
+class ReasoningFilterClient:
+    """Autogen ChatCompletionClient 的代理：create / create_stream 的文本去除推理段，其余原样转发。
+
+    LLM_THINK=off 时通过 extra_create_args 请求后端关闭推理；后端不接受该参数时自动退回只过滤。
+    """
+
+    def __init__(self, client: Any) -> None:
+        self._client = client
+        self._think_arg = think_mode() == "off"
+
+    def _kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if not self._think_arg:
+            return kwargs
+        extra = dict(kwargs.get("extra_create_args") or {})
+        extra.setdefault("think", False)
+        return {**kwargs, "extra_create_args": extra}
+
+    @staticmethod
+    def _with_content(result: Any, content: str) -> Any:
+        if hasattr(result, "model_copy"):
+            return result.model_copy(update={"content": content})
+        result.content = content
+        return result
+
+    async def create(self, messages: Any, **kwargs: Any) -> Any:
+        if think_mode() == "keep":
+            return await self._client.create(messages, **kwargs)
+        try:
+            result = await self._client.create(messages, **self._kwargs(kwargs))
+        except (TypeError, ValueError):
+            if not self._think_arg:
+                raise
+            self._think_arg = False  # 后端不支持 think 参数
+            result = await self._client.create(messages, **kwargs)
+        content = getattr(result, "content", None)
+        if isinstance(content, str):
+            result = self._with_content(result, strip_think(content, record=True))
+        return result
+
+    async def create_stream(self, messages: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        if think_mode() == "keep":
+            async for item in self._client.create_stream(messages, **kwargs):
+                yield item
+            return
+        f = ThinkFilter()
+        kept: List[str] = []
+        try:
+            async for item in self._client.create_stream(messages, **self._kwargs(kwargs)):
+                if isinstance(item, str):
+                    out = f.feed(item)
+                    if out:
+                        kept.append(out)
+                        yield out
+                    continue
+                # 流末尾的 CreateResult：先吐出暂存的文本，再给出去除推理段的完整结果
+                tail = f.flush()
+                if tail:
+                    kept.append(tail)
+                    yield tail
+                content = getattr(item, "content", None)
+                yield self._with_content(item, strip_think(content)) if isinstance(content, str) else item
+        finally:
+            _record(f, "".join(kept))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
@@ -0,0 +1,293 @@
+"""
+分层路由器：把“只输出 booker / info / unclear 一个单词”的路由请求尽量留在本地完成。
+
+三层依次尝试，前一层有把握时直接返回：
+1. 规则层：含义明确的多字关键词 / 正则，恰好只有一个标签命中时采用；
+2. 分类层：轻量线性分类器（字符 n-gram 特征 + 多分类逻辑回归，纯 Python），
+   最高概率 >= min_confidence 时采用；
+3. LLM 层：前两层都没把握时才调用传入的 LLM 回调，其结果会写入决策日志并在线更新分类器，
+   同类请求下次即可在本地完成。
+
+决策日志为 JSONL（每行 {"request": ..., "label": ...}），启动时读取用于训练。
+stats() 给出各层所占比例与平均耗时。
+
+通过环境变量配置（见 get_router）：
+- ROUTER_MODE: 设为 "llm" 时跳过前两层，总是调用 LLM（便于对比），默认分层。
+- ROUTER_MIN_CONFIDENCE: 分类层的置信度阈值（默认 0.7）。
+- ROUTER_LOG: 决策日志路径；不设置时只在进程内学习。
+"""
+
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+LABELS: Tuple[str, ...] = ("booker", "info", "unclear")
+
+# 规则层：每个标签一组模式；同时命中多个标签时交给分类层判断。
+# 规则命中即直接采用，因此只放含义明确的多字词：单字“订”会把“订阅”路由到 booker，
+# 句首疑问词（how / what、什么 / 怎么样）也常见于闲聊，这类请求交给分类层判断。
+DEFAULT_RULES: Dict[str, Sequence[str]] = {
+    "booker": (
+        r"订票|订机票|订酒店|订房|订一[张间个]|订两[张间]|预订|预定|机票|航班|住宿",
+        r"\bbook (?:a |an |the |me )?(?:flight|hotel|room|ticket|table)s?\b|\breserv(?:e|ation)\b|\bflights?\b|\bhotels?\b",
+    ),
+    "info": (
+        r"首都|天气|人口|海拔|有多高|有多远|是谁发明|哪一年",
+        r"\bcapital of\b|\bweather\b|\bpopulation of\b",
+    ),
+}
+
+# 冷启动用的种子样本；运行中由 LLM 层的决策不断补充。
+# 不包含 chap02 的演示请求，否则演示与基准测到的只是训练集上的命中。
+SEED_EXAMPLES: Tuple[Tuple[str, str], ...] = (
+    ("预订明天去上海的航班", "booker"),
+    ("我想订一间巴黎的酒店", "booker"),
+    ("下周去东京，帮我安排住宿", "booker"),
+    ("订两张周五飞北京的票", "booker"),
+    ("帮我买一张去广州的火车票", "booker"),
+    ("book a flight to new york", "booker"),
+    ("reserve a hotel room in rome", "booker"),
+    ("法国的首都是什么", "info"),
+    ("伦敦今天天气怎么样", "info"),
+    ("珠穆朗玛峰有多高", "info"),
+    ("谁发明了电话", "info"),
+    ("长城有多长", "info"),
+    ("what is the capital of spain", "info"),
+    ("how tall is the eiffel tower", "info"),
+    ("给我讲讲历史吧", "unclear"),
+    ("帮我一下", "unclear"),
+    ("随便聊聊吧", "unclear"),
+    ("我不知道该怎么办", "unclear"),
+    ("会员怎么取消", "unclear"),
+    ("你好吗", "unclear"),
+    ("嗯", "unclear"),
+    ("tell me something", "unclear"),
+    ("can you help me", "unclear"),
+    ("nice to meet you", "unclear"),
+)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_THINK_RE = re.compile(r"<think>.*?</think>", re.S)
+
+
+def parse_label(text: str, labels: Sequence[str] = LABELS, default: str = "unclear") -> str:
+    """从 LLM 输出中取出标签：去掉 <think> 段后，取第一个出现的标签名（兼容 'book' 前缀）。"""
+    cleaned = _THINK_RE.sub("", text or "").strip().lower()
+    best: Optional[Tuple[int, str]] = None
+    for label in labels:
+        pos = cleaned.find(label)
+        if pos < 0 and label == "booker":
+            pos = cleaned.find("book")
+        if pos >= 0 and (best is None or pos < best[0]):
+            best = (pos, label)
+    return best[1] if best else default
+
+
+def featurize(text: str) -> Dict[str, float]:
+    """英文按单词、中文按字的 1/2-gram 提取二值特征，并按特征数归一化。"""
+    lowered = (text or "").lower()
+    feats: List[str] = [f"w:{w}" for w in _WORD_RE.findall(lowered)]
+    for run in _CJK_RE.findall(lowered):
+        feats.extend(f"c:{ch}" for ch in run)
+        feats.extend(f"b:{run[i:i + 2]}" for i in range(len(run) - 1))
+    if "?" in lowered or "？" in lowered:
+        feats.append("q:?")
+    if not feats:
+        return {}
+    value = 1.0 / math.sqrt(len(feats))
+    return {f: value for f in feats}
+
+
+class LinearClassifier:
+    """稀疏特征上的多分类逻辑回归，支持批量训练与单样本在线更新。"""
+
+    def __init__(self, labels: Sequence[str] = LABELS, lr: float = 0.5, l2: float = 1e-4) -> None:
+        self.labels = tuple(labels)
+        self.lr = lr
+        self.l2 = l2
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        self._bias = [0.0] * len(self.labels)
+        self._weights: Dict[str, List[float]] = {}
+
+    def predict_proba(self, feats: Dict[str, float]) -> List[float]:
+        scores = list(self._bias)
+        for name, value in feats.items():
+            row = self._weights.get(name)
+            if row is not None:
+                for i, w in enumerate(row):
+                    scores[i] += w * value
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, feats: Dict[str, float]) -> Tuple[str, float]:
+        proba = self.predict_proba(feats)
+        i = max(range(len(proba)), key=proba.__getitem__)
+        return self.labels[i], proba[i]
+
+    def update(self, feats: Dict[str, float], label: str) -> None:
+        y = self._index[label]
+        proba = self.predict_proba(feats)
+        grads = [p - (1.0 if i == y else 0.0) for i, p in enumerate(proba)]
+        for i, g in enumerate(grads):
+            self._bias[i] -= self.lr * g
+        for name, value in feats.items():
+            row = self._weights.setdefault(name, [0.0] * len(self.labels))
+            for i, g in enumerate(grads):
+                row[i] -= self.lr * (g * value + self.l2 * row[i])
+
+    def fit(self, examples: Iterable[Tuple[str, str]], epochs: int = 20, seed: int = 0) -> None:
+        data = [(featurize(text), label) for text, label in examples if label in self._index]
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for feats, label in data:
+                self.update(feats, label)
+
+
+@dataclass
+class RouteDecision:
+    label: str
+    tier: str  # "rule" / "classifier" / "llm"
+    confidence: float
+    elapsed_ms: float
+
+
+class TieredRouter:
+    """规则 -> 线性分类器 -> LLM 的分层路由器。"""
+
+    TIERS = ("rule", "classifier", "llm")
+
+    def __init__(
+        self,
+        labels: Sequence[str] = LABELS,
+        rules: Optional[Dict[str, Sequence[str]]] = None,
+        min_confidence: float = 0.7,
+        log_path: Optional[str] = None,
+        seed_examples: Iterable[Tuple[str, str]] = SEED_EXAMPLES,
+        default: str = "unclear",
+        llm_only: bool = False,
+    ) -> None:
+        self.labels = tuple(labels)
+        self.default = default
+        self.min_confidence = min_confidence
+        self.log_path = log_path
+        self.llm_only = llm_only
+        rules = DEFAULT_RULES if rules is None else rules
+        self._rules: List[Tuple[str, Pattern[str]]] = [
+            (label, re.compile(pattern, re.I)) for label, patterns in rules.items() for pattern in patterns
+        ]
+        self._lock = threading.Lock()
+        self._counts = {tier: 0 for tier in self.TIERS}
+        self._elapsed = {tier: 0.0 for tier in self.TIERS}
+        self.classifier = LinearClassifier(self.labels)
+        self.classifier.fit(list(seed_examples) + self._load_log())
+
+    def _load_log(self) -> List[Tuple[str, str]]:
+        if not self.log_path or not os.path.exists(self.log_path):
+            return []
+        examples = []
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                    examples.append((row["request"], row["label"]))
+                except (ValueError, KeyError):
+                    continue
+        return examples
+
+    def _local(self, request: str) -> Optional[Tuple[str, str, float]]:
+        """前两层：返回 (标签, 层名, 置信度)；都没把握时返回 None。"""
+        if self.llm_only:
+            return None
+        matched = {label for label, pattern in self._rules if pattern.search(request)}
+        if len(matched) == 1:
+            return matched.pop(), "rule", 1.0
+        label, confidence = self.classifier.predict(featurize(request))
+        if confidence >= self.min_confidence:
+            return label, "classifier", confidence
+        return None
+
+    def _record(self, tier: str, started: float) -> float:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._counts[tier] += 1
+            self._elapsed[tier] += elapsed_ms
+        return elapsed_ms
+
+    def learn(self, request: str, label: str) -> None:
+        """记录一条（通常来自 LLM 的）决策：在线更新分类器，并追加到决策日志。"""
+        if label not in self.labels:
+            return
+        with self._lock:
+            self.classifier.update(featurize(request), label)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"request": request, "label": label}, ensure_ascii=False) + "\n")
+
+    def route(self, request: str, llm: Optional[Callable[[str], str]] = None) -> RouteDecision:
+        """同步路由；llm(request) 返回模型原始输出，仅在本地两层都没把握时调用。"""
+        started = time.perf_counter()
+        local = self._local(request)
+        if local is not None:
+            label, tier, confidence = local
+            return RouteDecision(label, tier, confidence, self._record(tier, started))
+        label = parse_label(llm(request), self.labels, self.default) if llm else self.default
+        self.learn(request, label)
+        return RouteDecision(label, "llm", 1.0, self._record("llm", started))
+
+    async def aroute(self, request: str, allm: Optional[Callable[[str], Awaitable[str]]] = None) -> RouteDecision:
+        """异步路由；allm(request) 为协程函数，其余同 route。"""
+        started = time.perf_counter()
+        local = self._local(request)
+        if local is not None:
+            label, tier, confidence = local
+            return RouteDecision(label, tier, confidence, self._record(tier, started))
+        label = parse_label(await allm(request), self.labels, self.default) if allm else self.default
+        # 写日志是一次小的文件追加，放到线程里避免阻塞事件循环；asyncio 在此处才导入，不拖慢冷启动
+        import asyncio
+
+        await asyncio.to_thread(self.learn, request, label)
+        return RouteDecision(label, "llm", 1.0, self._record("llm", started))
+
+    def stats(self) -> Dict[str, Any]:
+        """各层请求数、占比与平均耗时（毫秒）。"""
+        with self._lock:
+            counts = dict(self._counts)
+            elapsed = dict(self._elapsed)
+        total = sum(counts.values())
+        out: Dict[str, Any] = {"requests": total}
+        for tier in self.TIERS:
+            n = counts[tier]
+            out[tier] = {
+                "count": n,
+                "fraction": round(n / total, 4) if total else 0.0,
+                "avg_ms": round(elapsed[tier] / n, 4) if n else 0.0,
+            }
+        return out
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, TieredRouter] = {}
+
+
+def get_router() -> TieredRouter:
+    """返回进程内共享的分层路由器（langchain / autogen 的 chap02 共用同一组标签）。"""
+    with _shared_lock:
+        router = _shared.get("router")
+        if router is None:
+            router = TieredRouter(
+                min_confidence=float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.7")),
+                log_path=os.getenv("ROUTER_LOG") or None,
+                llm_only=(os.getenv("ROUTER_MODE") or "").strip().lower() == "llm",
+            )
+            _shared["router"] = router
+    return router
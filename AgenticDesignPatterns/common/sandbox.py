@@ -0,0 +1,320 @@
+"""
+在隔离的子进程中运行模型生成的 Python 代码。
+
+两种执行方式，结果格式相同（RunResult）：
+- 冷启动：每次运行都是独立的 `python -I` 进程（隔离模式：忽略环境变量与用户 site-packages）；
+- 预热池（POSIX 默认）：预先启动若干常驻的 `python -I` 工作进程，每个工作进程只负责 fork：
+  每个任务 fork 出一个全新的子进程执行，子进程设置 rlimit、独立进程组与临时工作目录，
+  输出写入文件，超时后连同子孙进程一起杀掉。工作进程自身从不执行生成的代码，
+  因此任务之间互不影响；省掉了每次启动解释器、导入标准库的开销。
+  工作进程意外退出时自动重启。
+
+两种方式都会：
+- 以 rlimit 限制 CPU 时间、地址空间与可创建的文件大小；
+- 在墙钟超时后杀掉整个进程组；
+- 通过有界线程池并发派发，避免一次检查几十份代码时把机器压满。
+
+通过环境变量配置（见 get_sandbox_pool）：
+- SANDBOX_WORKERS: 并发运行的进程数（默认 CPU 核数的一半，至少 2）。
+- SANDBOX_TIMEOUT: 默认墙钟超时秒数（默认 5）。
+- SANDBOX_MEMORY_MB: 地址空间上限（默认 512）。
+- SANDBOX_WARM: 设为 "off" 时不使用预热池，每次冷启动解释器。
+"""
+
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:  # resource 仅在 POSIX 上可用
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+@dataclass
+class RunResult:
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool
+    elapsed_ms: float
+
+
+def _limit_resources(cpu_seconds: int, memory_mb: int) -> Callable[[], None]:
+    def apply() -> None:
+        os.setsid()  # 独立进程组，超时时可以连同子孙进程一起杀掉
+        if resource is None:
+            return
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        memory = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (16 * 1024 * 1024, 16 * 1024 * 1024))
+
+    return apply
+
+
+def run_python(
+    source: str,
+    stdin: str = "",
+    timeout: float = 5.0,
+    memory_mb: int = 512,
+    args: tuple = (),
+) -> RunResult:
+    """冷启动：在受限子进程中执行 source（以 -c 传入），stdin 作为标准输入。"""
+    started = time.perf_counter()
+    preexec = _limit_resources(max(1, int(timeout) + 1), memory_mb) if os.name == "posix" else None
+    with tempfile.TemporaryDirectory(prefix="sandbox-") as workdir:
+        proc = subprocess.Popen(
+            [sys.executable, "-I", "-c", source, *args],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=workdir,
+            text=True,
+            preexec_fn=preexec,
+        )
+        try:
+            stdout, stderr = proc.communicate(stdin, timeout=timeout)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            if os.name == "posix":
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:  # pragma: no cover
+                proc.kill()
+            stdout, stderr = proc.communicate()
+            timed_out = True
+    return RunResult(proc.returncode, stdout, stderr, timed_out, (time.perf_counter() - started) * 1000)
+
+
+# 预热工作进程：逐行读取 JSON 任务，每个任务 fork 一个子进程执行，逐行写回 JSON 结果。
+_WORKER = r'''
+import builtins, io, json, os, resource, shutil, signal, sys, tempfile, time, traceback
+# 预先导入生成代码与检查脚本常用的标准库，fork 出的子进程直接继承
+import collections, contextlib, dataclasses, doctest, functools, inspect, itertools, linecache, math, re, types
+
+protocol_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+protocol_in = sys.stdin
+
+def run_child(job, workdir):
+    os.setsid()
+    protocol_out.close()
+    os.chdir(workdir)
+    cpu = max(1, int(job["timeout"]) + 1)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    memory = job["memory_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (16 * 1024 * 1024, 16 * 1024 * 1024))
+    for fd, name, flags in ((0, "stdin", os.O_RDONLY), (1, "stdout", os.O_WRONLY | os.O_CREAT), (2, "stderr", os.O_WRONLY | os.O_CREAT)):
+        os.dup2(os.open(os.path.join(workdir, name), flags, 0o600), fd)
+    sys.stdin = sys.__stdin__ = open(0, encoding="utf-8", closefd=False)
+    sys.stdout = sys.__stdout__ = open(1, "w", encoding="utf-8", closefd=False)
+    sys.stderr = sys.__stderr__ = open(2, "w", encoding="utf-8", closefd=False)
+    sys.argv = ["-c", *job["args"]]
+    code = 0
+    try:
+        exec(compile(job["source"], "<string>", "exec"), {"__name__": "__main__", "__builtins__": builtins})
+    except SystemExit as exc:
+        if isinstance(exc.code, int):
+            code = exc.code
+        elif exc.code is not None:
+            print(exc.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            for stream in {id(s): s for s in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__)}.values():
+                stream.flush()
+        finally:
+            os._exit(code)
+
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def wait(pid, timeout):
+    deadline = time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            kill_group(pid)  # 清理子进程留下的后台进程
+            return os.waitstatus_to_exitcode(status), False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            kill_group(pid)
+            _, status = os.waitpid(pid, 0)
+            return os.waitstatus_to_exitcode(status), True
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.005)
+
+def read(path, limit=1 << 20):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read(limit)
+
+protocol_out.write("ready\n")
+protocol_out.flush()
+for line in protocol_in:
+    job = json.loads(line)
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    try:
+        with open(os.path.join(workdir, "stdin"), "w", encoding="utf-8") as f:
+            f.write(job["stdin"])
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            run_child(job, workdir)
+        returncode, timed_out = wait(pid, job["timeout"])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        reply = {"returncode": returncode, "stdout": read(os.path.join(workdir, "stdout")),
+                 "stderr": read(os.path.join(workdir, "stderr")), "timed_out": timed_out, "elapsed_ms": elapsed_ms}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    protocol_out.write(json.dumps(reply) + "\n")
+    protocol_out.flush()
+'''
+
+
+class _Worker:
+    """一个常驻的 fork 工作进程及其 JSON 行协议。"""
+
+    def __init__(self) -> None:
+        self.proc = subprocess.Popen(
+            [sys.executable, "-I", "-c", _WORKER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        if self.proc.stdout.readline().strip() != "ready":
+            raise RuntimeError("沙箱工作进程启动失败")
+
+    def run(self, job: Dict[str, Any]) -> RunResult:
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("沙箱工作进程意外退出")
+        reply = json.loads(line)
+        return RunResult(reply["returncode"], reply["stdout"], reply["stderr"], reply["timed_out"], reply["elapsed_ms"])
+
+    def close(self) -> None:
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=1)
+        except Exception:
+            self.proc.kill()
+
+
+class WarmWorkerPool:
+    """预先启动的 fork 工作进程池：run() 借出一个空闲工作进程执行任务，用完归还。"""
+
+    def __init__(self, size: int = 2) -> None:
+        self.size = size
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers: List[_Worker] = []
+        self._stats = {"runs": 0, "restarts": 0}
+        for _ in range(size):
+            self._add_worker()
+
+    def _add_worker(self) -> None:
+        worker = _Worker()
+        with self._lock:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def run(self, source: str, stdin: str = "", timeout: float = 5.0, memory_mb: int = 512, args: tuple = ()) -> RunResult:
+        job = {"source": source, "stdin": stdin, "timeout": timeout, "memory_mb": memory_mb, "args": list(args)}
+        worker = self._idle.get()
+        try:
+            result = worker.run(job)
+        except Exception:
+            # 工作进程挂掉（例如被外部信号杀死）：换一个新的，本次任务改为冷启动执行
+            with self._lock:
+                self._workers.remove(worker)
+                self._stats["restarts"] += 1
+            worker.close()
+            self._add_worker()
+            return run_python(source, stdin, timeout, memory_mb, args)
+        self._idle.put(worker)
+        with self._lock:
+            self._stats["runs"] += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, workers=len(self._workers))
+
+    def close(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+
+class SandboxPool:
+    """有界并发的沙箱执行池；warm=True 且平台支持 fork 时使用预热工作进程。"""
+
+    def __init__(self, max_workers: int = 2, timeout: float = 5.0, memory_mb: int = 512, warm: bool = True) -> None:
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sandbox")
+        self._warm: Optional[WarmWorkerPool] = None
+        if warm and hasattr(os, "fork") and resource is not None:
+            try:
+                self._warm = WarmWorkerPool(max_workers)
+            except Exception:
+                self._warm = None
+
+    def _run(self, source: str, stdin: str, timeout: float, args: tuple) -> RunResult:
+        if self._warm is not None:
+            return self._warm.run(source, stdin, timeout, self.memory_mb, args)
+        return run_python(source, stdin, timeout, self.memory_mb, args)
+
+    def submit(self, source: str, stdin: str = "", timeout: Optional[float] = None, args: tuple = ()) -> "Future[RunResult]":
+        return self._executor.submit(self._run, source, stdin, self.timeout if timeout is None else timeout, args)
+
+    def run(self, source: str, stdin: str = "", timeout: Optional[float] = None, args: tuple = ()) -> RunResult:
+        return self.submit(source, stdin, timeout, args).result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"warm": self._warm is not None, **(self._warm.stats() if self._warm else {})}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._warm is not None:
+            self._warm.close()
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, SandboxPool] = {}
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """返回进程内共享的沙箱执行池。"""
+    with _shared_lock:
+        pool = _shared.get("pool")
+        if pool is None:
+            pool = SandboxPool(
+                max_workers=int(os.getenv("SANDBOX_WORKERS") or max(2, (os.cpu_count() or 2) // 2)),
+                timeout=float(os.getenv("SANDBOX_TIMEOUT", "5")),
+                memory_mb=int(os.getenv("SANDBOX_MEMORY_MB", "512")),
+                warm=(os.getenv("SANDBOX_WARM") or "").strip().lower() != "off",
+            )
+            _shared["pool"] = pool
+    return pool
@@ -0,0 +1,202 @@
+"""
+语义（向量相似度）缓存：用于路由、工具决策这类“输出空间很小、输入大量近似重复”的提示。
+
+- 嵌入：默认使用纯 CPU 的字符 n-gram 特征哈希（hashed_ngram_embedding），
+  无需下载模型，对中文这类无空格文本也有效；也可以传入任意 embed(text) -> 向量 函数。
+- 索引：预分配的 float32 矩阵，向量均已归一化，查询时一次矩阵-向量乘得到全部余弦相似度。
+- 容量：条目数达到上限后淘汰最久未命中的条目（按最近使用时间）。
+
+命中条件为最高相似度 >= threshold。阈值越低命中越多，但也越容易把语义不同的请求
+当成同一个——例如工具决策里的 tool_input（“capital of france”）与具体实体相关，
+因此决策缓存应使用比路由缓存更高的阈值。
+
+通过环境变量启用（见 get_semantic_cache）：
+- SEMANTIC_CACHE: 设为 "on" 时启用，默认关闭。
+- SEMANTIC_CACHE_THRESHOLD: 覆盖各缓存的默认阈值。
+- SEMANTIC_CACHE_SIZE: 每个缓存的最大条目数（默认 4096）。
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:  # numpy 在第一次构建向量时才导入：SEMANTIC_CACHE 未启用时导入本模块不加载 numpy
+    import numpy as np
+
+# 去掉空白与常见标点，只保留对语义有贡献的字符
+_NOISE_RE = re.compile(r"[\s\.,!?;:'\"`~，。！？；：、“”‘’（）()【】\[\]<>《》…·-]+")
+# 中文虚词与疑问词几乎不影响意图，去掉后“伦敦天气怎么样”与“伦敦的天气如何”可以完全对齐
+_STOPWORDS = frozenset("的了吗呢吧啊呀我你他她它们请帮给一个张是在么怎样如何什哪里些")
+
+
+def _bucket(gram: str, dims: int) -> Tuple[int, float]:
+    digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    # 最低位决定符号，减少哈希冲突带来的系统性偏差
+    return (value >> 1) % dims, (1.0 if value & 1 else -1.0)
+
+
+def hashed_ngram_embedding(text: str, dims: int = 512, ngrams: Tuple[int, ...] = (1, 2)) -> "np.ndarray":
+    """字符 n-gram 特征哈希嵌入，返回 L2 归一化的 float32 向量。"""
+    import numpy as np
+
+    norm = "".join(ch for ch in _NOISE_RE.sub("", (text or "").lower()) if ch not in _STOPWORDS)
+    vec = np.zeros(dims, dtype=np.float32)
+    for n in ngrams:
+        for i in range(len(norm) - n + 1):
+            idx, sign = _bucket(norm[i:i + n], dims)
+            vec[idx] += sign
+    length = float(np.linalg.norm(vec))
+    if length > 0:
+        vec /= length
+    return vec
+
+
+class SemanticCache:
+    """有界的向量最近邻缓存：lookup(text) 命中时返回之前存入的值。"""
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_entries: int = 4096,
+        dims: int = 512,
+        embed: Optional[Callable[[str], Any]] = None,
+    ) -> None:
+        if max_entries <= 0:
+            raise ValueError("max_entries 必须为正整数")
+        import numpy as np
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dims = dims
+        self._embed = embed or (lambda text: hashed_ngram_embedding(text, dims))
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((max_entries, dims), dtype=np.float32)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._keys: list = [None] * max_entries
+        self._values: list = [None] * max_entries
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _vector(self, text: str) -> "np.ndarray":
+        import numpy as np
+
+        vec = np.asarray(self._embed(text), dtype=np.float32).reshape(-1)
+        if vec.shape[0] != self.dims:
+            raise ValueError(f"嵌入维度 {vec.shape[0]} 与缓存维度 {self.dims} 不一致")
+        length = float(np.linalg.norm(vec))
+        return vec / length if length > 0 else vec
+
+    def _nearest(self, vec: "np.ndarray") -> Tuple[int, float]:
+        """返回最相似条目的下标与相似度；调用方需持有锁。"""
+        if self._size == 0:
+            return -1, -1.0
+        scores = self._matrix[:self._size] @ vec
+        idx = int(scores.argmax())
+        return idx, float(scores[idx])
+
+    def lookup(self, text: str) -> Optional[Tuple[Any, float]]:
+        """命中时返回 (值, 相似度)，否则返回 None。"""
+        vec = self._vector(text)
+        with self._lock:
+            idx, score = self._nearest(vec)
+            if idx >= 0 and score >= self.threshold:
+                self._last_used[idx] = time.monotonic()
+                self._stats["hits"] += 1
+                return self._values[idx], score
+            self._stats["misses"] += 1
+            return None
+
+    def add(self, text: str, value: Any) -> None:
+        vec = self._vector(text)
+        with self._lock:
+            idx, score = self._nearest(vec)
+            if idx < 0 or score < 0.999:
+                # 新条目：有空位直接追加，否则覆盖最久未使用的条目
+                if self._size < self.max_entries:
+                    idx = self._size
+                    self._size += 1
+                else:
+                    idx = int(self._last_used.argmin())
+                    self._stats["evictions"] += 1
+            self._matrix[idx] = vec
+            self._keys[idx] = text
+            self._values[idx] = value
+            self._last_used[idx] = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["size"] = self._size
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / total, 4) if total else 0.0
+        return out
+
+
+def with_semantic_cache(
+    chain: Any,
+    cache: SemanticCache,
+    text_key: str,
+    accept: Optional[Callable[[Any], bool]] = None,
+):
+    """把 LCEL 链包装成先查语义缓存的 Runnable。
+
+    参数：
+    - chain: 原始链（例如 prompt | llm | StrOutputParser()）。
+    - cache: SemanticCache 实例。
+    - text_key: 输入字典中用于计算相似度的字段，例如 "request" / "question"。
+    - accept: 可选，判断链输出是否值得写入缓存（例如只缓存合法的路由标签）。
+    """
+    from langchain_core.runnables import RunnableLambda
+
+    def _lookup(inputs: Dict[str, Any]) -> Optional[Any]:
+        hit = cache.lookup(str(inputs[text_key]))
+        return None if hit is None else hit[0]
+
+    def _store(inputs: Dict[str, Any], output: Any) -> Any:
+        if accept is None or accept(output):
+            cache.add(str(inputs[text_key]), output)
+        return output
+
+    def _invoke(inputs: Dict[str, Any], config: Any = None) -> Any:
+        cached = _lookup(inputs)
+        if cached is not None:
+            return cached
+        return _store(inputs, chain.invoke(inputs, config))
+
+    async def _ainvoke(inputs: Dict[str, Any], config: Any = None) -> Any:
+        cached = _lookup(inputs)
+        if cached is not None:
+            return cached
+        return _store(inputs, await chain.ainvoke(inputs, config))
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name="semantic_cache")
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, SemanticCache] = {}
+
+
+def get_semantic_cache(name: str, threshold: float) -> Optional[SemanticCache]:
+    """按名称返回进程内共享的语义缓存；SEMANTIC_CACHE 未设为 on 时返回 None。
+
+    threshold 为该缓存的默认阈值，可被 SEMANTIC_CACHE_THRESHOLD 覆盖。
+    """
+    if (os.getenv("SEMANTIC_CACHE") or "").strip().lower() != "on":
+        return None
+    with _shared_lock:
+        cache = _shared.get(name)
+        if cache is None:
+            override = os.getenv("SEMANTIC_CACHE_THRESHOLD")
+            cache = SemanticCache(
+                threshold=float(override) if override else threshold,
+                max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "4096")),
+            )
+            _shared[name] = cache
+    return cache
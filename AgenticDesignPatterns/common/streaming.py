@@ -0,0 +1,90 @@
+"""
+多阶段提示链的流式执行。
+
+普通的两步链（提取 -> 转换）要等第一步全部生成完，才渲染第二步的提示，
+调用方在整条链结束前看不到任何输出。这里把每个阶段都以流的方式运行：
+- 每个阶段的文本增量一产生就交给调用方，首个可见 token 的延迟 ≈ 第一阶段的 TTFT；
+- 上一阶段的流一结束，立即用其完整文本启动下一阶段；
+- 最后一个阶段的 token 直接流向调用方；
+- 每个阶段记录 TTFT（首个非空增量）与总耗时，见 StageTiming。
+
+阶段定义为 (名称, start)，start(上一阶段的完整输出) 返回该阶段的增量迭代器；
+第一个阶段收到 None。LangChain 链可写成 lambda prev: chain.stream({...})，
+Autogen 客户端可写成 lambda prev: client.create_stream([...]) 的文本增量。
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class StageTiming:
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    chunks: int = 0
+    chars: int = 0
+
+    def observe(self, delta: str) -> None:
+        if delta and self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+        self.chars += len(delta)
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        return None if self.first_token is None else (self.first_token - self.started) * 1000
+
+    @property
+    def total_ms(self) -> Optional[float]:
+        return None if self.finished is None else (self.finished - self.started) * 1000
+
+
+def format_timings(timings: Sequence[StageTiming]) -> str:
+    """把各阶段的 TTFT / 总耗时格式化为多行文本，便于示例直接打印。"""
+    lines = []
+    for t in timings:
+        ttft = "-" if t.ttft_ms is None else f"{t.ttft_ms:.1f} ms"
+        total = "-" if t.total_ms is None else f"{t.total_ms:.1f} ms"
+        lines.append(f"{t.name}: TTFT {ttft}, 总耗时 {total}, {t.chunks} 个增量 / {t.chars} 字符")
+    return "\n".join(lines)
+
+
+SyncStage = Tuple[str, Callable[[Optional[str]], Iterator[str]]]
+AsyncStage = Tuple[str, Callable[[Optional[str]], AsyncIterator[str]]]
+
+
+def stream_stages(stages: Sequence[SyncStage], timings: Optional[List[StageTiming]] = None) -> Iterator[Tuple[str, str]]:
+    """依次流式执行各阶段，产出 (阶段名, 文本增量)；timings 若传入，会追加每个阶段的计时。"""
+    previous: Optional[str] = None
+    for name, start in stages:
+        timing = StageTiming(name)
+        if timings is not None:
+            timings.append(timing)
+        parts: List[str] = []
+        for delta in start(previous):
+            timing.observe(delta)
+            parts.append(delta)
+            yield name, delta
+        timing.finished = time.perf_counter()
+        previous = "".join(parts)
+
+
+async def astream_stages(
+    stages: Sequence[AsyncStage], timings: Optional[List[StageTiming]] = None
+) -> AsyncIterator[Tuple[str, str]]:
+    """stream_stages 的异步版本。"""
+    previous: Optional[str] = None
+    for name, start in stages:
+        timing = StageTiming(name)
+        if timings is not None:
+            timings.append(timing)
+        parts: List[str] = []
+        async for delta in start(previous):
+            timing.observe(delta)
+            parts.append(delta)
+            yield name, delta
+        timing.finished = time.perf_counter()
+        previous = "".join(parts)
@@ -0,0 +1,546 @@
+"""
+工具注册表与知识表索引。
+
+chap05 的 search_information 原来每次调用都重建一个结果字典，只做小写精确匹配；
+工具调度则是手写的 if/else 加嵌套 try。这里把两者拆开：
+
+- KnowledgeTable：构建时一次性建好索引——
+  精确匹配用规范化后的键做哈希（O(1)）；
+  模糊匹配用倒排索引（词 -> 条目编号），只遍历查询中 k 个词的倒排表（O(k)），
+  过于常见的词（倒排表超过 max_postings）不参与打分，表增长到百万条目时查询代价也不随之增长。
+- ToolRegistry：按名称注册工具，统一以 await registry.acall(name, ...) 调用：
+  同步函数放到有界线程池中执行（不阻塞事件循环），协程函数直接 await；
+  每个工具一个延迟直方图（对数分桶），见 stats()。
+- ToolResultCache：注册时给出 ttl 的工具按输入缓存结果（每个工具各自的 TTL，“未找到”类结果可单独设置
+  较短的 negative_ttl），并发的相同调用共享同一次执行（single-flight），统计命中 / 合并次数。
+- Speculator：在决策调用进行的同时推测性地启动最可能的工具调用，决策一致时直接采用结果。
+
+通过环境变量配置（见 get_tool_registry）：
+- TOOL_WORKERS: 执行同步工具的线程数（默认 4）。
+- TOOL_CACHE: 设为 "off" 时关闭工具结果缓存。
+- TOOL_CACHE_SIZE: 缓存条目上限（默认 4096，LRU 淘汰）。
+- TOOL_SPECULATE: 设为 "on" 时启用推测执行（见 Speculator）。
+"""
+
+import bisect
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]")
+_STOPWORDS = frozenset(
+    "a an the of in on at to for is are was what whats s how who where when which me tell about".split()
+)
+
+
+def normalize(text: str) -> str:
+    """规范化查询：小写、去掉标点、合并空白。"""
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+
+def terms(text: str) -> List[str]:
+    """按出现顺序的词（保留重复，供需要词频的 BM25 使用）：英文单词与数字、单个汉字，去掉停用词。"""
+    return [token for token in _TOKEN_RE.findall((text or "").lower()) if token not in _STOPWORDS]
+
+
+def tokenize(text: str) -> List[str]:
+    """索引 / 查询用的词：同 terms，去掉重复。"""
+    return list(dict.fromkeys(terms(text)))
+
+
+class KnowledgeTable:
+    """键 -> 结果 的知识表，支持精确查找与基于倒排索引的模糊查找。"""
+
+    def __init__(
+        self,
+        items: Optional[Iterable[Tuple[str, str]]] = None,
+        min_score: float = 0.5,
+        max_postings: int = 10000,
+    ) -> None:
+        self.min_score = min_score
+        self.max_postings = max_postings
+        self._exact: Dict[str, int] = {}
+        self._values: List[str] = []
+        self._sizes: List[int] = []  # 每个条目的词数，用于打分归一化
+        self._postings: Dict[str, List[int]] = {}
+        for key, value in items or ():
+            self.add(key, value)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, key: str, value: str) -> None:
+        norm = normalize(key)
+        if norm in self._exact:  # 同一个键重复添加：覆盖结果，不重复索引
+            self._values[self._exact[norm]] = value
+            return
+        idx = len(self._values)
+        tokens = tokenize(norm)
+        self._exact[norm] = idx
+        self._values.append(value)
+        self._sizes.append(len(tokens))
+        for token in tokens:
+            self._postings.setdefault(token, []).append(idx)
+
+    def get(self, key: str) -> Optional[str]:
+        """精确查找（规范化后比较）。"""
+        idx = self._exact.get(normalize(key))
+        return None if idx is None else self._values[idx]
+
+    def search(self, query: str, limit: int = 1) -> List[Tuple[str, float]]:
+        """模糊查找：按词重叠打分（重叠词数 / max(查询词数, 条目词数)），返回得分不低于 min_score 的前 limit 个。"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores: Dict[int, int] = {}
+        for token in tokens:
+            postings = self._postings.get(token)
+            if not postings or len(postings) > self.max_postings:
+                continue
+            for idx in postings:
+                scores[idx] = scores.get(idx, 0) + 1
+        ranked = []
+        for idx, overlap in scores.items():
+            score = overlap / max(len(tokens), self._sizes[idx])
+            if score >= self.min_score:
+                ranked.append((score, idx))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [(self._values[idx], round(score, 3)) for score, idx in ranked[:limit]]
+
+    def lookup(self, query: str) -> Optional[str]:
+        """先精确匹配，未命中再模糊匹配；都没有时返回 None。"""
+        exact = self.get(query)
+        if exact is not None:
+            return exact
+        hits = self.search(query, limit=1)
+        return hits[0][0] if hits else None
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图（毫秒）；分位数按桶上界估算。"""
+
+    BOUNDS_MS: Sequence[float] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)  # 最后一个桶为 > 10 s
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float, ok: bool = True) -> None:
+        with self._lock:
+            self.buckets[bisect.bisect_left(self.BOUNDS_MS, ms)] += 1
+            self.count += 1
+            self.errors += 0 if ok else 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            target = q * self.count
+            seen = 0
+            for i, n in enumerate(self.buckets):
+                seen += n
+                if n and seen >= target:
+                    return float(self.BOUNDS_MS[i]) if i < len(self.BOUNDS_MS) else self.max_ms
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {
+                "count": self.count,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+                "max_ms": round(self.max_ms, 3),
+                "buckets": {
+                    (f"<={b}ms" if i < len(self.BOUNDS_MS) else f">{self.BOUNDS_MS[-1]}ms"): n
+                    for i, (b, n) in enumerate(zip(list(self.BOUNDS_MS) + [None], self.buckets))
+                    if n
+                },
+            }
+        out["p50_ms"] = self.quantile(0.5)
+        out["p95_ms"] = self.quantile(0.95)
+        return out
+
+
+class ToolResultCache:
+    """工具结果缓存：LRU + 每条结果各自的过期时间，并对同一键的并发调用做单飞（single-flight）合并。
+
+    begin() 在一把锁内完成三种判断：
+    - 有未过期的结果：("hit", 结果)；
+    - 同一键正在执行：("wait", future)，调用方等待领头者的结果，不再重复执行；
+    - 否则：("lead", future)，调用方负责执行，然后调用 finish() 写入结果并唤醒等待者。
+    异常结果不缓存，但会传给本轮所有等待者。
+    """
+
+    def __init__(self, max_entries: int = 4096, clock: Callable[[], float] = time.monotonic) -> None:
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[Any, float, bool]]" = OrderedDict()  # 键 -> (结果, 过期时间, 是否负缓存)
+        self._inflight: Dict[Tuple[str, Any], Any] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, tool: str, field: str) -> None:
+        counters = self._stats.setdefault(tool, dict.fromkeys(
+            ("hits", "negative_hits", "misses", "coalesced", "stores", "negative_stores", "expired", "evictions"), 0))
+        counters[field] += 1
+
+    def begin(self, tool: str, key: Any) -> Tuple[str, Any]:
+        from concurrent.futures import Future
+
+        full_key = (tool, key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                value, expires, negative = entry
+                if expires > self.clock():
+                    self._entries.move_to_end(full_key)
+                    self._count(tool, "negative_hits" if negative else "hits")
+                    return "hit", value
+                del self._entries[full_key]
+                self._count(tool, "expired")
+            future = self._inflight.get(full_key)
+            if future is not None:
+                self._count(tool, "coalesced")
+                return "wait", future
+            self._count(tool, "misses")
+            future = self._inflight[full_key] = Future()
+            return "lead", future
+
+    def finish(
+        self,
+        tool: str,
+        key: Any,
+        future: Any,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+        ttl: Optional[float] = None,
+        negative: bool = False,
+    ) -> None:
+        full_key = (tool, key)
+        with self._lock:
+            self._inflight.pop(full_key, None)
+            if error is None and ttl:
+                self._entries[full_key] = (result, self.clock() + ttl, negative)
+                self._entries.move_to_end(full_key)
+                self._count(tool, "negative_stores" if negative else "stores")
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._count(evicted[0], "evictions")
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def clear(self, tool: Optional[str] = None) -> None:
+        with self._lock:
+            for full_key in [k for k in self._entries if tool is None or k[0] == tool]:
+                del self._entries[full_key]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            sizes: Dict[str, int] = {}
+            for tool, _ in self._entries:
+                sizes[tool] = sizes.get(tool, 0) + 1
+            out = {tool: dict(counters) for tool, counters in self._stats.items()}
+        for tool, counters in out.items():
+            served = counters["hits"] + counters["negative_hits"] + counters["coalesced"]
+            calls = served + counters["misses"]
+            counters["size"] = sizes.get(tool, 0)
+            counters["hit_rate"] = round(served / calls, 3) if calls else 0.0
+        return out
+
+
+def _default_cache_key(*args: Any, **kwargs: Any) -> str:
+    return repr((args, sorted(kwargs.items())))
+
+
+class _ToolSpec:
+    __slots__ = ("func", "description", "histogram", "ttl", "negative_ttl", "is_miss", "key")
+
+    def __init__(self, func, description, ttl, negative_ttl, is_miss, key) -> None:
+        self.func = func
+        self.description = description
+        self.histogram = LatencyHistogram()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.is_miss = is_miss
+        self.key = key or _default_cache_key
+
+
+class ToolRegistry:
+    """按名称注册的工具集合；同步工具在有界线程池中执行，协程工具直接 await。
+
+    注册时给出 ttl 的工具启用结果缓存（见 ToolResultCache）：相同输入在 ttl 秒内直接复用结果，
+    并发的相同调用只执行一次；is_miss(结果) 为真的“未找到”类结果按 negative_ttl 缓存（不给则不缓存）。
+    延迟直方图只统计真正执行的调用。
+    """
+
+    def __init__(self, max_workers: int = 4, cache_entries: int = 4096, cache_enabled: bool = True) -> None:
+        self.max_workers = max_workers
+        self.cache_enabled = cache_enabled
+        self.cache = ToolResultCache(cache_entries)
+        self._lock = threading.Lock()
+        self._tools: Dict[str, _ToolSpec] = {}
+        self._executor = None
+
+    def register(
+        self,
+        func: Optional[Callable[..., Any]] = None,
+        *,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        ttl: Optional[float] = None,
+        negative_ttl: Optional[float] = None,
+        is_miss: Optional[Callable[[Any], bool]] = None,
+        key: Optional[Callable[..., Any]] = None,
+    ):
+        """注册工具；可直接调用 register(func)，也可作为装饰器 @register(name=...) 使用。
+
+        ttl / negative_ttl 为缓存秒数；key(*args, **kwargs) 把调用参数映射为缓存键（默认按参数的 repr）。
+        """
+
+        def _register(f: Callable[..., Any]) -> Callable[..., Any]:
+            tool_name = name or f.__name__
+            summary = description or (f.__doc__ or "").strip().split("\n")[0]
+            with self._lock:
+                previous = self._tools.get(tool_name)
+                spec = _ToolSpec(f, summary, ttl, negative_ttl, is_miss, key)
+                if previous is not None:  # 重复注册（例如示例被多次导入）保留已有的延迟统计
+                    spec.histogram = previous.histogram
+                self._tools[tool_name] = spec
+            return f
+
+        return _register(func) if func is not None else _register
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def describe(self) -> Dict[str, str]:
+        return {name: spec.description for name, spec in self._tools.items()}
+
+    def _lookup(self, name: str) -> _ToolSpec:
+        try:
+            return self._tools[name]
+        except KeyError:
+            raise KeyError(f"未注册的工具: {name}") from None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+            return self._executor
+
+    def _cached(self, spec: _ToolSpec) -> bool:
+        return self.cache_enabled and bool(spec.ttl or spec.negative_ttl)
+
+    def _finish(self, name: str, spec: _ToolSpec, key: Any, future: Any, result: Any, error: Optional[BaseException]) -> None:
+        negative = error is None and spec.is_miss is not None and bool(spec.is_miss(result))
+        ttl = spec.negative_ttl if negative else spec.ttl
+        self.cache.finish(name, key, future, result, error, ttl, negative)
+
+    def _run_sync(self, spec: _ToolSpec, args: tuple, kwargs: dict) -> Any:
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = spec.func(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            spec.histogram.record((time.perf_counter() - started) * 1000, ok)
+
+    async def _run_async(self, spec: _ToolSpec, args: tuple, kwargs: dict) -> Any:
+        import asyncio
+        import functools
+        import inspect
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            if inspect.iscoroutinefunction(spec.func):
+                result = await spec.func(*args, **kwargs)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._pool(), functools.partial(spec.func, *args, **kwargs))
+            ok = True
+            return result
+        finally:
+            spec.histogram.record((time.perf_counter() - started) * 1000, ok)
+
+    def call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        """在当前线程同步调用（协程工具不支持此路径）。"""
+        spec = self._lookup(name)
+        if not self._cached(spec):
+            return self._run_sync(spec, args, kwargs)
+        key = spec.key(*args, **kwargs)
+        state, value = self.cache.begin(name, key)
+        if state == "hit":
+            return value
+        if state == "wait":
+            return value.result()
+        try:
+            result = self._run_sync(spec, args, kwargs)
+        except BaseException as exc:
+            self._finish(name, spec, key, value, None, exc)
+            raise
+        self._finish(name, spec, key, value, result, None)
+        return result
+
+    async def acall(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        """异步调用工具；延迟包含在线程池中排队的时间。"""
+        spec = self._lookup(name)
+        if not self._cached(spec):
+            return await self._run_async(spec, args, kwargs)
+        import asyncio
+
+        key = spec.key(*args, **kwargs)
+        state, value = self.cache.begin(name, key)
+        if state == "hit":
+            return value
+        if state == "wait":
+            # shield：某个等待者被取消时不会连带取消共享的 future
+            return await asyncio.shield(asyncio.wrap_future(value))
+        try:
+            result = await self._run_async(spec, args, kwargs)
+        except BaseException as exc:
+            self._finish(name, spec, key, value, None, exc)
+            raise
+        self._finish(name, spec, key, value, result, None)
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """每个工具的延迟直方图；启用了缓存的工具附带 cache 计数（命中 / 负缓存命中 / 合并 / 未命中等）。"""
+        with self._lock:
+            specs = dict(self._tools)
+        cache_stats = self.cache.stats()
+        out = {}
+        for name, spec in specs.items():
+            out[name] = spec.histogram.stats()
+            if name in cache_stats:
+                out[name]["cache"] = cache_stats[name]
+        return out
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class _Speculation:
+    __slots__ = ("name", "tool_input", "task", "launched", "finished")
+
+    def __init__(self, name: str, tool_input: Any, task: Any, launched: float) -> None:
+        self.name = name
+        self.tool_input = tool_input
+        self.task = task
+        self.launched = launched
+        self.finished: Optional[float] = None
+
+
+class Speculator:
+    """推测执行：在决策调用返回之前，按廉价启发式预测的输入提前启动工具调用。
+
+    resolve() 时决策给出的输入与预测一致（按 key 比较）则直接使用推测结果，否则丢弃。
+    统计推测次数、命中率，以及命中时从关键路径上省下的时间与未命中时浪费的工具执行时间。
+    """
+
+    def __init__(self, key: Callable[[Any], Any] = normalize) -> None:
+        self.key = key
+        self._lock = threading.Lock()
+        self._stats = {"launched": 0, "hits": 0, "misses": 0, "errors": 0, "abandoned": 0, "saved_ms": 0.0, "wasted_ms": 0.0}
+
+    def launch(self, registry: ToolRegistry, name: str, tool_input: Any) -> _Speculation:
+        """在当前事件循环中启动推测调用（必须在协程内调用）。"""
+        import asyncio
+
+        launched = time.perf_counter()
+        speculation = _Speculation(name, tool_input, None, launched)
+
+        async def run() -> Any:
+            try:
+                return await registry.acall(name, tool_input)
+            finally:
+                speculation.finished = time.perf_counter()
+
+        speculation.task = asyncio.ensure_future(run())
+        with self._lock:
+            self._stats["launched"] += 1
+        return speculation
+
+    async def resolve(self, speculation: Optional[_Speculation], name: Optional[str], tool_input: Any = None) -> Tuple[bool, Any]:
+        """决策结果出来后调用：name 为 None 表示决策不使用工具。返回 (是否采用推测结果, 结果)。"""
+        if speculation is None:
+            return False, None
+        agree = name == speculation.name and self.key(tool_input) == self.key(speculation.tool_input)
+        if not agree:
+            # 不取消：其他调用可能已合并到这次执行上，结果也会进入缓存；完成后再计入浪费的执行时间
+            speculation.task.add_done_callback(lambda task: self._discard(speculation, task))
+            with self._lock:
+                self._stats["misses"] += 1
+            return False, None
+        claimed = time.perf_counter()
+        try:
+            result = await speculation.task
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            return False, None
+        with self._lock:
+            self._stats["hits"] += 1
+            # 与决策调用重叠执行的那部分工具耗时，就是关键路径上省下的时间
+            self._stats["saved_ms"] += (min(speculation.finished, claimed) - speculation.launched) * 1000
+        return True, result
+
+    def abandon(self, speculation: Optional[_Speculation]) -> None:
+        """决策步骤出错或被取消、推测没能 resolve 时调用：放弃推测结果，完成后计入浪费的执行时间。"""
+        if speculation is None:
+            return
+        # 与未命中一样不取消任务（可能有其他调用合并在这次执行上），只取走结果并记账
+        speculation.task.add_done_callback(lambda task: self._discard(speculation, task))
+        with self._lock:
+            self._stats["abandoned"] += 1
+
+    def _discard(self, speculation: _Speculation, task: Any) -> None:
+        if not task.cancelled():
+            task.exception()  # 取走异常，避免 “exception was never retrieved”
+        with self._lock:
+            self._stats["wasted_ms"] += ((speculation.finished or time.perf_counter()) - speculation.launched) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        resolved = out["hits"] + out["misses"] + out["errors"]
+        out["hit_rate"] = round(out["hits"] / resolved, 3) if resolved else 0.0
+        out["saved_ms"] = round(out["saved_ms"], 3)
+        out["wasted_ms"] = round(out["wasted_ms"], 3)
+        return out
+
+
+def speculation_enabled() -> bool:
+    return (os.getenv("TOOL_SPECULATE") or "").strip().lower() in ("1", "on", "true")
+
+
+_shared_lock = threading.Lock()
+_shared: Dict[str, ToolRegistry] = {}
+
+
+def get_tool_registry() -> ToolRegistry:
+    """返回进程内共享的工具注册表。"""
+    with _shared_lock:
+        registry = _shared.get("registry")
+        if registry is None:
+            registry = ToolRegistry(
+                max_workers=int(os.getenv("TOOL_WORKERS", "4")),
+                cache_entries=int(os.getenv("TOOL_CACHE_SIZE", "4096")),
+                cache_enabled=(os.getenv("TOOL_CACHE") or "").strip().lower() != "off",
+            )
+            _shared["registry"] = registry
+    return registry
@@ -0,0 +1,575 @@
+"""
+LangGraph 记忆存储（BaseStore）的向量索引实现。
+
+chap08_02 原先把一个返回 [1.0, 2.0] 的占位 embed 交给 InMemoryStore：每条记忆的向量都一样，
+search() 实际上只是逐条 Python 过滤。InMemoryStore 的向量检索本身也是逐条收集向量、
+每次搜索现拼矩阵、整体排序。VectorMemoryStore 实现同样的 BaseStore 接口（get / put / delete /
+search / list_namespaces 及其异步版本），内部换成：
+
+- 每个命名空间一个 float32 矩阵：向量写入时归一化，余弦相似度就是一次矩阵-向量乘法；
+  删除 / 覆盖只把旧行标记为失效，失效行过半时整体压缩。
+- 批量、带缓存的嵌入：put() 的文本先进入待嵌入队列，攒够 embed_batch_size 条、或下一次搜索之前
+  一次性调用 embed_documents；相同文本只嵌入一次（LRU 缓存，查询向量单独缓存）。
+  排队期间被覆盖 / 删除的记忆按版本号跳过，get() 始终立即可见。
+- 搜索：先用元数据过滤缩小候选（顶层标量字段的等值条件在每行的取值编码上向量化比较，
+  其余条件经倒排表缩小后逐条判断），再只对候选行打分；top-k 用 argpartition，不做整体排序。一条记忆有多个字段向量时取最大分。
+- 近似索引：命名空间的有效行数超过 ann_threshold 后构建 IVF（球面 k-means 聚类，约 √n 个簇），
+  搜索只访问与查询最接近的 nprobe 个簇；之后新增的行直接分配到最近的簇，行数翻倍时重建。
+  过滤后的候选较少时直接精确打分。
+
+同一批操作中，get / put / list_namespaces 按顺序立即执行，search 在所有 put 之后执行（能看到同批写入）。
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langgraph.store.base import (
+    BaseStore,
+    GetOp,
+    IndexConfig,
+    Item,
+    ListNamespacesOp,
+    MatchCondition,
+    Op,
+    PutOp,
+    Result,
+    SearchItem,
+    SearchOp,
+)
+from langgraph.store.base.embed import ensure_embeddings, get_text_at_path, tokenize_path
+
+Namespace = Tuple[str, ...]
+_SCALARS = (str, int, float, bool, type(None))
+
+# 待嵌入的条目：(文本, 命名空间, 键, 字段路径, 写入时的版本号)
+_Pending = Tuple[str, Namespace, str, str, int]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _apply_operator(value: Any, operator: str, expected: Any) -> bool:
+    """与 InMemoryStore 一致的比较运算。"""
+    if operator == "$eq":
+        return value == expected
+    if operator == "$ne":
+        return value != expected
+    try:
+        if operator == "$gt":
+            return float(value) > float(expected)
+        if operator == "$gte":
+            return float(value) >= float(expected)
+        if operator == "$lt":
+            return float(value) < float(expected)
+        if operator == "$lte":
+            return float(value) <= float(expected)
+    except (TypeError, ValueError):
+        return False
+    raise ValueError(f"不支持的过滤运算符: {operator}")
+
+
+def _matches(value: Any, expected: Any) -> bool:
+    """filter 中单个字段的匹配（支持嵌套对象、列表与 $eq/$ne/$gt/$gte/$lt/$lte）。"""
+    if isinstance(expected, dict):
+        if any(k.startswith("$") for k in expected):
+            return all(_apply_operator(value, op, v) for op, v in expected.items())
+        return isinstance(value, dict) and all(_matches(value.get(k), v) for k, v in expected.items())
+    if isinstance(expected, (list, tuple)):
+        return (
+            isinstance(value, (list, tuple))
+            and len(value) == len(expected)
+            and all(_matches(a, b) for a, b in zip(value, expected))
+        )
+    return value == expected
+
+
+def _namespace_matches(condition: MatchCondition, namespace: Namespace) -> bool:
+    path = condition.path
+    if len(namespace) < len(path):
+        return False
+    pairs = zip(namespace, path) if condition.match_type == "prefix" else zip(reversed(namespace), reversed(path))
+    return all(p == "*" or n == p for n, p in pairs)
+
+
+class _IVF:
+    """倒排文件索引：球面 k-means 聚类中心 + 每个簇的行号列表。"""
+
+    def __init__(self, matrix: np.ndarray, rows: np.ndarray, iterations: int = 8, sample: int = 20000, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        count = len(rows)
+        # 条目少于 8 条（ann_threshold 设得很低）时，簇数不能超过条目数
+        nlist = min(int(min(1024, max(8, np.sqrt(count)))), count)
+        picked = rows if count <= sample else rng.choice(rows, sample, replace=False)
+        data = matrix[picked]
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            sums[empty] = centroids[empty]  # 空簇保持原中心
+            centroids = _normalize(sums)
+        self.centroids = centroids
+        self.built_rows = count
+        self.lists: List[List[int]] = [[] for _ in range(nlist)]
+        for start in range(0, count, 8192):
+            chunk = rows[start:start + 8192]
+            for row, cluster in zip(chunk.tolist(), np.argmax(matrix[chunk] @ centroids.T, axis=1).tolist()):
+                self.lists[cluster].append(row)
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        self.lists[int(np.argmax(self.centroids @ vector))].append(row)
+
+    def probe(self, query: np.ndarray, nprobe: int, minimum: int) -> np.ndarray:
+        """最接近查询的 nprobe 个簇中的行号；不足 minimum 行时继续加簇。"""
+        order = np.argsort(-(self.centroids @ query))
+        picked: List[List[int]] = []
+        total = 0
+        for i, cluster in enumerate(order.tolist()):
+            if i >= nprobe and total >= minimum:
+                break
+            picked.append(self.lists[cluster])
+            total += len(self.lists[cluster])
+        return np.fromiter((row for rows in picked for row in rows), dtype=np.int64, count=total)
+
+
+class _Namespace:
+    """一个命名空间的记忆与向量矩阵。"""
+
+    def __init__(self, dims: int) -> None:
+        self.items: Dict[str, Item] = {}
+        self.versions: Dict[str, int] = {}
+        self.matrix = np.zeros((64, dims), dtype=np.float32)
+        self.alive = np.zeros(64, dtype=bool)
+        self.size = 0  # 已使用的行数（含失效行）
+        self.dead = 0
+        self.owner: List[str] = []  # 行号 -> 键
+        self.rows: Dict[str, List[int]] = {}  # 键 -> 行号
+        self.max_paths = 1  # 单条记忆最多的向量数（多字段时 top-k 需要多取）
+        self.postings: Dict[str, Dict[Any, Set[str]]] = {}  # 字段 -> 标量值 -> 键
+        # 每行所属记忆的顶层标量字段值编码（-1 表示没有该字段），等值过滤直接在行上向量化比较
+        self.codes: Dict[str, np.ndarray] = {}
+        self.code_of: Dict[str, Dict[Any, int]] = {}
+        self.ivf: Optional[_IVF] = None
+
+    # ---- 元数据倒排表 ----
+
+    def index_value(self, key: str, value: Dict[str, Any]) -> None:
+        for field, v in value.items():
+            if isinstance(v, _SCALARS):
+                self.postings.setdefault(field, {}).setdefault(v, set()).add(key)
+
+    def unindex_value(self, key: str, value: Dict[str, Any]) -> None:
+        for field, v in value.items():
+            if isinstance(v, _SCALARS):
+                keys = self.postings.get(field, {}).get(v)
+                if keys is not None:
+                    keys.discard(key)
+
+    def filter_keys(self, conditions: Optional[Dict[str, Any]]) -> Optional[Set[str]]:
+        """满足 filter 的键集合；没有过滤条件时返回 None（全部）。"""
+        if not conditions:
+            return None
+        keys: Optional[Set[str]] = None
+        rest = []
+        for field, expected in conditions.items():
+            if isinstance(expected, _SCALARS):
+                matched = self.postings.get(field, {}).get(expected, set())
+                keys = set(matched) if keys is None else keys & matched
+            else:
+                rest.append((field, expected))
+        candidates = keys if keys is not None else self.items.keys()
+        if not rest:
+            return keys if keys is not None else set(candidates)
+        return {
+            k for k in candidates
+            if all(_matches(self.items[k].value.get(field), expected) for field, expected in rest)
+        }
+
+    def filter_rows(self, conditions: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """满足 filter 的有效行号；没有过滤条件时返回 None（全部）。
+
+        只有顶层标量等值条件时按行编码向量化比较，其余条件经 filter_keys 逐条判断。
+        """
+        if not conditions:
+            return None
+        if not all(isinstance(v, _SCALARS) for v in conditions.values()):
+            keys = self.filter_keys(conditions)
+            return np.fromiter((r for k in keys for r in self.rows.get(k, ())), dtype=np.int64)
+        mask = self.alive[:self.size].copy()
+        for field, expected in conditions.items():
+            code = self.code_of.get(field, {}).get(expected)
+            if code is None:
+                return np.zeros(0, dtype=np.int64)
+            mask &= self.codes[field][:self.size] == code
+        return np.flatnonzero(mask)
+
+    # ---- 向量行 ----
+
+    def _grow(self) -> None:
+        grow = len(self.matrix) * 2
+        self.matrix = np.resize(self.matrix, (grow, self.matrix.shape[1]))
+        self.alive = np.concatenate([self.alive, np.zeros(grow - len(self.alive), dtype=bool)])
+        for field, codes in self.codes.items():
+            self.codes[field] = np.concatenate([codes, np.full(grow - len(codes), -1, dtype=np.int32)])
+
+    def add_row(self, key: str, vector: np.ndarray) -> int:
+        if self.size == len(self.matrix):
+            self._grow()
+        row = self.size
+        self.matrix[row] = vector
+        self.alive[row] = True
+        for field, v in self.items[key].value.items():
+            if isinstance(v, _SCALARS):
+                codes = self.codes.get(field)
+                if codes is None:
+                    codes = self.codes[field] = np.full(len(self.matrix), -1, dtype=np.int32)
+                values = self.code_of.setdefault(field, {})
+                codes[row] = values.setdefault(v, len(values))
+        self.size += 1
+        self.owner.append(key)
+        rows = self.rows.setdefault(key, [])
+        rows.append(row)
+        self.max_paths = max(self.max_paths, len(rows))
+        if self.ivf is not None:
+            self.ivf.add(row, vector)
+        return row
+
+    def drop_rows(self, key: str) -> None:
+        for row in self.rows.pop(key, ()):
+            self.alive[row] = False
+            self.dead += 1
+
+    def compact(self) -> None:
+        """失效行过半时重排矩阵（之后需要重建 IVF）。"""
+        keep = np.flatnonzero(self.alive[:self.size])
+        matrix = self.matrix[keep]
+        owner = [self.owner[i] for i in keep.tolist()]
+        capacity = max(64, len(keep) * 2)
+        self.matrix = np.zeros((capacity, matrix.shape[1]), dtype=np.float32)
+        self.matrix[:len(keep)] = matrix
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.alive[:len(keep)] = True
+        for field, codes in self.codes.items():
+            packed = np.full(capacity, -1, dtype=np.int32)
+            packed[:len(keep)] = codes[keep]
+            self.codes[field] = packed
+        self.size, self.dead, self.owner, self.rows = len(keep), 0, owner, {}
+        for row, key in enumerate(owner):
+            self.rows.setdefault(key, []).append(row)
+        self.ivf = None
+
+
+class VectorMemoryStore(BaseStore):
+    """按命名空间维护 float32 向量矩阵、带批量嵌入缓存与可选 IVF 索引的 BaseStore。"""
+
+    supports_ttl = False
+
+    def __init__(
+        self,
+        *,
+        index: Optional[IndexConfig] = None,
+        embed_batch_size: int = 64,
+        embed_cache_size: int = 10000,
+        ann_threshold: int = 20000,
+        nprobe: int = 8,
+    ) -> None:
+        self.index_config = dict(index) if index else None
+        self.embeddings = ensure_embeddings(index.get("embed")) if index else None
+        self.dims = int(index["dims"]) if index else 0
+        fields = (index or {}).get("fields") or ["$"]
+        self._fields = [(f, tokenize_path(f) if f != "$" else f) for f in fields]
+        self.embed_batch_size = embed_batch_size
+        self.embed_cache_size = embed_cache_size
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._namespaces: Dict[Namespace, _Namespace] = {}
+        self._pending: List[_Pending] = []
+        self._drain = False
+        self._version = 0
+        self._cache: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._stats = {
+            "puts": 0, "embed_calls": 0, "embedded_texts": 0, "embed_cache_hits": 0, "searches": 0,
+            "exact_searches": 0, "ann_searches": 0, "rows_scored": 0, "ivf_builds": 0, "compactions": 0,
+        }
+
+    # ---- 嵌入 ----
+
+    def _cached(self, kind: str, text: str) -> Optional[np.ndarray]:
+        vector = self._cache.get((kind, text))
+        if vector is not None:
+            self._cache.move_to_end((kind, text))
+            self._stats["embed_cache_hits"] += 1
+        return vector
+
+    def _remember(self, kind: str, texts: Sequence[str], vectors: Any, fresh: Dict[Tuple[str, str], np.ndarray]) -> None:
+        normalized = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1))
+        with self._lock:
+            for text, vector in zip(texts, normalized):
+                fresh[(kind, text)] = self._cache[(kind, text)] = vector
+            while len(self._cache) > self.embed_cache_size:
+                self._cache.popitem(last=False)
+            self._stats["embed_calls"] += 1
+            self._stats["embedded_texts"] += len(texts)
+
+    def _texts_to_embed(self, queries: Iterable[str], flush: bool) -> Tuple[List[str], List[str]]:
+        """需要调用模型的 (文档文本, 查询文本)，均已去重并排除缓存命中；调用方需持有锁。"""
+        documents: List[str] = []
+        if flush or len(self._pending) >= self.embed_batch_size:
+            self._drain = True  # 本批结束时把队列写入矩阵；未攒满的批次不必逐条检查队列
+            seen: Set[str] = set()
+            for text, *_ in self._pending:
+                if text not in seen and self._cached("doc", text) is None:
+                    seen.add(text)
+                    documents.append(text)
+        missing = [q for q in dict.fromkeys(queries) if self._cached("query", q) is None]
+        return documents, missing
+
+    def _embed(self, documents: List[str], queries: List[str]) -> Dict[Tuple[str, str], np.ndarray]:
+        """调用模型；返回本次得到的向量（缓存容量小于一批时也不会丢）。"""
+        fresh: Dict[Tuple[str, str], np.ndarray] = {}
+        if documents:
+            self._remember("doc", documents, self.embeddings.embed_documents(documents), fresh)
+        for query in queries:
+            self._remember("query", [query], [self.embeddings.embed_query(query)], fresh)
+        return fresh
+
+    async def _aembed(self, documents: List[str], queries: List[str]) -> Dict[Tuple[str, str], np.ndarray]:
+        fresh: Dict[Tuple[str, str], np.ndarray] = {}
+        if documents:
+            self._remember("doc", documents, await self.embeddings.aembed_documents(documents), fresh)
+        if queries:
+            vectors = await asyncio.gather(*(self.embeddings.aembed_query(q) for q in queries))
+            self._remember("query", queries, vectors, fresh)
+        return fresh
+
+    def _insert_pending(self, fresh: Dict[Tuple[str, str], np.ndarray]) -> None:
+        """把已有向量的待嵌入条目写入矩阵；调用方需持有锁。"""
+        waiting: List[_Pending] = []
+        for entry in self._pending:
+            text, namespace, key, _, version = entry
+            ns = self._namespaces.get(namespace)
+            if ns is None or ns.versions.get(key) != version:
+                continue  # 排队期间已被覆盖或删除
+            vector = fresh.get(("doc", text))
+            if vector is None:
+                vector = self._cache.get(("doc", text))
+            if vector is None:
+                waiting.append(entry)
+                continue
+            ns.add_row(key, vector)
+        self._pending = waiting
+        self._drain = False
+        for ns in self._namespaces.values():
+            self._maintain(ns)
+
+    def _maintain(self, ns: _Namespace) -> None:
+        if ns.dead and ns.dead * 2 > ns.size:
+            ns.compact()
+            self._stats["compactions"] += 1
+        live = ns.size - ns.dead
+        if live >= self.ann_threshold and (ns.ivf is None or live >= 2 * ns.ivf.built_rows):
+            ns.ivf = _IVF(ns.matrix, np.flatnonzero(ns.alive[:ns.size]))
+            self._stats["ivf_builds"] += 1
+
+    # ---- 写入 ----
+
+    def _put(self, op: PutOp) -> None:
+        ns = self._namespaces.get(op.namespace)
+        if ns is None:
+            if op.value is None:
+                return
+            ns = self._namespaces[op.namespace] = _Namespace(self.dims or 1)
+        old = ns.items.get(op.key)
+        if old is not None:
+            ns.unindex_value(op.key, old.value)
+            ns.drop_rows(op.key)
+        self._version += 1
+        if op.value is None:
+            ns.items.pop(op.key, None)
+            ns.versions.pop(op.key, None)
+            return
+        now = datetime.now(timezone.utc)
+        ns.items[op.key] = Item(
+            value=dict(op.value), key=op.key, namespace=op.namespace,
+            created_at=old.created_at if old is not None else now, updated_at=now,
+        )
+        ns.versions[op.key] = self._version
+        ns.index_value(op.key, op.value)
+        self._stats["puts"] += 1
+        if self.embeddings is None or op.index is False:
+            return
+        paths = self._fields if op.index is None else [(p, tokenize_path(p)) for p in op.index]
+        for path, field in paths:
+            texts = get_text_at_path(op.value, field)
+            for i, text in enumerate(texts or ()):
+                self._pending.append((text, op.namespace, op.key, f"{path}.{i}" if len(texts) > 1 else path, self._version))
+
+    def _list_namespaces(self, op: ListNamespacesOp) -> List[Namespace]:
+        namespaces = [ns for ns, data in self._namespaces.items() if data.items]
+        if op.match_conditions:
+            namespaces = [ns for ns in namespaces if all(_namespace_matches(c, ns) for c in op.match_conditions)]
+        if op.max_depth is not None:
+            namespaces = sorted({ns[:op.max_depth] for ns in namespaces})
+        else:
+            namespaces = sorted(namespaces)
+        return namespaces[op.offset:op.offset + op.limit]
+
+    # ---- 搜索 ----
+
+    def _score(self, ns: _Namespace, rows: Optional[np.ndarray], query: np.ndarray, want: int) -> List[Tuple[float, str]]:
+        """在一个命名空间内为候选行（None 表示全部有效行）打分，返回分数最高的至多 want 行的 (分数, 键)。"""
+        if ns.ivf is not None and (rows is None or len(rows) > self.ann_threshold):
+            # 候选仍然很多：只在与查询最接近的簇中打分；过滤后的候选较少时直接精确打分
+            live = ns.size - ns.dead
+            # 过滤后只剩一部分行时按比例多探测一些簇，保证交集里仍有足够的候选
+            minimum = want if rows is None else want * max(1, live // max(len(rows), 1))
+            probed = ns.ivf.probe(query, self.nprobe, minimum)
+            probed = probed[ns.alive[probed]]
+            rows = probed if rows is None else np.intersect1d(rows, probed)
+            self._stats["ann_searches"] += 1
+        else:
+            self._stats["exact_searches"] += 1
+
+        if rows is None:
+            rows = np.flatnonzero(ns.alive[:ns.size]) if ns.dead else np.arange(ns.size)
+            scores = ns.matrix[rows] @ query if ns.dead else ns.matrix[:ns.size] @ query
+        else:
+            scores = ns.matrix[rows] @ query
+        self._stats["rows_scored"] += len(rows)
+        if not len(rows):
+            return []
+        top = np.argpartition(-scores, want - 1)[:want] if want < len(scores) else np.arange(len(scores))
+        return [(float(scores[i]), ns.owner[int(rows[i])]) for i in top.tolist()]
+
+    def _search(self, op: SearchOp, queries: Dict[str, np.ndarray]) -> List[SearchItem]:
+        self._stats["searches"] += 1
+        prefix = op.namespace_prefix
+        matched = [(name, ns) for name, ns in self._namespaces.items() if name[:len(prefix)] == prefix]
+        stop = op.offset + op.limit
+
+        if not op.query or self.embeddings is None:
+            out: List[SearchItem] = []
+            for name, ns in matched:
+                keys = ns.filter_keys(op.filter)
+                for key, item in ns.items.items():
+                    if keys is None or key in keys:
+                        out.append(self._result(item, None))
+                        if len(out) >= stop:
+                            return out[op.offset:]
+            return out[op.offset:]
+
+        query = queries[op.query]
+        candidates: List[Tuple[float, Namespace, str]] = []
+        for name, ns in matched:
+            for score, key in self._score(ns, ns.filter_rows(op.filter), query, stop * ns.max_paths):
+                candidates.append((score, name, key))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        kept: List[SearchItem] = []
+        seen: Set[Tuple[Namespace, str]] = set()
+        for score, name, key in candidates:  # 多个字段向量时取最大分
+            if (name, key) in seen:
+                continue
+            seen.add((name, key))
+            if len(seen) > stop:
+                break
+            if len(seen) > op.offset:
+                kept.append(self._result(self._namespaces[name].items[key], score))
+        if len(kept) < op.limit:
+            # 与 InMemoryStore 一致：没有向量的记忆排在有分数的结果之后
+            for name, ns in matched:
+                keys = ns.filter_keys(op.filter)
+                for key in (keys if keys is not None else ns.items):
+                    if len(kept) >= op.limit:
+                        break
+                    if key not in ns.rows and (name, key) not in seen:
+                        kept.append(self._result(ns.items[key], None))
+        return kept
+
+    @staticmethod
+    def _result(item: Item, score: Optional[float]) -> SearchItem:
+        return SearchItem(
+            namespace=item.namespace, key=item.key, value=item.value,
+            created_at=item.created_at, updated_at=item.updated_at, score=score,
+        )
+
+    # ---- BaseStore 接口 ----
+
+    def _apply(self, ops: Iterable[Op]) -> Tuple[List[Result], List[Tuple[int, SearchOp]]]:
+        results: List[Result] = []
+        searches: List[Tuple[int, SearchOp]] = []
+        for i, op in enumerate(ops):
+            if isinstance(op, GetOp):
+                ns = self._namespaces.get(op.namespace)
+                results.append(ns.items.get(op.key) if ns else None)
+            elif isinstance(op, PutOp):
+                self._put(op)
+                results.append(None)
+            elif isinstance(op, SearchOp):
+                searches.append((i, op))
+                results.append(None)
+            elif isinstance(op, ListNamespacesOp):
+                results.append(self._list_namespaces(op))
+            else:
+                raise ValueError(f"未知的操作类型: {type(op)}")
+        return results, searches
+
+    def _finish(
+        self, results: List[Result], searches: List[Tuple[int, SearchOp]], fresh: Dict[Tuple[str, str], np.ndarray]
+    ) -> List[Result]:
+        with self._lock:
+            if self._drain:
+                self._insert_pending(fresh)
+            queries = {
+                op.query: fresh.get(("query", op.query), self._cache.get(("query", op.query)))
+                for _, op in searches if op.query
+            }
+            for i, op in searches:
+                results[i] = self._search(op, queries)
+        return results
+
+    def batch(self, ops: Iterable[Op]) -> List[Result]:
+        with self._lock:
+            results, searches = self._apply(ops)
+            if self.embeddings is None:
+                return self._finish(results, searches, {})
+            documents, queries = self._texts_to_embed((op.query for _, op in searches if op.query), bool(searches))
+        fresh = self._embed(documents, queries)  # 不持有锁调用模型
+        return self._finish(results, searches, fresh)
+
+    async def abatch(self, ops: Iterable[Op]) -> List[Result]:
+        with self._lock:
+            results, searches = self._apply(ops)
+            if self.embeddings is None:
+                return self._finish(results, searches, {})
+            documents, queries = self._texts_to_embed((op.query for _, op in searches if op.query), bool(searches))
+        fresh = await self._aembed(documents, queries)
+        return self._finish(results, searches, fresh)
+
+    def flush(self) -> None:
+        """立即嵌入所有排队的记忆。"""
+        with self._lock:
+            documents, _ = self._texts_to_embed((), True)
+        fresh = self._embed(documents, []) if self.embeddings is not None else {}
+        with self._lock:
+            self._insert_pending(fresh)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["namespaces"] = len(self._namespaces)
+            out["items"] = sum(len(ns.items) for ns in self._namespaces.values())
+            out["vectors"] = sum(ns.size - ns.dead for ns in self._namespaces.values())
+            out["pending"] = len(self._pending)
+            out["ivf_namespaces"] = sum(1 for ns in self._namespaces.values() if ns.ivf is not None)
+        calls = out["embedded_texts"] + out["embed_cache_hits"]
+        out["embed_cache_hit_rate"] = round(out["embed_cache_hits"] / calls, 4) if calls else 0.0
+        return out
@@ -1,69 +1,110 @@
 
 # 提示链
-from typing import Optional
 import os
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+import sys
+from functools import lru_cache
+from pathlib import Path
 
-# 使用 Ollama 本地部署的 deepseek-chat 模型 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model  # 共享的模型工厂：按模型缓存实例并复用连接池
+
+# 使用 Ollama 本地部署的 deepseek-chat 模型
 # pip install langchain langchain-community langchain-openai langgraph
 # ollama run  deepseek-r1:14b
 
-def build_model(provider: str, model_name: Optional[str] = None):
-	provider = provider.lower()
+# 导入本模块时不加载 langchain_core、也不创建模型；
+# 两者都推迟到第一次调用 get_stage_chains() 时，缩短短任务的冷启动时间。
 
-	if provider == "openai":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_openai import ChatOpenAI
 
-		name = model_name or os.getenv("LLM_MODEL") or "gpt-4o-mini"
-		return ChatOpenAI(model=name)
+@lru_cache(maxsize=None)
+def get_stage_chains():
+   """构建（并缓存）两个阶段各自的链：(extraction_chain, transform_chain)。"""
+   from langchain_core.prompts import ChatPromptTemplate
+   from common.reasoning import text_parser  # StrOutputParser + 流式去除 <think> 推理段
 
-	if provider == "ollama":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_ollama import ChatOllama
+   llm = build_model("ollama")
 
-		name = model_name or os.getenv("LLM_MODEL") or "deepseek-r1:14b"
-		return ChatOllama(model=name)
+   # --- 提示 1：提取信息 ---
+   # 第一个用于从输入字符串中提取技术规格信息
+   prompt_extract = ChatPromptTemplate.from_template(
+      "Extract the technical specifications from the following text:\n\n{text_input}"
+   )
 
-	raise ValueError(
-		f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
-	)
+   # --- 提示 2：转换为 JSON ---
+   # 第二个用于将这些规格信息格式化为一个 JSON 对象。
+   prompt_transform = ChatPromptTemplate.from_template(
+      "Transform the following specifications into a JSON object with 'cpu', 'memory', and 'storage' as keys:\n\n{specifications}"
+   )
 
-llm = build_model("ollama")
+   # --- 使用 LCEL 构建提示链 ---
+   # text_parser() 将 LLM 的消息输出转换为简单字符串，并去掉 <think> 推理段，
+   # 推理内容不会被拼进下一步的 {specifications}。
+   # 第一个链extraction_chain用于提取规格信息。
+   extraction_chain = prompt_extract | llm | text_parser()
 
-# --- 提示 1：提取信息 ---
-# 第一个用于从输入字符串中提取技术规格信息
-prompt_extract = ChatPromptTemplate.from_template(
-   "Extract the technical specifications from the following text:\n\n{text_input}"
-)
+   # 第二个链transform_chain把规格信息转换为 JSON。
+   transform_chain = prompt_transform | llm | text_parser()
+   return extraction_chain, transform_chain
 
 
-# --- 提示 2：转换为 JSON ---
-# 第二个用于将这些规格信息格式化为一个 JSON 对象。
-prompt_transform = ChatPromptTemplate.from_template(
-   "Transform the following specifications into a JSON object with 'cpu', 'memory', and 'storage' as keys:\n\n{specifications}"
-)
+@lru_cache(maxsize=None)
+def get_full_chain():
+   """构建（并缓存）提取 -> 转换的完整提示链。"""
+   extraction_chain, transform_chain = get_stage_chains()
+   # 完整的提示链将提取链的输出作为变量 'specifications' 传入转换提示。
+   # 完整链full_chain将提取结果作为输入传递给转换提示prompt_transform。
+   return {"specifications": extraction_chain} | transform_chain
 
-# --- 使用 LCEL 构建提示链 ---
-# StrOutputParser() 用于将 LLM 的消息输出转换为简单字符串。
-# 第一个链extraction_chain用于提取规格信息。
-extraction_chain = prompt_extract | llm | StrOutputParser()
 
-# 完整的提示链将提取链的输出作为变量 'specifications' 传入转换提示。
-# 完整链full_chain将提取结果作为输入传递给转换提示prompt_transform。
-full_chain = (
-   {"specifications": extraction_chain}
-   | prompt_transform
-   | llm
-   | StrOutputParser()
-)
+def stream_chain(text_input, timings=None):
+   """流式执行提示链，逐个产出 (阶段名, 文本增量)。
 
-# --- 运行提示链 ---
-input_text = "The new laptop model features a 3.5 GHz octa-core processor, 16GB of RAM, and a 1TB NVMe SSD."
+   两个阶段都通过 text_parser 逐 token 流出（推理段在流中即被过滤）：提取阶段的增量立即可见，
+   其流结束后马上启动转换阶段，转换阶段的 token 直接交给调用方。
+   传入列表 timings 时会追加每个阶段的 StageTiming（含 TTFT）。
+   """
+   from common.streaming import stream_stages
 
-# 使用输入文本字典执行整个提示链。
-final_result = full_chain.invoke({"text_input": input_text})
+   extraction_chain, transform_chain = get_stage_chains()
+   return stream_stages(
+      [
+         ("extract", lambda _: extraction_chain.stream({"text_input": text_input})),
+         ("transform", lambda specs: transform_chain.stream({"specifications": specs})),
+      ],
+      timings,
+   )
 
-print("\n--- 最终 JSON 输出 ---")
-print(final_result)
\ No newline at end of file
+
+# --- 运行提示链 ---
+def main():
+   input_text = "The new laptop model features a 3.5 GHz octa-core processor, 16GB of RAM, and a 1TB NVMe SSD."
+
+   if os.getenv("CHAIN_STREAM"):
+      # 流式模式：中间阶段与最终阶段的 token 一产生就打印，并报告每个阶段的 TTFT
+      from common.streaming import format_timings
+
+      timings = []
+      current = None
+      for stage, delta in stream_chain(input_text, timings):
+         if stage != current:
+            current = stage
+            print(f"\n--- 阶段 {stage}（流式）---")
+         print(delta, end="", flush=True)
+      print(f"\n\n--- 各阶段耗时 ---\n{format_timings(timings)}")
+   else:
+      # 使用输入文本字典执行整个提示链。
+      final_result = get_full_chain().invoke({"text_input": input_text})
+
+      print("\n--- 最终 JSON 输出 ---")
+      print(final_result)
+
+   from common.cache import get_response_cache
+
+   cache = get_response_cache()
+   if cache is not None:
+      # 启用了响应缓存（见 common/cache.py，LLM_CACHE=off 时为 None）时，打印命中统计
+      print(f"\n--- 响应缓存统计 ---\n{cache.stats()}")
+
+
+if __name__ == "__main__":
+   main()
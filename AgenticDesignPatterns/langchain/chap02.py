@@ -1,40 +1,23 @@
-from typing import Optional
 import os
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough, RunnableBranch
+import sys
+from functools import lru_cache
+from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model  # 共享的模型工厂：按模型缓存实例并复用连接池
+from common.router import get_router  # 分层路由：规则 -> 线性分类器 -> LLM
 
-def build_model(provider: str, model_name: Optional[str] = None):
-	provider = provider.lower()
 
-	if provider == "openai":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_openai import ChatOpenAI
-
-		name = model_name or os.getenv("LLM_MODEL") or "gpt-4o-mini"
-		return ChatOpenAI(model=name)
-
-	if provider == "ollama":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_ollama import ChatOllama
-
-		name = model_name or os.getenv("LLM_MODEL") or "deepseek-r1:14b"
-		return ChatOllama(model=name)
-
-	raise ValueError(
-		f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
-	)
-
-llm = None
-try:
-    llm = build_model("ollama")
-    print(f"语言模型已初始化: {llm.model}")
-except Exception as e:
-    print(f"语言模型初始化失败: {e}")
-    llm = None
+# 模型与 langchain_core 都在第一次调用时才加载，导入本模块不会触发网络或重型依赖。
+@lru_cache(maxsize=None)
+def get_llm():
+    try:
+        llm = build_model("ollama")
+        print(f"语言模型已初始化: {llm.model}")
+        return llm
+    except Exception as e:
+        print(f"语言模型初始化失败: {e}")
+        return None
 
 
 # --- 定义模拟的子代理处理程序（相当于 ADK 的 sub_agents） ---
@@ -53,49 +36,96 @@ def unclear_handler(request: str) -> str:
    print("\n--- 处理不明确的请求 ---")
    return f"协调器无法委派该请求: '{request}'。请进一步说明。"
 
-# --- 定义协调器路由链（相当于 ADK 协调器的指令） ---
-# 该链用于决定将请求委派给哪个处理程序。
-coordinator_router_prompt = ChatPromptTemplate.from_messages([
-   ("system", """分析用户请求并确定应由哪个专业处理程序负责。
+# --- 协调器路由指令（相当于 ADK 协调器的指令） ---
+COORDINATOR_SYSTEM_PROMPT = """分析用户请求并确定应由哪个专业处理程序负责。
     - 若请求涉及预订航班或酒店，请输出 'booker'；
     - 若请求为一般信息查询，请输出 'info'；
     - 若请求不清晰或不属于上述类别，请输出 'unclear'。
-    仅输出一个单词：'booker'、'info' 或 'unclear'。"""),
-   ("user", "{request}")
-])
-
-if llm:
-   coordinator_router_chain = coordinator_router_prompt | llm | StrOutputParser()
-
-# --- 定义委派逻辑（相当于 ADK 的自动流程，根据 sub_agents 分派） ---
-# 使用 RunnableBranch 根据路由结果将任务分派至对应处理程序。
-
-# 定义各个分支逻辑
-branches = {
-   "booker": RunnablePassthrough.assign(output=lambda x: booking_handler(x['request']['request'])),
-   "info": RunnablePassthrough.assign(output=lambda x: info_handler(x['request']['request'])),
-   "unclear": RunnablePassthrough.assign(output=lambda x: unclear_handler(x['request']['request'])),
-}
-
-# 创建 RunnableBranch。
-# 它接收路由链的输出，并根据分类结果将原始请求转发给对应的处理函数。
-delegation_branch = RunnableBranch(
-   (lambda x: x['decision'].strip() == 'booker', branches["booker"]), # 增加 .strip() 防止多余空格
-   (lambda x: x['decision'].strip() == 'info', branches["info"]),     # 同上
-   branches["unclear"] # 默认分支，处理“不明确”或其他输出
-)
-
-# 将路由链与委派分支组合为一个完整的可运行单元
-# 路由链的输出（decision）与原始输入（request）一并传递给委派逻辑
-coordinator_agent = {
-   "decision": coordinator_router_chain,
-   "request": RunnablePassthrough()
-} | delegation_branch | (lambda x: x['output'])  # 提取最终输出
+    仅输出一个单词：'booker'、'info' 或 'unclear'。"""
+
+
+@lru_cache(maxsize=None)
+def get_coordinator_agent():
+   """构建（并缓存）路由链 + 委派分支组成的协调器；模型不可用时返回 None。"""
+   llm = get_llm()
+   if not llm:
+       return None
+
+   from langchain_core.prompts import ChatPromptTemplate
+   from common.reasoning import text_parser  # StrOutputParser + 流式去除 <think> 推理段
+   from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
+
+   # --- 定义协调器路由链 ---
+   # 该链用于决定将请求委派给哪个处理程序。
+   coordinator_router_prompt = ChatPromptTemplate.from_messages([
+      ("system", COORDINATOR_SYSTEM_PROMPT),
+      ("user", "{request}")
+   ])
+   coordinator_router_chain = coordinator_router_prompt | llm | text_parser()
+
+   # 可选的语义缓存（SEMANTIC_CACHE=on）：近似重复的请求直接复用之前的路由结果，跳过 LLM。
+   # 路由标签只有三种，跨实体命中（“去伦敦” vs “去巴黎”）也不会出错，因此阈值可以较低。
+   if os.getenv("SEMANTIC_CACHE"):
+       from common.semantic_cache import get_semantic_cache, with_semantic_cache
+
+       router_cache = get_semantic_cache("router", threshold=0.6)
+   else:
+       router_cache = None
+   if router_cache is not None:
+       coordinator_router_chain = with_semantic_cache(
+           coordinator_router_chain,
+           router_cache,
+           "request",
+           accept=lambda decision: decision.strip() in ("booker", "info", "unclear"),
+       )
+
+   # --- 分层路由 ---
+   # 规则与线性分类器有把握时在本地（亚毫秒级）给出决策，只有低置信度的请求才调用上面的路由链。
+   router = get_router()
+
+   def route(inputs):
+       return router.route(
+           inputs["request"], llm=lambda request: coordinator_router_chain.invoke({"request": request})
+       ).label
+
+   async def aroute(inputs):
+       decision = await router.aroute(
+           inputs["request"], allm=lambda request: coordinator_router_chain.ainvoke({"request": request})
+       )
+       return decision.label
+
+   tiered_router = RunnableLambda(route, afunc=aroute, name="tiered_router")
+
+   # --- 定义委派逻辑（相当于 ADK 的自动流程，根据 sub_agents 分派） ---
+   # 使用 RunnableBranch 根据路由结果将任务分派至对应处理程序。
+
+   # 定义各个分支逻辑
+   branches = {
+      "booker": RunnablePassthrough.assign(output=lambda x: booking_handler(x['request']['request'])),
+      "info": RunnablePassthrough.assign(output=lambda x: info_handler(x['request']['request'])),
+      "unclear": RunnablePassthrough.assign(output=lambda x: unclear_handler(x['request']['request'])),
+   }
+
+   # 创建 RunnableBranch。
+   # 它接收路由链的输出，并根据分类结果将原始请求转发给对应的处理函数。
+   delegation_branch = RunnableBranch(
+      (lambda x: x['decision'].strip() == 'booker', branches["booker"]), # 增加 .strip() 防止多余空格
+      (lambda x: x['decision'].strip() == 'info', branches["info"]),     # 同上
+      branches["unclear"] # 默认分支，处理“不明确”或其他输出
+   )
+
+   # 将路由链与委派分支组合为一个完整的可运行单元
+   # 路由链的输出（decision）与原始输入（request）一并传递给委派逻辑
+   return {
+      "decision": tiered_router,
+      "request": RunnablePassthrough()
+   } | delegation_branch | (lambda x: x['output'])  # 提取最终输出
 
 # --- 示例运行 ---
 def main():
 
-   if not llm:
+   coordinator_agent = get_coordinator_agent()
+   if not coordinator_agent:
        print("\n由于语言模型初始化失败，跳过执行。")
        return
 
@@ -114,5 +144,15 @@ def main():
    result_c = coordinator_agent.invoke({"request": request_c})
    print(f"最终结果 C: {result_c}")
 
+   print(f"\n--- 路由分层统计 ---\n{get_router().stats()}")
+
+   if os.getenv("SEMANTIC_CACHE"):
+       # 启用了语义缓存（见 common/semantic_cache.py）时，打印命中统计
+       from common.semantic_cache import get_semantic_cache
+
+       router_cache = get_semantic_cache("router", threshold=0.6)
+       if router_cache is not None:
+           print(f"\n--- 路由语义缓存统计 ---\n{router_cache.stats()}")
+
 if __name__ == "__main__":
-   main()
\ No newline at end of file
+   main()
@@ -1,97 +1,94 @@
 # 并行化
 
-import os 
 import asyncio
-from typing import Optional
+import sys
+from functools import lru_cache
+from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model  # 共享的模型工厂：按模型缓存实例并复用连接池
+from common.limiter import get_limits  # 扇出的全局 / 每模型自适应并发限制
 
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import Runnable, RunnableParallel, RunnablePassthrough
 
-def build_model(provider: str, model_name: Optional[str] = None):
-	provider = provider.lower()
-
-	if provider == "openai":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_openai import ChatOpenAI
-
-		name = model_name or os.getenv("LLM_MODEL") or "gpt-4o-mini"
-		return ChatOpenAI(model=name)
-
-	if provider == "ollama":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_ollama import ChatOllama
-
-		name = model_name or os.getenv("LLM_MODEL") or "deepseek-r1:14b"
-		return ChatOllama(model=name)
+# 模型与 langchain_core 都在第一次调用时才加载，导入本模块不会触发网络或重型依赖。
+@lru_cache(maxsize=None)
+def get_llm():
+   try:
+      return build_model("ollama")
+   except Exception as e:
+      print(f"初始化语言模型时出错: {e}")
+      return None
 
-	raise ValueError(
-		f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
-	)
 
+@lru_cache(maxsize=None)
+def get_full_parallel_chain():
+   """构建（并缓存）并行 + 综合链；模型不可用时返回 None。"""
+   llm = get_llm()
+   if not llm:
+      return None
+   # 所有分支（以及综合步骤）的模型调用共享同一组并发闸门：
+   # 多个请求同时扇出时不会把本地 Ollama 打满，上限按观测到的延迟自适应调整。
+   llm = get_limits().wrap(llm)
+
+   from langchain_core.prompts import ChatPromptTemplate
+   from common.reasoning import text_parser  # StrOutputParser + 流式去除 <think> 推理段
+   from langchain_core.runnables import Runnable, RunnableParallel, RunnablePassthrough
+
+   # --- 定义独立的链 ---
+   # 这三条链表示可以并行执行的不同任务。
+   summarize_chain: Runnable = (
+      ChatPromptTemplate.from_messages([
+          ("system", "简要总结以下话题："),
+          ("user", "{topic}")
+      ])
+      | llm
+      | text_parser()
+   )
+
+   questions_chain: Runnable = (
+      ChatPromptTemplate.from_messages([
+          ("system", "生成三个有趣的问题，关于以下话题："),
+          ("user", "{topic}")
+      ])
+      | llm
+      | text_parser()
+   )
+
+   terms_chain: Runnable = (
+      ChatPromptTemplate.from_messages([
+          ("system", "识别以下话题中的 5-10 个关键术语，用逗号分隔："),
+          ("user", "{topic}")
+      ])
+      | llm
+      | text_parser()
+   )
+
+   # --- 构建并行 + 综合链 ---
+
+   # 1. 定义并行执行的任务块。它们的结果与原始话题一起被传递到下一步。
+   map_chain = RunnableParallel(
+      {
+          "summary": summarize_chain,  # 话题总结
+          "questions": questions_chain,  # 相关问题
+          "key_terms": terms_chain,  # 关键术语
+          "topic": RunnablePassthrough(),  # 原始话题传递
+      }
+   )
+
+   # 2. 定义最终的综合提示模板，将并行结果合并。
+   synthesis_prompt = ChatPromptTemplate.from_messages([
+      ("system", """根据以下信息：
+       总结: {summary}
+       相关问题: {questions}
+       关键术语: {key_terms}
+       综合给出一个答案。"""),
+      ("user", "原始话题: {topic}")
+   ])
 
-try:
-   llm = build_model("ollama")
-except Exception as e:
-   print(f"初始化语言模型时出错: {e}")
-   llm = None
+   # 3. 构建完整的链，将并行结果直接传入综合提示，再由语言模型和输出解析器处理。
+   return map_chain | synthesis_prompt | llm | text_parser()
 
-# --- 定义独立的链 --- 
-# 这三条链表示可以并行执行的不同任务。
-summarize_chain: Runnable = (
-   ChatPromptTemplate.from_messages([
-       ("system", "简要总结以下话题："),
-       ("user", "{topic}")
-   ])
-   | llm
-   | StrOutputParser()
-)
-
-questions_chain: Runnable = (
-   ChatPromptTemplate.from_messages([
-       ("system", "生成三个有趣的问题，关于以下话题："),
-       ("user", "{topic}")
-   ])
-   | llm
-   | StrOutputParser()
-)
-
-terms_chain: Runnable = (
-   ChatPromptTemplate.from_messages([
-       ("system", "识别以下话题中的 5-10 个关键术语，用逗号分隔："),
-       ("user", "{topic}")
-   ])
-   | llm
-   | StrOutputParser()
-)
-
-# --- 构建并行 + 综合链 --- 
-
-# 1. 定义并行执行的任务块。它们的结果与原始话题一起被传递到下一步。
-map_chain = RunnableParallel(
-   {
-       "summary": summarize_chain,  # 话题总结
-       "questions": questions_chain,  # 相关问题
-       "key_terms": terms_chain,  # 关键术语
-       "topic": RunnablePassthrough(),  # 原始话题传递
-   }
-)
-
-# 2. 定义最终的综合提示模板，将并行结果合并。
-synthesis_prompt = ChatPromptTemplate.from_messages([
-   ("system", """根据以下信息：
-    总结: {summary}
-    相关问题: {questions}
-    关键术语: {key_terms}
-    综合给出一个答案。"""),
-   ("user", "原始话题: {topic}")
-])
-
-# 3. 构建完整的链，将并行结果直接传入综合提示，再由语言模型和输出解析器处理。
-full_parallel_chain = map_chain | synthesis_prompt | llm | StrOutputParser()
-
-# --- 运行链 --- 
+# --- 运行链 ---
 async def run_parallel_example(topic: str) -> None:
    """
    异步调用并行处理链，处理指定话题并打印综合结果。
@@ -99,7 +96,8 @@ async def run_parallel_example(topic: str) -> None:
    参数：
        topic: 要处理的输入话题。
    """
-   if not llm:
+   full_parallel_chain = get_full_parallel_chain()
+   if not full_parallel_chain:
        print("语言模型未初始化，无法运行示例。")
        return
 
@@ -110,10 +108,21 @@ async def run_parallel_example(topic: str) -> None:
        response = await full_parallel_chain.ainvoke(topic)
        print("\n--- 最终响应 ---")
        print(response)
+       print(f"\n--- 并发限制统计 ---\n{get_limits().stats()}")
+       from common.reasoning import reasoning_stats
+
+       # 四次调用中被去掉的推理段：综合提示不再携带三个分支的推理内容
+       print(f"\n--- 推理段过滤统计 ---\n{reasoning_stats()}")
+       from common.cache import get_response_cache
+
+       cache = get_response_cache()
+       if cache is not None:
+           # 启用了响应缓存（见 common/cache.py，LLM_CACHE=off 时为 None）时，打印命中统计
+           print(f"\n--- 响应缓存统计 ---\n{cache.stats()}")
    except Exception as e:
        print(f"\n执行链时发生错误: {e}")
 
 if __name__ == "__main__":
    test_topic = "太空探索的历史"
    # 在 Python 3.7+ 中，使用 asyncio.run 是运行异步函数的标准方法。
-   asyncio.run(run_parallel_example(test_topic))
\ No newline at end of file
+   asyncio.run(run_parallel_example(test_topic))
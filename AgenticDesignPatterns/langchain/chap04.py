@@ -1,40 +1,22 @@
 
-import os 
-import asyncio
-from typing import Optional
+import sys
+from pathlib import Path
 
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import Runnable, RunnableParallel, RunnablePassthrough
-
-def build_model(provider: str, model_name: Optional[str] = None):
-	provider = provider.lower()
-
-	if provider == "openai":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_openai import ChatOpenAI
-
-		name = model_name or os.getenv("LLM_MODEL") or "gpt-4o-mini"
-		return ChatOpenAI(model=name)
-
-	if provider == "ollama":
-		# 延迟导入，避免未安装依赖或本地无用时报错
-		from langchain_ollama import ChatOllama
-
-		name = model_name or os.getenv("LLM_MODEL") or "deepseek-r1:14b"
-		return ChatOllama(model=name)
-
-	raise ValueError(
-		f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
-	)
-
-llm = build_model("ollama")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model  # 共享的模型工厂：按模型缓存实例并复用连接池
+from common.history import ReflectionHistory  # 有界的增量历史：最新代码 / 批评原文 + 旧批评摘要
+from common.codecheck import check_code, extract_python, precheck_enabled  # 确定性的本地检查
+from common.reasoning import visible_text  # 去除 <think> 推理段后的回复文本
 
 def run_reflection_loop():
    """
    演示一个多步骤的 AI 反思循环，用于逐步改进一个 Python 函数。
    """
+   # 延迟导入与建模：导入本模块时不加载 langchain_core，也不连接模型服务
+   from langchain_core.messages import SystemMessage, HumanMessage
+
+   llm = build_model("ollama")
+
    # --- 核心任务 ---
    task_prompt = """
    你的任务是创建一个名为 `calculate_factorial` 的 Python 函数。
@@ -50,8 +32,9 @@ def run_reflection_loop():
    max_iterations = 3
    current_code = ""
 
-   # 构建消息历史，以便在每一步提供上下文信息
-   message_history = [HumanMessage(content=task_prompt)]
+   # 构建消息历史，以便在每一步提供上下文信息。
+   # 只保留任务、最新代码与最新批评的原文，更早的批评压缩为要点摘要，提示长度不随迭代次数增长。
+   history = ReflectionHistory(task_prompt, token_budget=2000)
 
    for i in range(max_iterations):
        print("\n" + "="*25 + f" 反思循环：第 {i + 1} 次迭代 " + "="*25)
@@ -61,20 +44,37 @@ def run_reflection_loop():
        if i == 0:
            print("\n>>> 阶段 1：生成初始代码...")
            # 第一次只需要任务提示
-           response = llm.invoke(message_history)
-           current_code = response.content
+           response = llm.invoke(history.messages())
+           current_code = visible_text(response)
        else:
            print("\n>>> 阶段 1：根据上次批评意见改进代码...")
            # 消息历史中包含任务、上次的代码及其批评
            # 我们要求模型根据批评进行改进
-           message_history.append(HumanMessage(content="请根据提供的批评意见改进代码。"))
-           response = llm.invoke(message_history)
-           current_code = response.content
+           response = llm.invoke(history.messages("请根据提供的批评意见改进代码。"))
+           current_code = visible_text(response)
 
+       report = history.report()
+       print(f"\n[提示 tokens] 本轮 {report['prompt_tokens']}，完整历史 {report['full_history_tokens']}，"
+             f"节省 {report['saved_tokens']}")
        print("\n--- 生成的代码 (版本 " + str(i + 1) + ") ---\n" + current_code)
-       message_history.append(response)  # 将生成的代码加入历史记录
-
-       # --- 2. 反思阶段 ---
+       history.add_code(current_code)  # 将生成的代码加入历史记录（取代上一版）
+
+       # --- 2. 本地检查 ---
+       # 语法 / 静态检查 / 代码自带的测试能给出确定结论时，不再请模型审查：
+       # 失败则直接把检查结果作为批评，全部通过则停止迭代。
+       if precheck_enabled():
+           check = check_code(extract_python(current_code))
+           print(f"\n>>> 本地检查：{check.summary()}")
+           if check.passed:
+               print("\n--- 批评结果 ---\n本地检查全部通过（含测试），代码已令人满意。")
+               break
+           if check.failed:
+               critique = check.feedback()
+               print("\n--- 批评结果（本地检查）---\n" + critique)
+               history.add_critique(critique)
+               continue
+
+       # --- 3. 反思阶段 ---
        print("\n>>> 阶段 2：对生成的代码进行反思...")
 
        # 为“反思代理”创建专用提示
@@ -95,20 +95,21 @@ def run_reflection_loop():
        ]
 
        critique_response = llm.invoke(reflector_prompt)
-       critique = critique_response.content
+       critique = visible_text(critique_response)
 
-       # --- 3. 停止条件 ---
+       # --- 4. 停止条件 ---
        if"CODE_IS_PERFECT"in critique:
            print("\n--- 批评结果 ---\n未发现进一步问题，代码已令人满意。")
            break
 
        print("\n--- 批评结果 ---\n" + critique)
        # 将批评内容添加到历史中，用于下一轮改进
-       message_history.append(HumanMessage(content=f"上次代码的批评意见:\n{critique}"))
+       history.add_critique(critique)
 
    print("\n" + "="*30 + " 最终结果 " + "="*30)
    print("\n反思过程结束后得到的最终优化代码：\n")
    print(current_code)
+   print(f"\n[提示 tokens 合计] {history.totals()}")
 
 if __name__ == "__main__":
    run_reflection_loop()
@@ -15,145 +15,207 @@
 3) 汇总链：结合工具结果输出最终回答。
 """
 
-import os
 import asyncio
-from typing import Optional, List
+import sys
+from functools import lru_cache
+from pathlib import Path
 
-import nest_asyncio
-from langchain_core.tools import tool  # 定义/注册可被 LC 使用的 Python 工具
-from langchain_core.prompts import ChatPromptTemplate  # 构造对话提示模版
-from langchain_core.output_parsers import StrOutputParser  # 将模型输出解析为纯文本字符串
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model  # 共享的模型工厂：按模型缓存实例并复用连接池
+from common.batcher import batched  # 并发请求的微批处理
+from common.jsonstream import IncrementalJSONObject, adecide, decision_stream_enabled, parse_decision  # 决策 JSON 的流式解析
+from common.reasoning import strip_think
+from common.tools import (  # 带索引的知识表、异步工具注册表与推测执行
+  KnowledgeTable, Speculator, get_tool_registry, normalize, speculation_enabled,
+)
 
-def build_model(provider: str, model_name: Optional[str] = None):
-  """根据提供商构建聊天模型。
-
-  参数：
-  - provider: "openai" 或 "ollama"
-  - model_name: 可选模型名；不传则读取环境变量 LLM_MODEL；再不传使用合理默认值。
-
-  说明：采用“延迟导入”，避免未安装某些依赖时报 ImportError。
-  """
-  provider = provider.lower()
-
-  if provider == "openai":
-    # OpenAI 聊天模型（需要有效的 OpenAI API Key）
-    from langchain_openai import ChatOpenAI
-
-    name = model_name or os.getenv("LLM_MODEL") or "gpt-4o-mini"
-    return ChatOpenAI(model=name)
-
-  if provider == "ollama":
-    # 本地 Ollama 模型（例如 deepseek-r1:14b）。注意：该模型不支持 tools。
-    from langchain_ollama import ChatOllama
-
-    name = model_name or os.getenv("LLM_MODEL") or "deepseek-r1:14b"
-    return ChatOllama(model=name)
-
-  raise ValueError(
-    f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
-  )
-
-try:
+# langchain_core / nest_asyncio 与模型都在第一次调用时才加载，导入本模块不会触发重型依赖。
+@lru_cache(maxsize=None)
+def get_llm():
+  try:
     # 需要一个具有函数/工具调用功能的模型。
     llm = build_model("ollama")
     print(f"✅ 语言模型已初始化: {getattr(llm, 'model', 'unknown')}")
-except Exception as e:
+    return llm
+  except Exception as e:
     print(f"初始化语言模型时出错: {e}")
-    llm = None
+    return None
 
 # --- 定义一个工具 ---
-@tool
+# 模拟的知识表：导入时构建一次索引（规范化键的哈希 + 倒排索引），查询不再每次重建字典。
+KNOWLEDGE = KnowledgeTable([
+  ("weather in london", "伦敦目前多云，气温15°C。"),
+  ("capital of france", "法国的首都是巴黎。"),
+  ("population of earth", "地球的估计人口约为80亿。"),
+  ("tallest mountain", "珠穆朗玛峰是地球上最高的山峰（海拔）。"),
+])
+NOT_FOUND = "未找到具体信息"
+
 def search_information(query: str) -> str:
     """
   简单的“信息检索”工具（模拟）。
 
   入参：
-  - query: 查询字符串，建议用英文关键词，便于检索（此处为模拟字典）。
+  - query: 查询字符串，建议用英文关键词，便于检索（此处为模拟知识表）。
 
   返回：
-  - 预置字典中的结果字符串；若无匹配，返回默认提示。
+  - 知识表中的结果字符串（先精确匹配，再按词重叠模糊匹配）；若无匹配，返回默认提示。
 
   用途：
   - 演示如何在“不支持原生 tools 的模型”场景下，依然能通过 Python 函数作为工具提供事实信息。
     """
     print(f"\n--- ️ 工具已调用: search_information，查询: '{query}' ---")
-    # 使用预定义结果的字典模拟一个搜索工具。
-    simulated_results = {
-      "weather in london": "伦敦目前多云，气温15°C。",
-      "capital of france": "法国的首都是巴黎。",
-      "population of earth": "地球的估计人口约为80亿。",
-      "tallest mountain": "珠穆朗玛峰是地球上最高的山峰（海拔）。",
-      "default": f"“{query}”的模拟搜索结果: 未找到具体信息，但该主题似乎很有趣。"
-    }
-    result = simulated_results.get(query.lower(), simulated_results["default"])
+    result = KNOWLEDGE.lookup(query) or f"“{query}”的模拟搜索结果: {NOT_FOUND}，但该主题似乎很有趣。"
     print(f"--- 工具结果: {result} ---")
     return result
 
-tools = [search_information]  # 工具列表：可扩展更多工具
-
-# --- 基于文本的轻量 ReAct 决策器（无需模型原生 tool-call 支持） ---
-# 该 Prompt 要求模型仅输出一个 JSON 且包含键：decision, tool_input
-# 注意：使用双花括号转义，避免被 PromptTemplate 误识别为变量
-decision_prompt = ChatPromptTemplate.from_messages([
-  ("system", (
-    "你是一个决策器。判断用户问题是否需要使用提供的工具search_information。\n"
-    "只输出一个JSON对象，不要多余文本。键为 decision 与 tool_input。示例：\n"
-    "{{\"decision\": \"use_tool|answer\", \"tool_input\": \"weather in London\"}}\n"
-    "若问题涉及地理事实/天气/人口/最高山等，选择 use_tool，并将查询翻译为简洁英文；否则输出 answer 并将 tool_input 设为空字符串。"
-  )),
-    ("human", "{question}")
-])
+@lru_cache(maxsize=None)
+def get_tools():
+  """把本地工具注册到共享的工具注册表：按名称异步调用，同步工具在有界线程池中执行。
+
+  search_information 的结果按规范化后的查询缓存 5 分钟，“未找到”缓存 30 秒；
+  并发的相同查询（例如两个问题都落到 "capital of france"）只执行一次（TOOL_CACHE=off 关闭）。
+  """
+  registry = get_tool_registry()
+  registry.register(  # 可继续注册更多工具
+    search_information, ttl=300, negative_ttl=30, key=normalize,
+    is_miss=lambda result: NOT_FOUND in result,
+  )
+  return registry
+
+# --- 推测执行（TOOL_SPECULATE=on） ---
+# 廉价启发式：问题同时包含这些关键词时，预测决策链会给出对应的 tool_input。
+SPECULATION_HINTS = [
+  (("法国", "首都"), "capital of france"),
+  (("伦敦", "天气"), "weather in london"),
+  (("地球", "人口"), "population of earth"),
+  (("最高", "山"), "tallest mountain"),
+]
+SPECULATOR = Speculator()
+DECISION_STATS = {"early": 0, "chars": 0, "think_chars": 0}  # 流式决策的累计统计
 
-# 用于将工具结果与原问题汇总为最终答案
-final_prompt = ChatPromptTemplate.from_messages([
-    ("system", "你是一个乐于助人的助手，尽量简洁、准确，用中文回答。"),
-    ("human", (
-        "原始问题：{question}\n"
-        "工具检索结果：{tool_result}\n"
-        "请结合工具结果，给出最终回答。若工具结果为空，则直接回答。"
+def predict_tool_input(question: str) -> str:
+  """根据原始问题预测工具输入；没有把握时返回空字符串（不推测）。"""
+  for keywords, tool_input in SPECULATION_HINTS:
+    if all(k in question for k in keywords):
+      return tool_input
+  # 问题本身就是知识表中的键（英文提问）时直接使用
+  return normalize(question) if KNOWLEDGE.get(question) is not None else ""
+
+@lru_cache(maxsize=None)
+def get_chains():
+  """构建（并缓存）决策链与汇总链；模型不可用时返回 None。"""
+  llm = get_llm()
+  if llm is None:
+    return None
+  # main() 并发运行多个查询：窗口内的请求合成一批派发；温度为 0 或 LLM_BATCH_COALESCE=on 时
+  # 相同的提示只请求一次，否则只合批、不去重（见 common/batcher.py）
+  # 决策链默认流式解析、定案后提前结束生成；流式请求无法合并，因此决策链直接使用原模型
+  decision_llm = llm if decision_stream_enabled() else batched(llm)
+  llm = batched(llm)
+
+  from langchain_core.output_parsers import StrOutputParser
+  from langchain_core.prompts import ChatPromptTemplate  # 构造对话提示模版
+  from common.reasoning import text_parser  # StrOutputParser + 流式去除 <think> 推理段
+
+  # --- 基于文本的轻量 ReAct 决策器（无需模型原生 tool-call 支持） ---
+  # 该 Prompt 要求模型仅输出一个 JSON 且包含键：decision, tool_input
+  # 注意：使用双花括号转义，避免被 PromptTemplate 误识别为变量
+  decision_prompt = ChatPromptTemplate.from_messages([
+    ("system", (
+      "你是一个决策器。判断用户问题是否需要使用提供的工具search_information。\n"
+      "只输出一个JSON对象，不要多余文本。键为 decision 与 tool_input。示例：\n"
+      "{{\"decision\": \"use_tool|answer\", \"tool_input\": \"weather in London\"}}\n"
+      "若问题涉及地理事实/天气/人口/最高山等，选择 use_tool，并将查询翻译为简洁英文；否则输出 answer 并将 tool_input 设为空字符串。"
     )),
-])
+      ("human", "{question}")
+  ])
+
+  # 用于将工具结果与原问题汇总为最终答案
+  final_prompt = ChatPromptTemplate.from_messages([
+      ("system", "你是一个乐于助人的助手，尽量简洁、准确，用中文回答。"),
+      ("human", (
+          "原始问题：{question}\n"
+          "工具检索结果：{tool_result}\n"
+          "请结合工具结果，给出最终回答。若工具结果为空，则直接回答。"
+      )),
+  ])
+
+  # 决策链输出原始文本：DecisionParser 自己经 ThinkFilter 去掉推理段并统计丢弃的字符数（推理段 N）
+  decision_chain = decision_prompt | decision_llm | StrOutputParser()  # 决策链
+  answer_chain = final_prompt | llm | text_parser()      # 汇总链
+  return decision_chain, answer_chain
+
+def get_decision_cache():
+  """可选的语义缓存（SEMANTIC_CACHE=on）：同义改写的问题复用之前的决策；未启用时返回 None。
+
+  tool_input 与具体实体相关（“法国” vs “意大利”），因此阈值要比路由缓存高得多。
+  缓存在 run_agent_with_tool 中、决策流开始之前查询，不包装决策链，流式提前结束照常生效。
+  """
+  from common.semantic_cache import get_semantic_cache  # 不加载 numpy：向量在缓存启用后才构建
+
+  return get_semantic_cache("decision", threshold=0.9)
 
-decision_chain = decision_prompt | llm | StrOutputParser()  # 决策链
-answer_chain = final_prompt | llm | StrOutputParser()      # 汇总链
+def _is_decision_json(raw: str) -> bool:
+  """只缓存能被解析、且包含 decision 字段的决策输出（忽略 <think> 段与代码块标记）。"""
+  return "decision" in IncrementalJSONObject().feed(strip_think(raw))
 
 async def run_agent_with_tool(query: str):
   """
   使用“决策 -> 可选工具 -> 汇总”的三步流程生成答案。
 
   步骤：
-  1) 调用 decision_chain：得到是否用工具（decision=use_tool|answer）及工具输入（tool_input）。
-  2) 若需要，调用 search_information 工具（通过 .invoke 或 .run）。
+  1) 调用 decision_chain：得到是否用工具（decision=use_tool|answer）及工具输入（tool_input），
+     默认流式解析，定案后立即结束生成（DECISION_STREAM=off 时等完整输出再解析）；
+     启用语义缓存时先查缓存，命中则跳过模型调用，未命中时把解析出的决策写入缓存。
+  2) 若需要，通过工具注册表异步调用 search_information（不阻塞事件循环）。
   3) 调用 answer_chain：结合工具结果输出最终回答。
+
+  推测模式（TOOL_SPECULATE=on）下，第 2 步按 predict_tool_input 的预测与第 1 步同时启动；
+  决策给出的 tool_input 与预测一致时直接使用其结果，关键路径上少一个阶段，否则丢弃并照常调用。
   """
-  if llm is None:
+  chains = get_chains()
+  if chains is None:
     print("LLM 未初始化，跳过。")
     return
+  decision_chain, answer_chain = chains
   print(f"\n---  正在处理查询: '{query}' ---")
+  decision_cache = get_decision_cache()
+  cached = decision_cache.lookup(query) if decision_cache is not None else None
+  speculation = None
+  if cached is None and speculation_enabled():
+    predicted = predict_tool_input(query)
+    if predicted:
+      speculation = SPECULATOR.launch(get_tools(), "search_information", predicted)
   try:
-    raw = await decision_chain.ainvoke({"question": query})
-    # 解析JSON
-    import json
-    decision = {"decision": "answer", "tool_input": ""}
-    try:
-      decision = json.loads(raw.strip())
-    except Exception:
-      # 简单兜底解析
-      text = raw.lower()
-      if "use_tool" in text:
-        decision["decision"] = "use_tool"
+    if cached is not None:
+      (choice, ti), similarity = cached
+      print(f"决策: {choice}，语义缓存命中（相似度 {similarity:.3f}）")
+    elif decision_stream_enabled():
+      # 边生成边解析：decision（以及 use_tool 时的 tool_input）一完整就关闭流，剩余 token 不再生成
+      choice, ti, info = await adecide(decision_chain.astream({"question": query}), query)
+      for k in DECISION_STATS:
+        DECISION_STATS[k] += int(info[k])
+      print(f"决策: {choice}，{'提前结束' if info['early'] else '完整输出'}，接收 {info['chars']} 字符（推理段 {info['think_chars']}）")
+      if decision_cache is not None and info["parsed"]:
+        decision_cache.add(query, (choice, ti))
+    else:
+      raw = await decision_chain.ainvoke({"question": query})
+      choice, ti = parse_decision(raw, query)
+      if decision_cache is not None and _is_decision_json(raw):
+        decision_cache.add(query, (choice, ti))
     tool_result = ""
-    if decision.get("decision") == "use_tool":
-      ti = (decision.get("tool_input") or query).strip()
-      # 使用 LangChain 工具的 invoke 接口调用
+    use_tool = choice == "use_tool"
+    ti = ti if use_tool else None
+    pending, speculation = speculation, None  # 交给 resolve 之后不再由 finally 放弃
+    hit, speculative_result = await SPECULATOR.resolve(pending, "search_information" if use_tool else None, ti)
+    if hit:
+      tool_result = speculative_result
+    elif use_tool:
       try:
-        tool_result = search_information.invoke({"query": ti})
+        tool_result = await get_tools().acall("search_information", ti)
       except Exception:
-        # 兼容旧接口
-        try:
-          tool_result = search_information.run(ti)
-        except Exception:
-          tool_result = f"(工具调用失败，按原问题回答)"
+        tool_result = "(工具调用失败，按原问题回答)"
     final = await answer_chain.ainvoke({
       "question": query,
       "tool_result": tool_result,
@@ -161,6 +223,9 @@ async def run_agent_with_tool(query: str):
     print("\n--- ✅ 最终回答 ---\n" + final)
   except Exception as e:
     print(f"\n流程执行期间发生错误: {e}")
+  finally:
+    # 决策步骤出错或被取消时推测还没有 resolve：放弃它，避免任务结果（及异常）无人认领
+    SPECULATOR.abandon(speculation)
 
 async def main():
   """并发运行多个示例查询，便于观察不同路径（用工具/直接回答）。"""
@@ -168,8 +233,29 @@ async def main():
     run_agent_with_tool("法国的首都是什么？"),
     run_agent_with_tool("伦敦天气怎么样？"),
     run_agent_with_tool("告诉我一些关于狗的事情。"),  # 应该触发默认工具响应
+    run_agent_with_tool("法国首都是哪座城市？"),  # 与第一条落到同一个工具输入：并发时合并为一次工具调用
   ]
   await asyncio.gather(*tasks)
 
-nest_asyncio.apply()  # 允许在 Jupyter/交互式环境中再次进入事件循环
-asyncio.run(main())   # 运行示例
+  # 对同一个模型再次包装会拿到同一个批处理器（未启用合并时没有批处理器）
+  batcher = getattr(batched(get_llm()), "batcher", None) if get_llm() else None
+  if batcher is not None:
+    print(f"\n--- 微批处理统计 ---\n{batcher.stats()}")
+
+  print(f"\n--- 工具延迟与缓存统计 ---\n{get_tools().stats()}")
+  if speculation_enabled():
+    print(f"\n--- 推测执行统计 ---\n{SPECULATOR.stats()}")
+  if decision_stream_enabled():
+    print(f"\n--- 流式决策统计 ---\n{DECISION_STATS}")
+
+  decision_cache = get_decision_cache()
+  if decision_cache is not None:
+    # 启用了语义缓存（见 common/semantic_cache.py）时，打印命中统计
+    print(f"\n--- 决策语义缓存统计 ---\n{decision_cache.stats()}")
+
+if __name__ == "__main__":
+  import nest_asyncio
+
+  nest_asyncio.apply()  # 允许在 Jupyter/交互式环境中再次进入事件循环
+  asyncio.run(main())   # 运行示例
+
@@ -1,8 +1,5 @@
 import os
 
-from crewai import Agent, Task, Crew, Process
-from crewai import LLM
-
 # 多智能体协作设计模式
 # 要点总结：
 # 多智能体协作涉及多个智能体共同努力以实现一个共同目标。
@@ -13,13 +10,17 @@ def main():
     """
     使用最新的 Gemini 模型初始化并运行用于内容创建的 AI 团队。
     """
+    # 延迟导入 crewai：导入本模块时不加载重型依赖
+    from crewai import Agent, Task, Crew, Process
+    from crewai import LLM
+
 
     # 定义要使用的语言模型。
     # 对于前沿（预览版）功能，您可以使用 "ollama deepseek"。
     # 使用本地 Ollama 模型（确保 Ollama 在本机运行并已拉取 deepseek-r1:14b）
     llm = LLM(
         model="ollama/deepseek-r1:14b",
-        base_url="http://localhost:11434",
+        base_url=os.getenv("OLLAMA_HOST", "http://localhost:11434"),
         temperature=0.3,
     )
 
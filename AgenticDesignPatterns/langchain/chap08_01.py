@@ -1,50 +1,23 @@
 import os
-from typing import Optional
+import sys
+from functools import lru_cache
+from pathlib import Path
 
-from langchain_core.tools import tool  # 定义/注册可被 LC 使用的 Python 工具
-from langchain_core.prompts import PromptTemplate
-from langchain_core.chat_history import InMemoryChatMessageHistory
-from langchain_core.runnables import RunnableSequence
-from langchain_core.runnables.history import RunnableWithMessageHistory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model  # 共享的模型工厂：按模型缓存实例并复用连接池
 
 
-def build_model(provider: str, model_name: Optional[str] = None):
-  """根据提供商构建聊天模型。
-
-  参数：
-  - provider: "openai" 或 "ollama"
-  - model_name: 可选模型名；不传则读取环境变量 LLM_MODEL；再不传使用合理默认值。
-
-  说明：采用“延迟导入”，避免未安装某些依赖时报 ImportError。
-  """
-  provider = provider.lower()
-
-  if provider == "openai":
-    # OpenAI 聊天模型（需要有效的 OpenAI API Key）
-    from langchain_openai import ChatOpenAI
-
-    name = model_name or os.getenv("LLM_MODEL") or "gpt-4o-mini"
-    return ChatOpenAI(model=name)
-
-  if provider == "ollama":
-    # 本地 Ollama 模型（例如 deepseek-r1:8b）。注意：该模型不支持 tools。
-    from langchain_ollama import ChatOllama
-
-    name = model_name or os.getenv("LLM_MODEL") or "deepseek-r1:8b"
-    return ChatOllama(model=name)
-
-  raise ValueError(
-    f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
-  )
-
-
-try:
+# langchain_core 与模型都在第一次调用时才加载，导入本模块不会触发重型依赖。
+@lru_cache(maxsize=None)
+def get_llm():
+  try:
     # 需要一个具有函数/工具调用功能的模型。
-    llm = build_model("ollama")
+    llm = build_model("ollama", os.getenv("LLM_MODEL") or "deepseek-r1:8b")
     print(f"✅ 语言模型已初始化: {getattr(llm, 'model', 'unknown')}")
-except Exception as e:
+    return llm
+  except Exception as e:
     print(f"初始化语言模型时出错: {e}")
-    llm = None
+    return None
 
 
 template = """You are a helpful travel agent.
@@ -55,36 +28,51 @@ Previous conversation:
 New question: {question}
 Response:"""
 
-prompt = PromptTemplate.from_template(template)
-
 # 2. 配置消息历史存储（按 session_id 隔离，方便并发对话）
-store = {}
-
+# 会话持久化在磁盘上（追加写的段文件 + SQLite 索引，热会话留在内存 LRU 中），重启后仍在；
+# 每轮只读取最近 CHAT_HISTORY_TURNS 轮 / CHAT_HISTORY_TOKENS 个 token 的窗口，见 common/chatstore.py。
+# CHAT_HISTORY=off 时退回进程内的 InMemoryChatMessageHistory。
 def get_history(session_id: str):
-  return store.setdefault(session_id, InMemoryChatMessageHistory())
+  from common.chatstore import get_session_history
+
+  return get_session_history(session_id)
 
 
 # 3. 构建链：格式化历史 -> 提示 -> LLM，由 RunnableWithMessageHistory 自动追加消息历史
-def _format_history(inputs: dict):
+def _format_history(inputs: dict, config: dict):
+  from common.chatstore import get_history_renderer
+
   msgs = inputs.get("history", []) or []
-  # 将 Message 对象列表压平成字符串，供 PromptTemplate 渲染
-  history_text = "\n".join(f"{m.type}: {m.content}" for m in msgs)
+  # 将 Message 对象列表压平成字符串，供 PromptTemplate 渲染。
+  # 按会话缓存上一轮的渲染结果，只为新增的消息生成文本；历史被清空或截断时整段重渲染。
+  session_id = (config.get("configurable") or {}).get("session_id", "")
+  history_text, _ = get_history_renderer().render(session_id, msgs)
   return {"question": inputs["question"], "history": history_text}
 
-base_chain = RunnableSequence(_format_history, prompt, llm)
 
-# RunnableWithMessageHistory 会在调用前后自动读写消息历史
-conversation = RunnableWithMessageHistory(
-  base_chain,
-  get_history,
-  input_messages_key="question",
-  history_messages_key="history",
-)
+@lru_cache(maxsize=None)
+def get_conversation():
+  """构建（并缓存）带消息历史的对话链。"""
+  from langchain_core.prompts import PromptTemplate
+  from langchain_core.runnables import RunnableSequence
+  from langchain_core.runnables.history import RunnableWithMessageHistory
+  from common.reasoning import text_parser  # 去掉 <think> 推理段，推理内容不写入消息历史
+
+  prompt = PromptTemplate.from_template(template)
+  base_chain = RunnableSequence(_format_history, prompt, get_llm(), text_parser())
+
+  # RunnableWithMessageHistory 会在调用前后自动读写消息历史
+  return RunnableWithMessageHistory(
+    base_chain,
+    get_history,
+    input_messages_key="question",
+    history_messages_key="history",
+  )
 
 
 # 4. 运行对话
 def ask(question: str, session_id: str = "demo-session"):
-  result = conversation.invoke(
+  result = get_conversation().invoke(
     {"question": question},
     config={"configurable": {"session_id": session_id}},
   )
@@ -92,6 +80,16 @@ def ask(question: str, session_id: str = "demo-session"):
   return result
 
 
-ask("I want to book a flight.")
-ask("My name is Sam, by theway.")
-ask("What was my name again?")
\ No newline at end of file
+if __name__ == "__main__":
+  import uuid
+
+  # 会话历史默认持久化到 .chat_history，每次运行用新的会话 id，避免读到上一次运行留下的对话
+  session_id = f"demo-{uuid.uuid4().hex[:8]}"
+  ask("I want to book a flight.", session_id)
+  ask("My name is Sam, by theway.", session_id)
+  ask("What was my name again?", session_id)
+
+  from common.chatstore import get_history_renderer
+
+  renderer = get_history_renderer()
+  print(f"\n--- 历史渲染缓存 ---\n当前历史约 {renderer.tokens(session_id)} tokens，{renderer.stats()}")
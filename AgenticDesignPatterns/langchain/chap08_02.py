@@ -1,41 +1,58 @@
-# 以下代码示例演示如何使用 InMemoryStore 来实现记忆的存储、获取和搜索操作。
-
-from langgraph.store.memory import InMemoryStore
-
-# 实际嵌入函数的占位符
-def embed(texts: list[str]) -> list[list[float]]:
-   # 在实际应用中，使用适当的嵌入模型
-   return [[1.0, 2.0] for _ in texts]
-
-# 初始化内存存储。对于生产环境，请使用基于数据库的存储方式。
-store = InMemoryStore(index={"embed": embed, "dims": 2})
-
-# 为特定用户和应用上下文定义命名空间
-user_id = "my-user"
-application_context = "chitchat"
-namespace = (user_id, application_context)
-
-# 1. 将记忆放入存储
-store.put(
-   namespace,
-   "a-memory",  # 此记忆的键
-   {
-       "rules": [
-           "User likes short, direct language",
-           "User only speaks English & python",
-       ],
-       "my-key": "my-value",
-   },
-)
-
-# 2. 通过其命名空间和键获取记忆
-item = store.get(namespace, "a-memory")
-print("Retrieved Item:", item)
-
-# 3. 在命名空间内搜索记忆，按内容过滤并按与查询的向量相似性排序。
-items = store.search(
-   namespace,
-   filter={"my-key": "my-value"},
-   query="language preferences"
-)
-print("Search Results:", items)
\ No newline at end of file
+# 以下代码示例演示如何使用记忆存储（LangGraph BaseStore）来实现记忆的存储、获取和搜索操作。
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def build_index() -> dict:
+   # 嵌入经共享的 EmbeddingService：按内容哈希缓存向量（默认保存在 .embed_cache），并发请求合成批次。
+   # 默认使用纯 CPU 的字符 n-gram 特征哈希；设置 EMBED_MODEL（如 nomic-embed-text）后改用 Ollama 的嵌入模型。
+   from common.embeddings import get_embedding_service
+
+   service = get_embedding_service()
+   return {"embed": service, "dims": len(service.embed_query("dims"))}
+
+
+def main():
+   # 延迟导入：导入本模块时不加载 numpy / langgraph
+   from common.vectorstore import VectorMemoryStore
+
+   # 初始化内存存储：按命名空间保存向量矩阵，嵌入按批调用并缓存。对于生产环境，请使用基于数据库的存储方式。
+   store = VectorMemoryStore(index=build_index())
+
+   # 为特定用户和应用上下文定义命名空间
+   user_id = "my-user"
+   application_context = "chitchat"
+   namespace = (user_id, application_context)
+
+   # 1. 将记忆放入存储
+   store.put(
+      namespace,
+      "a-memory",  # 此记忆的键
+      {
+          "rules": [
+              "User likes short, direct language",
+              "User only speaks English & python",
+          ],
+          "my-key": "my-value",
+      },
+   )
+
+   # 2. 通过其命名空间和键获取记忆
+   item = store.get(namespace, "a-memory")
+   print("Retrieved Item:", item)
+
+   # 3. 在命名空间内搜索记忆，按内容过滤并按与查询的向量相似性排序。
+   items = store.search(
+      namespace,
+      filter={"my-key": "my-value"},
+      query="language preferences"
+   )
+   print("Search Results:", items)
+   print("Store Stats:", store.stats())
+   print("Embedding Stats:", store.index_config["embed"].stats())
+
+
+if __name__ == "__main__":
+   main()
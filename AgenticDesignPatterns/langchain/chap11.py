@@ -14,47 +14,27 @@
 import os
 import random
 import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-
-def build_model(provider: str, model_name: Optional[str] = None):
-  """根据提供商构建聊天模型。
-
-  参数：
-  - provider: "openai" 或 "ollama"
-  - model_name: 可选模型名；不传则读取环境变量 LLM_MODEL；再不传使用合理默认值。
-
-  说明：采用“延迟导入”，避免未安装某些依赖时报 ImportError。
-  """
-  provider = provider.lower()
-
-  if provider == "openai":
-    # OpenAI 聊天模型（需要有效的 OpenAI API Key）
-    from langchain_openai import ChatOpenAI
-
-    name = model_name or os.getenv("LLM_MODEL") or "gpt-4o-mini"
-    return ChatOpenAI(model=name)
-
-  if provider == "ollama":
-    # 本地 Ollama 模型（例如 deepseek-r1:14b）。注意：该模型不支持 tools。
-    from langchain_ollama import ChatOllama
-
-    name = model_name or os.getenv("LLM_MODEL") or "deepseek-r1:14b"
-    return ChatOllama(model=name)
-
-  raise ValueError(
-    f"Unsupported provider: {provider}. Use 'openai' or 'ollama'."
-  )
-
-try:
-    # 需要一个具有函数/工具调用功能的模型。
-    llm = build_model("ollama")
-    print(f"✅ 语言模型已初始化: {getattr(llm, 'model', 'unknown')}")
-except Exception as e:
-    print(f"初始化语言模型时出错: {e}")
-    llm = None
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.models import build_model  # 共享的模型工厂：按模型缓存实例并复用连接池
+from common.codecheck import check_code, check_many, precheck_enabled  # 确定性的本地检查
+from common.reasoning import visible_text  # 去除 <think> 推理段后的回复文本
 
+# 模型在第一次调用时才创建，导入本模块不会加载 langchain 相关依赖。
+@lru_cache(maxsize=None)
+def get_llm():
+    try:
+        # 需要一个具有函数/工具调用功能的模型。
+        llm = build_model("ollama")
+        print(f"✅ 语言模型已初始化: {getattr(llm, 'model', 'unknown')}")
+        return llm
+    except Exception as e:
+        print(f"初始化语言模型时出错: {e}")
+        return None
 
 
 # --- 实用工具函数 ---
@@ -82,7 +62,45 @@ def generate_prompt(
     base_prompt += "\n请仅返回修订后的 Python 代码。不要在代码之外包含注释或解释。"
     return base_prompt
 
-def get_code_feedback(code: str, goals: list[str]) -> str:
+def execute_program(code: str, stdin: str = "", timeout: float | None = None):
+    """在预热沙箱池中以 __main__ 身份运行生成的程序，返回 RunResult（stdout / stderr / 返回码 / 耗时）。"""
+    from common.sandbox import get_sandbox_pool  # 首次执行时才启动工作进程
+
+    return get_sandbox_pool().run(code, stdin=stdin, timeout=timeout)
+
+def _format_execution(status: str, elapsed_ms: float, stdout: str, stderr: str, limit: int) -> str:
+    lines = [f"状态：{status}，耗时 {elapsed_ms:.0f} ms"]
+    if stdout.strip():
+        lines.append("标准输出：\n" + stdout.strip()[-limit:])
+    if stderr.strip():
+        lines.append("异常 / 标准错误：\n" + stderr.strip()[-limit:])
+    return "\n".join(lines)
+
+def describe_execution(run, limit: int = 1500) -> str:
+    """把运行结果整理成审查员可读的文本；输出过长时只保留末尾。"""
+    if run.timed_out:
+        status = "超时被终止"
+    elif run.returncode == 0:
+        status = "正常退出"
+    else:
+        status = f"异常退出（返回码 {run.returncode}）"
+    return _format_execution(status, run.elapsed_ms, run.stdout, run.stderr, limit)
+
+def describe_check(check, limit: int = 1500) -> str:
+    """同 describe_execution，但取自本地检查（check_code）那次运行的结果，不再重新执行程序。
+
+    经过本地检查关卡时结论不确定：程序没有报错，或因等待输入 / 命令行参数提前结束；
+    传入失败的检查时按记录的异常描述为运行出错。
+    """
+    if check.failed:
+        status, errors = "运行出错", check.feedback()
+    elif check.interrupted:
+        status, errors = "等待输入或命令行参数时提前结束", check.interrupted
+    else:
+        status, errors = "正常退出", ""
+    return _format_execution(status, check.elapsed_ms, check.output, errors, limit)
+
+def get_code_feedback(code: str, goals: list[str], execution: str = "") -> str:
     print("根据目标评估代码...")
     feedback_prompt = f"""
 你是一名 Python 代码审查员。下面显示了一个代码片段。基于以下目标：
@@ -94,7 +112,9 @@ def get_code_feedback(code: str, goals: list[str]) -> str:
 代码：
 {code}
 """
-    return llm.invoke(feedback_prompt)
+    if execution:
+        feedback_prompt += f"\n在沙箱中实际运行这段代码的结果（请结合实际输出判断正确性）：\n{execution}\n"
+    return get_llm().invoke(feedback_prompt)
 
 def goals_met(feedback_text: str, goals: list[str]) -> bool:
     """
@@ -115,7 +135,7 @@ def goals_met(feedback_text: str, goals: list[str]) -> bool:
 根据上面的反馈，目标是否已满足？
 只用一个词回答：True 或 False。
 """
-    response = llm.invoke(review_prompt).content.strip().lower()
+    response = visible_text(get_llm().invoke(review_prompt)).strip().lower()
     return response == "true"
 
 def clean_code_block(code: str) -> str:
@@ -141,7 +161,7 @@ def save_code_to_file(code: str, use_case: str) -> str:
         f"将以下用例总结成一个单独的小写单词或短语，"
         f"不超过10个字符，适合用作Python文件名：\n\n{use_case}"
     )
-    raw_summary = llm.invoke(summary_prompt).content.strip()
+    raw_summary = visible_text(get_llm().invoke(summary_prompt)).strip()
     short_name = re.sub(r"[^a-zA-Z0-9_]", "", raw_summary.replace(" ", "_").lower())[:10]
 
     random_suffix = str(random.randint(1000, 9999))
@@ -154,10 +174,59 @@ def save_code_to_file(code: str, use_case: str) -> str:
     print(f"代码已保存到：{filepath}")
     return str(filepath)
 
+# --- 多候选生成（best-of-N） ---
+
+def candidate_temperatures(n: int, low: float = 0.2, high: float = 1.0) -> list[float]:
+    """在 [low, high] 上均匀取 n 个温度：低温稳妥，高温多样。"""
+    if n <= 1:
+        return [low]
+    step = (high - low) / (n - 1)
+    return [round(low + i * step, 2) for i in range(n)]
+
+def _generate_candidate(prompt: str, temperature: float) -> str:
+    # build_model 按温度缓存实例，所有实例共用同一个连接池
+    response = build_model("ollama", temperature=temperature).invoke(prompt)
+    return clean_code_block(visible_text(response).strip())
+
+def _candidate_score(code: str, check) -> tuple:
+    """本地打分（越大越好）：检查结论 > 测试通过率 > 静态检查问题数 > 代码长度。"""
+    status_rank = {"passed": 2, "inconclusive": 1}.get(check.status, -1 if check.syntax_error else 0)
+    pass_rate = (check.tests_run - check.tests_failed) / check.tests_run if check.tests_run else 0.0
+    return (status_rank, pass_rate, -len(check.lint), -len(code))
+
+def generate_best_candidate(prompt: str, n: int):
+    """并发生成 n 个候选（不同温度），本地检查打分后返回 (最佳代码, 其检查结果)。
+
+    墙钟时间约等于最慢的一次生成 + 一轮并行检查，需要模型服务有多个并行槽位才能发挥作用。
+    """
+    temperatures = candidate_temperatures(n)
+    print(f"正在并发生成 {n} 个候选，温度: {temperatures}")
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        futures = [pool.submit(_generate_candidate, prompt, t) for t in temperatures]
+    codes, used = [], []
+    for t, future in zip(temperatures, futures):
+        try:
+            codes.append(future.result())
+            used.append(t)
+        except Exception as e:
+            print(f"温度 {t} 的候选生成失败: {e}")
+    if not codes:
+        raise RuntimeError("所有候选生成均失败")
+
+    checks = check_many(codes)
+    ranked = sorted(zip(codes, checks, used), key=lambda c: _candidate_score(c[0], c[1]), reverse=True)
+    for rank, (code, check, t) in enumerate(ranked, 1):
+        print(f"  候选 #{rank}（温度 {t}）：{check.summary()}，{len(code)} 字符")
+    best_code, best_check, _ = ranked[0]
+    return best_code, best_check
+
 # --- 主要代理函数 ---
 
-def run_code_agent(use_case: str, goals_input: str, max_iterations: int = 5) -> str:
+def run_code_agent(use_case: str, goals_input: str, max_iterations: int = 5, candidates: int | None = None) -> str:
+    """candidates > 1 时每轮并发生成多个候选，只审查本地得分最高的一个（默认取 CODE_CANDIDATES，缺省为 1）。"""
     goals = [g.strip() for g in goals_input.split(",")]
+    if candidates is None:
+        candidates = int(os.getenv("CODE_CANDIDATES", "1"))
 
     print(f"\n用例：{use_case}")
     print("目标：")
@@ -169,18 +238,44 @@ def run_code_agent(use_case: str, goals_input: str, max_iterations: int = 5) ->
 
     for i in range(max_iterations):
         print(f"\n=== ☑ 迭代 {i + 1} of {max_iterations} ===")
-        prompt = generate_prompt(use_case, goals, previous_code,
-                                 feedback if isinstance(feedback, str) else feedback.content)
+        prompt = generate_prompt(use_case, goals, previous_code, feedback)
 
         print("正在生成代码...")
-        code_response = llm.invoke(prompt)
-        raw_code = code_response.content.strip()
-        code = clean_code_block(raw_code)
+        check = None
+        if candidates > 1:
+            code, check = generate_best_candidate(prompt, candidates)
+        else:
+            code_response = get_llm().invoke(prompt)
+            raw_code = visible_text(code_response).strip()
+            code = clean_code_block(raw_code)
         print("\n 生成的代码：\n" + "-" * 50 + f"\n{code}\n" + "-" * 50)
 
+        # 先做本地检查：结论确定时跳过模型审查（get_code_feedback）与目标判断（goals_met）两次调用
+        if precheck_enabled():
+            check = check or check_code(code)
+            print(f"\n本地检查：{check.summary()}")
+            if check.passed:
+                print("☑ 本地检查全部通过（含测试）。停止迭代。")
+                break
+            if check.failed:
+                feedback = check.feedback()
+                print("\n本地检查发现的问题：\n" + "-" * 50 + f"\n{feedback}\n" + "-" * 50)
+                print("目标未完全满足。准备下一次迭代...")
+                previous_code = code
+                continue
+
+        # 把实际运行的输出、异常与耗时交给审查员，而不是只让模型“读”代码；
+        # 经过本地检查关卡（结论不确定、未失败）时直接复用那次沙箱运行的结果；
+        # PRECHECK=off 时（即使多候选打分时做过检查）单独执行，失败的运行不会被描述成正常退出
+        if precheck_enabled() and check is not None and not check.failed:
+            execution = describe_check(check)
+        else:
+            execution = describe_execution(execute_program(code))
+        print("\n沙箱运行结果：\n" + "-" * 50 + f"\n{execution}\n" + "-" * 50)
+
         print("\n提交代码进行反馈审查...")
-        feedback = get_code_feedback(code, goals)
-        feedback_text = feedback.content.strip()
+        # 只保留审查结论本身，推理段不进入下一轮生成提示
+        feedback_text = feedback = visible_text(get_code_feedback(code, goals, execution)).strip()
         print("\n收到的反馈：\n" + "-" * 50 + f"\n{feedback_text}\n" + "-" * 50)
 
         if goals_met(feedback_text, goals):
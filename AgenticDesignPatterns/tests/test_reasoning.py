@@ -0,0 +1,27 @@
+"""common/reasoning.py 的 text_parser：空回复与只有推理段的回复应与 StrOutputParser 一样得到 ""。"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+pytest.importorskip("langchain_core")
+from langchain_core.messages import AIMessage  # noqa: E402
+
+from common.reasoning import text_parser  # noqa: E402
+
+
+@pytest.mark.parametrize("content", ["", "<think>只有推理，没有回答</think>"])
+def test_text_parser_returns_empty_string(content, monkeypatch):
+    monkeypatch.delenv("LLM_THINK", raising=False)
+    parser = text_parser()
+    message = AIMessage(content=content)
+    assert parser.invoke(message) == ""
+    assert asyncio.run(parser.ainvoke(message)) == ""
+
+
+def test_text_parser_strips_reasoning(monkeypatch):
+    monkeypatch.delenv("LLM_THINK", raising=False)
+    assert text_parser().invoke(AIMessage(content="<think>想一想</think>答案")) == "答案"
@@ -1,11 +1,19 @@
+import sys
+from pathlib import Path
+
 from langchain_community.llms import Ollama
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableParallel
 from langchain_core.output_parsers import StrOutputParser
 
+# 复用 AgenticDesignPatterns/common 中的并发限制（全局上限 + 每模型 AIMD 自适应上限）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "AgenticDesignPatterns"))
+from common.limiter import get_limits
+
 
 # 多任务并执行
-model = Ollama(model="deepseek-r1:8b", temperature=0.5)
+# 三个分支共享同一个模型的并发名额，避免同时打满本地 Ollama
+model = get_limits().wrap(Ollama(model="deepseek-r1:8b", temperature=0.5))
 
 
 prompt1 = ChatPromptTemplate.from_template("请解释机器学习的基本概念。")
@@ -25,4 +33,6 @@ parallel_tasks = RunnableParallel({
 results = parallel_tasks.invoke({})
 
 for task, result in results.items():
-    print(f"{task}结果: {result}")
\ No newline at end of file
+    print(f"{task}结果: {result}")
+
+print(f"并发限制统计: {get_limits().stats()}")
\ No newline at end of file